@@ -72,6 +72,7 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "django.middleware.common.CommonMiddleware",
+    "dispotify.idempotency.IdempotencyMiddleware",
 ]
 
 CORS_ALLOW_ALL_ORIGINS = True
@@ -97,8 +98,20 @@ CORS_ALLOW_HEADERS = [
     "x-csrftoken",
     "x-requested-with",
     "Access-Control-Allow-Origin",
+    "x-song-id",
+    "x-song-title",
+    "x-song-album",
+    "x-song-artists",
+    "x-content-sha256",
+    "prefer",
+    "idempotency-key",
+    "if-none-match",
 ]
 
+# El frontend pagina los listados siguiendo la cabecera Link, y revalida las
+# respuestas con su ETag
+CORS_EXPOSE_HEADERS = ["link", "etag"]
+
 # Si necesitas permitir el envío de cookies
 CORS_ALLOW_CREDENTIALS = True
 
@@ -127,10 +140,27 @@ WSGI_APPLICATION = "backend.wsgi.application"
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
 
+# WAL deja leer mientras se replica una escritura; las transacciones toman el
+# lock de escritura al empezar (IMMEDIATE) para esperar el busy_timeout en vez
+# de fallar con "database is locked" al promover un lock de lectura.
+SQLITE_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",  # Con WAL solo se arriesga la ultima transaccion
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-32000",  # 32MB
+    "PRAGMA mmap_size=268435456",  # 256MB
+    "PRAGMA temp_store=MEMORY",
+]
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": "/app/data/db/db.sqlite3",
+        "OPTIONS": {
+            "init_command": ";".join(SQLITE_PRAGMAS),
+            "transaction_mode": "IMMEDIATE",
+            "timeout": 5,
+        },
     }
 }
 
@@ -26,6 +26,12 @@ def start_chord_node():
     node_id = get_hash(f"{ip_address}:{port}")
 
     node = ChordNode(ip_address, port, node_id, is_debug=False)
+
+    from dispotify.hints import hint_queue
+    from dispotify.rebalance import catalog_rebalancer
+
+    hint_queue.watch(node)
+    catalog_rebalancer.watch(node)
     async_to_sync(node.discover_join_start)()
 
 
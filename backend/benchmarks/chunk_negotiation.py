@@ -0,0 +1,51 @@
+"""
+Requests per minute of playback with the fixed 32kB x 10 chunking used before
+size negotiation, and with the chunking the server now suggests per bitrate.
+
+Run from the backend directory: python benchmarks/chunk_negotiation.py
+"""
+
+import os
+import sys
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from dispotify.serializers import CHUNK_SIZE, suggest_chunking  # noqa: E402
+
+LEGACY_CHUNK_COUNT = 10
+BITRATES = [96_000, 128_000, 192_000, 256_000, 320_000]
+
+
+def requests_per_minute(bitrate: int, chunk_size: int, chunk_count: int) -> float:
+    bytes_per_minute = bitrate / 8 * 60
+    return bytes_per_minute / (chunk_size * chunk_count)
+
+
+def main() -> None:
+    print(
+        f"{'bitrate':>9} | {'legacy chunk':>12} {'req/min':>8} | "
+        f"{'negotiated chunk':>16} {'batch':>5} {'req/min':>8} | {'reduction':>9}"
+    )
+
+    for bitrate in BITRATES:
+        legacy = requests_per_minute(bitrate, CHUNK_SIZE, LEGACY_CHUNK_COUNT)
+
+        chunk_size, chunk_count = suggest_chunking(bitrate)
+        negotiated = requests_per_minute(bitrate, chunk_size, chunk_count)
+
+        print(
+            f"{bitrate // 1000:>5}kbps | {CHUNK_SIZE // 1024:>10}kB {legacy:>8.2f} | "
+            f"{chunk_size // 1024:>14}kB {chunk_count:>5} {negotiated:>8.2f} | "
+            f"{legacy / negotiated:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Latency of listing songs at 10^5 rows: the whole table serialized at once,
+as `list` did before pagination, and pages of the cursor pagination, first
+and deep into the list, through the song list view on a one-node ring.
+
+Uses a temporary database. The whole table takes a few minutes. Run from the
+backend directory: python benchmarks/list_pagination.py
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import tempfile
+import statistics
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+from django.conf import settings  # noqa: E402
+
+settings.DATABASES["default"]["NAME"] = os.path.join(
+    tempfile.mkdtemp(), "db.sqlite3"
+)
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.management import call_command  # noqa: E402
+from django.test import Client  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from chord.chord import ChordNode  # noqa: E402
+from dispotify.models import Album, Artist, Song  # noqa: E402
+from dispotify.projection import refresh_song_listings  # noqa: E402
+from dispotify.serializers import SongSerializer  # noqa: E402
+
+SONGS = 100_000
+ALBUMS = 10_000
+ARTISTS = 1_000
+PAGE_SIZE = 100
+RUNS = 20
+
+
+def populate() -> None:
+    random.seed(0)
+
+    Artist.objects.bulk_create(
+        [Artist(id=f"ar{i}", name=f"Artist {i}") for i in range(ARTISTS)]
+    )
+    Album.objects.bulk_create(
+        [
+            Album(
+                id=f"al{i}",
+                name=f"Album {i}",
+                date="2020-01-01",
+                author_id=f"ar{i % ARTISTS}",
+            )
+            for i in range(ALBUMS)
+        ]
+    )
+    Song.objects.bulk_create(
+        [
+            Song(
+                id=f"{i:08x}",
+                title=f"Song {random.randrange(SONGS)}",
+                album_id=f"al{i % ALBUMS}",
+                duration_seconds=180,
+                bitrate=128_000,
+                extension="mp3",
+            )
+            for i in range(SONGS)
+        ],
+        batch_size=5_000,
+    )
+    SongArtist = Song.artist.through
+    SongArtist.objects.bulk_create(
+        [
+            SongArtist(song_id=f"{i:08x}", artist_id=f"ar{i % ARTISTS}")
+            for i in range(SONGS)
+        ],
+        batch_size=5_000,
+    )
+
+    # Bulk writes skip the listings' signals
+    for start in range(0, SONGS, 5_000):
+        refresh_song_listings([f"{i:08x}" for i in range(start, start + 5_000)])
+
+
+def timed(func, runs: int = RUNS) -> tuple[float, float]:
+    samples = []
+
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    return statistics.median(samples), max(samples)
+
+
+def whole_table() -> bytes:
+    queryset = Song.objects.order_by("-title")
+    return JSONRenderer().render(SongSerializer(queryset, many=True).data)
+
+
+def next_url(response) -> str:
+    return re.match(r"<([^>]+)>", response["Link"]).group(1)  # type: ignore
+
+
+def main() -> None:
+    call_command("migrate", verbosity=0)
+    populate()
+
+    ChordNode()
+    client = Client(HTTP_HOST="localhost")
+
+    start = time.perf_counter()
+    body = whole_table()
+    elapsed = (time.perf_counter() - start) * 1000
+    print(
+        f"whole table ({SONGS} songs): {elapsed:>9.1f}ms, "
+        f"{len(body) / (1 << 20):.1f}MB per response"
+    )
+
+    first_url = f"/api/songs/?limit={PAGE_SIZE}"
+    first = client.get(first_url)
+    print(f"page of {PAGE_SIZE}: {len(first.content) / 1024:.1f}kB per response")
+
+    median, worst = timed(lambda: client.get(first_url))
+    print(f"{'first page:':<20} median {median:>7.1f}ms, max {worst:>7.1f}ms")
+
+    # Halfway through the list, following the cursors
+    url = first_url
+    for _ in range(SONGS // PAGE_SIZE // 2):
+        url = next_url(client.get(url))
+
+    median, worst = timed(lambda: client.get(url))
+    page = f"page {SONGS // PAGE_SIZE // 2}:"
+    print(f"{page:<20} median {median:>7.1f}ms, max {worst:>7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
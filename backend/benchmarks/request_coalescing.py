@@ -0,0 +1,107 @@
+"""
+Bursts of identical concurrent stream requests, as listeners of a popular
+track send them, without and with request coalescing: how many of them are
+served upstream (chunks read and encoded) and how long the burst takes.
+
+Uses a temporary audio directory on a one-node ring. Run from the backend
+directory: python benchmarks/request_coalescing.py
+"""
+
+import os
+import sys
+import time
+import tempfile
+import threading
+import statistics
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.test import Client  # noqa: E402
+
+from chord.chord import ChordNode  # noqa: E402
+from dispotify import decorators, http_cache, serializers  # noqa: E402
+from dispotify.chunk_cache import READAHEAD_CHUNKS  # noqa: E402
+from dispotify.singleflight import request_flights  # noqa: E402
+
+AUDIO_SIZE = 160 << 20  # 160MB, enough for every burst to read new chunks
+CHUNK_COUNT = 64  # 2MB per request with the default 32kB chunks
+LISTENERS = [1, 8, 32]
+BURSTS = 10
+
+
+class NoCoalescing:
+    def share(self, key, fetch):
+        return fetch()
+
+
+def burst(client: Client, listeners: int, chunk_index: int) -> float:
+    url = (
+        f"/api/streamer/?audio_id=popular&chunk_index={chunk_index}"
+        f"&chunk_count={CHUNK_COUNT}"
+    )
+    ready = threading.Barrier(listeners)
+
+    def listen(client_id: int) -> None:
+        ready.wait()  # All at once
+        client.get(f"{url}&client_id={client_id}")
+
+    threads = [threading.Thread(target=listen, args=(i,)) for i in range(listeners)]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return (time.perf_counter() - start) * 1000
+
+
+def main() -> None:
+    audios = tempfile.mkdtemp()
+    with open(f"{audios}/popular", "wb") as f:
+        f.write(os.urandom(AUDIO_SIZE))
+
+    serializers.AUDIOS_PATH = http_cache.AUDIOS_PATH = audios
+
+    served = []
+    handle_request = serializers.AudioStreamerSerializer.handle_request
+
+    def counted(self, data):
+        served.append(1)
+        return handle_request(self, data)
+
+    serializers.AudioStreamerSerializer.handle_request = counted  # type: ignore
+
+    ChordNode()
+    client = Client(HTTP_HOST="localhost")
+    burst(client, 1, 0)  # Warm up
+    chunk_index = CHUNK_COUNT + READAHEAD_CHUNKS
+
+    print(f"{'listeners':>9} | {'coalescing':>10} | {'served':>6} | {'burst':>8}")
+
+    for listeners in LISTENERS:
+        for label, flights in [("off", NoCoalescing()), ("on", request_flights)]:
+            decorators.request_flights = flights  # type: ignore
+            served.clear()
+            samples = []
+
+            for _ in range(BURSTS):
+                # Chunks no burst read (or warmed) before, so they come from disk
+                samples.append(burst(client, listeners, chunk_index))
+                chunk_index += CHUNK_COUNT + READAHEAD_CHUNKS
+
+            print(
+                f"{listeners:>9} | {label:>10} | {len(served) / BURSTS:>6.1f} | "
+                f"{statistics.median(samples):>6.1f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
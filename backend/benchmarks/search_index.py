@@ -0,0 +1,123 @@
+"""
+Latency of a song search page (100 rows) with the former `title__icontains`
+scan and with the FTS5 index, at 10^5 and 10^6 songs. The index is timed
+ranking the matches (the default order of a search) and sorting them by
+title (`?ordering=-title`).
+
+Uses a temporary database. Run from the backend directory:
+python benchmarks/search_index.py
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+import statistics
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+from django.conf import settings  # noqa: E402
+
+settings.DATABASES["default"]["NAME"] = os.path.join(
+    tempfile.mkdtemp(), "db.sqlite3"
+)
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.management import call_command  # noqa: E402
+
+from dispotify.models import Song  # noqa: E402
+from dispotify.search import SEARCH_RANK, search  # noqa: E402
+
+SIZES = [100_000, 1_000_000]
+PAGE_SIZE = 100
+RUNS = 10
+
+VOCABULARY = [
+    f"{syllable}{i}"
+    for syllable in ("la", "lo", "ma", "me", "so")
+    for i in range(2_000)
+]
+
+# (label, text): a frequent prefix, a full word, two words and no match
+QUERIES = [
+    ("prefix", "lo1"),
+    ("word", "me1234"),
+    ("two words", "la7 so19"),
+    ("no match", "zzz"),
+]
+
+
+def populate(start: int, end: int) -> None:
+    random.seed(start)
+
+    for batch_start in range(start, end, 50_000):
+        Song.objects.bulk_create(
+            [
+                Song(
+                    id=f"{i:08x}",
+                    title=" ".join(random.sample(VOCABULARY, 3)),
+                    duration_seconds=180,
+                    bitrate=128_000,
+                    extension="mp3",
+                )
+                for i in range(batch_start, min(batch_start + 50_000, end))
+            ]
+        )
+
+
+def timed(func) -> float:
+    samples = []
+
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    return statistics.median(samples)
+
+
+def icontains_page(text: str) -> list:
+    queryset = Song.objects.filter(title__icontains=text).order_by("-title", "id")
+    return list(queryset[:PAGE_SIZE])
+
+
+def search_page(text: str, ordering: str = SEARCH_RANK) -> list:
+    queryset = search(Song.objects.all(), text).order_by(ordering, "id")
+    return list(queryset[:PAGE_SIZE])
+
+
+def main() -> None:
+    call_command("migrate", verbosity=0)
+
+    stored = 0
+
+    for size in SIZES:
+        populate(stored, size)
+        stored = size
+
+        print(f"{size} songs")
+        print(
+            f"{'query':>12} | {'icontains':>10} | {'fts5 rank':>10} {'speedup':>7} | "
+            f"{'fts5 title':>10} {'speedup':>7}"
+        )
+
+        for label, text in QUERIES:
+            scan = timed(lambda: icontains_page(text))
+            ranked = timed(lambda: search_page(text))
+            by_title = timed(lambda: search_page(text, "-title"))
+            print(
+                f"{label:>12} | {scan:>8.1f}ms | "
+                f"{ranked:>8.1f}ms {scan / ranked:>6.1f}x | "
+                f"{by_title:>8.1f}ms {scan / by_title:>6.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
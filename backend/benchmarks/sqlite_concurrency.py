@@ -0,0 +1,168 @@
+"""
+Reads and writes of the catalog at the same time, with SQLite as configured
+before (rollback journal, deferred transactions) and with the profile of
+`settings.DATABASES` (WAL, pragmas, immediate transactions). Both open a
+connection per request, as the development server closes them after each one.
+
+Reader threads fetch pages of songs while writer threads apply catalog
+batches, as replicas do. Each operation opens and closes its "request" the
+way Django does between requests. Reports throughput, read latency and the
+operations failing with "database is locked".
+
+Uses a temporary database per profile, each run in its own process. Run from
+the backend directory: python benchmarks/sqlite_concurrency.py
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+import threading
+import statistics
+import subprocess
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+PROFILES = ["baseline", "tuned"]
+
+SONGS = 20_000
+PAGE_SIZE = 100
+BATCH_SIZE = 50
+READERS = 8
+WRITERS = 2
+DURATION = 10  # seconds
+
+
+def configure(profile: str) -> None:
+    from django.conf import settings
+
+    database = settings.DATABASES["default"]
+    database["NAME"] = os.path.join(tempfile.mkdtemp(), "db.sqlite3")
+
+    if profile == "baseline":
+        database["OPTIONS"] = {}
+
+
+def song_batch(start: int, count: int) -> dict:
+    return {
+        "artists": [{"id": f"ar{start}", "name": f"Artist {start}"}],
+        "songs": [
+            {
+                "id": f"{i:08x}",
+                "title": f"Song {random.randrange(SONGS)}",
+                "artist": [f"ar{start}"],
+                "duration_seconds": 180,
+                "bitrate": 128_000,
+            }
+            for i in range(start, start + count)
+        ],
+    }
+
+
+def run(profile: str) -> None:
+    configure(profile)
+
+    import django
+
+    django.setup()
+
+    from django.core.management import call_command
+    from django.db import OperationalError, close_old_connections, connection
+
+    from dispotify.catalog import apply_catalog_batch
+    from dispotify.models import Song
+
+    call_command("migrate", verbosity=0)
+
+    random.seed(0)
+    for start in range(0, SONGS, 1_000):
+        apply_catalog_batch(song_batch(start, 1_000))
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    read_latencies: list[float] = []
+    counts = {"reads": 0, "writes": 0, "read errors": 0, "write errors": 0}
+
+    def request(func, kind: str) -> None:
+        close_old_connections()  # request_started
+        start = time.perf_counter()
+        try:
+            func()
+        except OperationalError:
+            with lock:
+                counts[f"{kind} errors"] += 1
+        else:
+            with lock:
+                counts[f"{kind}s"] += 1
+                if kind == "read":
+                    read_latencies.append((time.perf_counter() - start) * 1000)
+        finally:
+            close_old_connections()  # request_finished
+
+    def reader() -> None:
+        while not stop.is_set():
+            title = f"Song {random.randrange(SONGS)}"
+            request(
+                lambda: list(
+                    Song.objects.select_related("listing")
+                    .filter(title__lt=title)
+                    .order_by("-title", "id")[:PAGE_SIZE]
+                ),
+                "read",
+            )
+        connection.close()
+
+    def writer(index: int) -> None:
+        start = SONGS + index * 1_000_000
+        while not stop.is_set():
+            request(lambda: apply_catalog_batch(song_batch(start, BATCH_SIZE)), "write")
+            start += BATCH_SIZE
+        connection.close()
+
+    threads = [threading.Thread(target=reader) for _ in range(READERS)] + [
+        threading.Thread(target=writer, args=(i,)) for i in range(WRITERS)
+    ]
+    for thread in threads:
+        thread.start()
+
+    time.sleep(DURATION)
+    stop.set()
+
+    for thread in threads:
+        thread.join()
+
+    read_latencies.sort()
+    p99 = read_latencies[int(len(read_latencies) * 0.99)] if read_latencies else 0
+
+    print(
+        f"{profile:>8} | {counts['reads'] / DURATION:>7.0f} | "
+        f"{statistics.median(read_latencies or [0]):>6.1f}ms {p99:>7.1f}ms | "
+        f"{counts['writes'] * BATCH_SIZE / DURATION:>8.0f} | "
+        f"{counts['read errors']:>6} {counts['write errors']:>6}"
+    )
+
+
+def main() -> None:
+    print(
+        f"{READERS} readers, {WRITERS} writers of {BATCH_SIZE} songs, "
+        f"{DURATION}s on {SONGS} songs"
+    )
+    print(
+        f"{'profile':>8} | {'reads/s':>7} | {'median':>8} {'p99':>9} | "
+        f"{'songs/s':>8} | {'locked (read, write)':>13}"
+    )
+    sys.stdout.flush()
+
+    for profile in PROFILES:
+        subprocess.run([sys.executable, __file__, profile], check=True)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        run(sys.argv[1])
+    else:
+        main()
@@ -0,0 +1,124 @@
+"""
+Peak RSS of the server-side work for a 50MB song upload, through the JSON
+`file_base64` path and through the streaming upload path.
+
+Every step runs in its own process so that the peaks do not mix. On Linux
+the RSS high-water mark survives exec, so the parent never holds the file.
+Run from the backend directory: python benchmarks/upload_memory.py
+"""
+
+import io
+import os
+import sys
+import json
+import base64
+import hashlib
+import resource
+import subprocess
+import tempfile
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from mutagen.mp3 import MP3  # noqa: E402
+
+from dispotify.uploads import spool_upload  # noqa: E402
+
+UPLOAD_SIZE = 50 << 20  # 50MB
+
+# MPEG-1 Layer III, 128kbps, 44.1kHz frame: 4 bytes of header and 413 of payload
+MP3_FRAME = bytes([0xFF, 0xFB, 0x90, 0x64]) + b"\x00" * 413
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def base64_path(body_path: str, out_dir: str) -> None:
+    # What chord_distribute and SongSerializer.create do with a JSON upload
+    with open(body_path, "rb") as body_file:
+        body = body_file.read()  # request.body
+
+    req_body = body.decode()
+    hashlib.sha256(req_body.encode("utf-8")).hexdigest()
+    json_body = json.loads(req_body)
+    req_body = json.dumps(json_body)
+    json_body = json.loads(req_body)  # request.data in the view
+
+    data = base64.b64decode(json_body["file_base64"])
+    MP3(io.BytesIO(data))
+
+    with open(os.path.join(out_dir, "song"), "wb") as f:
+        f.write(data)
+
+
+def stream_path(audio_path: str, out_dir: str) -> None:
+    with open(audio_path, "rb") as stream:
+        upload = spool_upload(stream, os.path.getsize(audio_path), out_dir)
+
+    MP3(upload.path)
+    os.replace(upload.path, os.path.join(out_dir, "song"))
+
+
+def run_child(mode: str, source: str) -> None:
+    baseline = peak_rss_mb()
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        if mode == "base64":
+            base64_path(source, out_dir)
+        else:
+            stream_path(source, out_dir)
+
+    print(f"{baseline:.1f} {peak_rss_mb():.1f}")
+
+
+def prepare(audio_path: str, body_path: str) -> None:
+    with open(audio_path, "wb") as audio_file:
+        for _ in range(UPLOAD_SIZE // len(MP3_FRAME)):
+            audio_file.write(MP3_FRAME)
+
+    with open(audio_path, "rb") as audio_file:
+        body = json.dumps(
+            {
+                "title": "Benchmark",
+                "artist": ["benchmark"],
+                "file_base64": base64.b64encode(audio_file.read()).decode(),
+            }
+        )
+
+    with open(body_path, "w") as body_file:
+        body_file.write(body)
+
+
+def run(*args: str) -> str:
+    return subprocess.run(
+        [sys.executable, __file__, *args], capture_output=True, text=True, check=True
+    ).stdout
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as work_dir:
+        audio_path = os.path.join(work_dir, "song.mp3")
+        body_path = os.path.join(work_dir, "body.json")
+
+        run("prepare", audio_path, body_path)
+
+        size_mb = os.path.getsize(audio_path) / (1 << 20)
+        print(f"Upload of {size_mb:.0f}MB")
+
+        for mode, source in (("base64", body_path), ("stream", audio_path)):
+            baseline, peak = map(float, run(mode, source).split())
+            print(
+                f"  {mode:>6}: peak RSS {peak:7.1f}MB "
+                f"({peak - baseline:+7.1f}MB over the process baseline)"
+            )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "prepare":
+        prepare(sys.argv[2], sys.argv[3])
+    elif len(sys.argv) == 3:
+        run_child(sys.argv[1], sys.argv[2])
+    else:
+        main()
@@ -9,7 +9,7 @@ import struct
 import time
 import os
 from uuid import uuid4
-from typing import List, Optional
+from typing import Callable, List, Optional
 from pydantic import BaseModel
 
 
@@ -33,6 +33,16 @@ from chord.chord_messages import (
 
 PING_INTERVAL = 3  # seconds
 
+FILE_REPLICATION_FACTOR = 3  # Nodes holding a copy of each audio file
+# The catalog is partitioned by row id, each row lives on this many nodes
+METADATA_REPLICATION_FACTOR = 3
+
+# Catalog replicas that must answer a read / acknowledge a write. Reads are
+# strongly consistent when R + W exceeds the replication factor; otherwise
+# read repair brings the replicas that answered stale rows up to date.
+METADATA_READ_QUORUM = 2
+METADATA_WRITE_QUORUM = None  # Only the primary, the rest replicate behind
+
 MULTICAST_PORT = 2222
 
 UPDATE_FTABLE_REQUEST = "UPDATE_FTABLE_REQUEST"
@@ -147,7 +157,6 @@ class ChordNode:
         id_bitlen: int = 32,
         is_debug: bool = False,
         file_path: str = "/app/data/audios",  # Assume here all filenames are the id's
-        database_path: str = "/app/data/db/db.sqlite3",
     ) -> None:
         if not hasattr(self, "initialized"):
             self.ip_address = ip_address
@@ -168,7 +177,14 @@ class ChordNode:
             self.must_update_ftables = False
 
             self.file_path = file_path
-            self.database_path = database_path
+
+            # Called with every node answering a ping, from the event loop, so
+            # they must not block. `watched_nodes` are pinged on every
+            # stabilization round even if they are not our successor.
+            self.ping_listeners: List[Callable[[ChordNodeReference], None]] = []
+            self.watched_nodes: dict[int, ChordNodeReference] = {}
+            # Called after every stabilization round, also from the event loop.
+            self.stabilize_listeners: List[Callable[[], None]] = []
 
             self.initialized = True
 
@@ -282,6 +298,10 @@ class ChordNode:
                     self.logger.debug("Checking for file backups...")
                     await self.backup_files()
 
+            await self.ping_watched_nodes()
+
+            self.notify_stabilize_listeners()
+
     async def backup_files(self):
         try:
             for file in os.listdir(self.file_path):
@@ -293,7 +313,9 @@ class ChordNode:
 
                 file_succ = await self.find_successor(file_node_id)
 
-                replicants = await self.get_replicants(3, file_succ)
+                replicants = await self.get_replicants(
+                    FILE_REPLICATION_FACTOR, file_succ
+                )
 
                 keep_file_flag = False
 
@@ -867,12 +889,34 @@ class ChordNode:
                     response.content.pred_node_id,
                 )
 
+                self.notify_ping_listeners(node)
+
                 return predecessor, succesor
         except Exception:
             return None
 
         return None
 
+    def notify_ping_listeners(self, node: ChordNodeReference) -> None:
+        for listener in self.ping_listeners:
+            try:
+                listener(node)
+            except Exception as e:
+                self.logger.error(f"Ping listener failed: {e}")
+
+    def notify_stabilize_listeners(self) -> None:
+        for listener in self.stabilize_listeners:
+            try:
+                listener()
+            except Exception as e:
+                self.logger.error(f"Stabilize listener failed: {e}")
+
+    async def ping_watched_nodes(self) -> None:
+        # At once, so unreachable nodes cost one ping timeout per round in total
+        await asyncio.gather(
+            *(self.ping_node(node) for node in list(self.watched_nodes.values()))
+        )
+
     async def get_replicants(
         self, k: int, start: ChordNodeReference | None = None
     ) -> List[ChordNodeReference]:
@@ -1002,8 +1046,6 @@ class ChordNode:
         await self.request_update_successor(pred, node_ref)
         await self.request_update_predecessor(succ, node_ref)
 
-        await self.send_file(None, node_ref)
-
     def multicast_sender(
         self,
         message_content: BaseModel,
@@ -1075,11 +1117,8 @@ class ChordNode:
             return False
         return True
 
-    async def send_file(self, file_id: str | None, target: ChordNodeReference) -> None:
-        if not file_id:
-            filename = self.database_path
-        else:
-            filename = f"{self.file_path}/{file_id}"
+    async def send_file(self, file_id: str, target: ChordNodeReference) -> None:
+        filename = f"{self.file_path}/{file_id}"
 
         file_size = os.path.getsize(filename)
 
@@ -1089,7 +1128,7 @@ class ChordNode:
 
         response = await self.send_message(
             FILE_SEND_REQUEST,
-            SendFileRequest(file_id=file_id if file_id else "", file_size=file_size),
+            SendFileRequest(file_id=file_id, file_size=file_size),
             reader=reader,
             writer=writer,
             target_id=target.node_id,
@@ -1131,10 +1170,12 @@ class ChordNode:
         writer: asyncio.StreamWriter,
         reader: asyncio.StreamReader,
     ) -> None:
-        if not file_id:
-            filename = self.database_path
-        else:
-            filename = f"{self.file_path}/{file_id}"
+        # Only audio files travel this way, the catalog moves row by row
+        if not file_id.isalnum():
+            self.logger.error(f"Refusing to receive file {file_id!r}.")
+            return
+
+        filename = f"{self.file_path}/{file_id}"
 
         try:
             with open(filename, "wb") as file:
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class DispotifyConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'dispotify'
+
+    def ready(self):
+        from . import http_cache, projection
+
+        projection.connect_signals()
+        http_cache.connect_signals()
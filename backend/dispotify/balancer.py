@@ -0,0 +1,79 @@
+import random
+import threading
+import time
+
+from contextlib import contextmanager
+from typing import List
+
+from chord.chord import ChordNodeReference
+
+LATENCY_SMOOTHING = 0.2  # Weight of the newest sample in the latency average
+FAILURE_PENALTY = 5.0  # seconds, recorded as latency when a replica fails
+
+
+class ReplicaBalancer:
+    """
+    Picks which replica serves a read using the power-of-two-choices rule over
+    the in-flight request count and the smoothed latency of each node.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._in_flight: dict[int, int] = {}
+        self._latency: dict[int, float] = {}
+
+    def score(self, node_id: int) -> float:
+        with self._lock:
+            in_flight = self._in_flight.get(node_id, 0)
+            latency = self._latency.get(node_id, 0.0)
+
+        # Unmeasured nodes score 0 so they get probed before being ranked.
+        return (in_flight + 1) * latency
+
+    def order(self, replicants: List[ChordNodeReference]) -> List[ChordNodeReference]:
+        """
+        Returns the replicas in the order they should be tried: the best of two
+        random choices first, then the rest as fallbacks from best to worst.
+        """
+        if len(replicants) < 2:
+            return list(replicants)
+
+        first, second = random.sample(replicants, 2)
+        chosen = first if self.score(first.node_id) <= self.score(second.node_id) else second
+
+        fallbacks = sorted(
+            (rep for rep in replicants if rep is not chosen),
+            key=lambda rep: self.score(rep.node_id),
+        )
+
+        return [chosen] + fallbacks
+
+    @contextmanager
+    def track(self, node_id: int):
+        with self._lock:
+            self._in_flight[node_id] = self._in_flight.get(node_id, 0) + 1
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(node_id, time.perf_counter() - start)
+
+            with self._lock:
+                self._in_flight[node_id] -= 1
+
+    def record(self, node_id: int, latency: float) -> None:
+        with self._lock:
+            previous = self._latency.get(node_id)
+            if previous is None:
+                self._latency[node_id] = latency
+            else:
+                self._latency[node_id] = (
+                    LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * previous
+                )
+
+    def record_failure(self, node_id: int) -> None:
+        self.record(node_id, FAILURE_PENALTY)
+
+
+read_balancer = ReplicaBalancer()
@@ -0,0 +1,174 @@
+import time
+import threading
+
+from uuid import uuid4
+
+from django.db import transaction
+from rest_framework.exceptions import ParseError
+
+from chord.chord import hash_string
+
+from .models import Album, Artist, Song
+from .projection import refresh_song_listings, songs_of_albums, songs_of_artists
+
+# Version every replica stores a catalog write with, stamped by the node that
+# first received it (see `chord_distribute`).
+CATALOG_VERSION_HEADER = "X-Catalog-Version"
+
+# Key of each model's rows in a catalog batch
+CATALOG_BATCH_KEYS = {Artist: "artists", Album: "albums", Song: "songs"}
+
+
+def request_catalog_version(request) -> int:
+    # Only set by peers or by `stamp_catalog_version`, never taken from clients
+    version = request.META.get("HTTP_X_CATALOG_VERSION")
+
+    if not version:
+        return time.time_ns()
+
+    try:
+        return int(version)
+    except ValueError:
+        raise ParseError(f"Invalid {CATALOG_VERSION_HEADER} header.")
+
+
+class CatalogRevision:
+    """
+    Counter of the writes committed to this node's catalog. Catalog responses
+    served by this node are valid while it does not change (see
+    `dispotify.http_cache`). Unlike row versions it is local to the process,
+    so it is tagged with a token of its own.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._token = uuid4().hex[:12]
+        self._count = 0
+
+    def current(self) -> str:
+        with self._lock:
+            return f"{self._token}-{self._count}"
+
+    def bump(self) -> None:
+        # Once committed: whatever is read under a revision is at least as
+        # new as it.
+        transaction.on_commit(self._increment)
+
+    def _increment(self) -> None:
+        with self._lock:
+            self._count += 1
+
+
+catalog_revision = CatalogRevision()
+
+
+# Ids of rows created without one. They are derived from the fields as the
+# client sent them, so the node routing the create and the partition storing
+# it agree on the id.
+def default_album_id(data) -> str:
+    return hash_string(f"{data.get('name')}:{data.get('date')}:{data.get('author')}")
+
+
+def default_song_id(data) -> str:
+    return hash_string(f"{data.get('title')}:{data.get('album')}")
+
+
+@transaction.atomic
+def apply_catalog_batch(batch: dict, version: int = 0) -> dict:
+    """
+    Creates or updates a batch of catalog rows in a single transaction:
+
+        {
+            "artists": [{"id", "name"}],
+            "albums": [{"id", "name", "date", "author"}],
+            "songs": [{"id", "title", "album", "artist": [...],
+                       "duration_seconds", "bitrate", "extension"}],
+        }
+
+    Albums and songs may refer to rows created earlier in the same batch.
+    Rows without a "version" take `version`; a row only replaces a stored one
+    with an older version, so applying a batch twice is harmless.
+    """
+    artists = [
+        Artist(
+            id=artist["id"],
+            name=artist["name"],
+            version=artist.get("version", version),
+        )
+        for artist in batch.get("artists", [])
+    ]
+    written_artists = upsert_rows(Artist, artists, ["name", "version"])
+
+    albums = [
+        Album(
+            id=album["id"],
+            name=album["name"],
+            date=album["date"],
+            author_id=album["author"],
+            version=album.get("version", version),
+        )
+        for album in batch.get("albums", [])
+    ]
+    written_albums = upsert_rows(Album, albums, ["name", "date", "author", "version"])
+
+    songs_data = batch.get("songs", [])
+    songs = [
+        Song(
+            id=song["id"],
+            title=song["title"],
+            album_id=song.get("album"),
+            duration_seconds=song["duration_seconds"],
+            bitrate=song["bitrate"],
+            extension=song.get("extension", "mp3"),
+            version=song.get("version", version),
+        )
+        for song in songs_data
+    ]
+    written_songs = upsert_rows(
+        Song,
+        songs,
+        ["title", "album", "duration_seconds", "bitrate", "extension", "version"],
+    )
+
+    SongArtist = Song.artist.through
+    SongArtist.objects.filter(song_id__in=written_songs).delete()
+    SongArtist.objects.bulk_create(
+        [
+            SongArtist(song_id=song["id"], artist_id=artist_id)
+            for song in songs_data
+            if song["id"] in written_songs
+            for artist_id in song["artist"]
+        ],
+        ignore_conflicts=True,
+    )
+
+    # Bulk writes send no signals, see `dispotify.projection`
+    refresh_song_listings(
+        written_songs
+        | songs_of_artists(written_artists)
+        | songs_of_albums(written_albums)
+    )
+    catalog_revision.bump()
+
+    return {"artists": len(artists), "albums": len(albums), "songs": len(songs)}
+
+
+def upsert_rows(model, rows: list, fields: list[str]) -> set[str]:
+    """Inserts the new rows and overwrites older versions, returns the ids written."""
+    stored_versions = dict(
+        model.objects.filter(id__in=[row.id for row in rows]).values_list(
+            "id", "version"
+        )
+    )
+
+    new = [row for row in rows if row.id not in stored_versions]
+    model.objects.bulk_create(new, ignore_conflicts=True)
+
+    newer = [
+        row
+        for row in rows
+        if row.id in stored_versions and row.version > stored_versions[row.id]
+    ]
+    model.objects.bulk_update(newer, fields)
+
+    return {row.id for row in new + newer}
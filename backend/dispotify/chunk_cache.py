@@ -0,0 +1,109 @@
+import os
+import logging
+import threading
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+CHUNK_CACHE_MAX_BYTES = 64 << 20  # 64MB shared by reads, readahead and prefetch
+READAHEAD_CHUNKS = 8  # Chunks warmed after each stream request
+PREFETCH_CHUNKS = 16  # Chunks warmed when a client announces its next track
+READAHEAD_WORKERS = 2
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkCache:
+    """
+    LRU cache of raw audio chunks bounded by a global memory budget.
+
+    Entries are keyed by the file's modification time, so a rewritten file is
+    never served from stale chunks; the old entries just age out.
+    """
+
+    def __init__(self, max_bytes: int = CHUNK_CACHE_MAX_BYTES) -> None:
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._chunks: OrderedDict[tuple, bytes] = OrderedDict()
+        self._size = 0
+
+        self._pending: set[tuple] = set()
+        self._executor = ThreadPoolExecutor(
+            max_workers=READAHEAD_WORKERS, thread_name_prefix="readahead"
+        )
+
+    def read(self, filename: str, index: int, chunk_size: int) -> bytes:
+        key = self._key(filename, index, chunk_size)
+
+        with self._lock:
+            chunk = self._chunks.get(key)
+            if chunk is not None:
+                self._chunks.move_to_end(key)
+                return chunk
+
+        chunk = self._read_from_disk(filename, index, chunk_size)
+        self._store(key, chunk)
+
+        return chunk
+
+    def readahead(
+        self, filename: str, first_index: int, count: int, chunk_size: int
+    ) -> None:
+        """Warms the cache with `count` chunks from `first_index` in the background."""
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return
+
+        total_chunks = (stat.st_size + chunk_size - 1) // chunk_size
+
+        for index in range(first_index, min(first_index + count, total_chunks)):
+            key = self._key(filename, index, chunk_size, stat.st_mtime_ns)
+
+            with self._lock:
+                if key in self._chunks or key in self._pending:
+                    continue
+                self._pending.add(key)
+
+            self._executor.submit(self._warm, key, filename, index, chunk_size)
+
+    def _warm(self, key: tuple, filename: str, index: int, chunk_size: int) -> None:
+        try:
+            self._store(key, self._read_from_disk(filename, index, chunk_size))
+        except OSError as e:
+            logger.debug(f"Readahead of {filename} failed: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def _store(self, key: tuple, chunk: bytes) -> None:
+        if len(chunk) > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._chunks:
+                return
+
+            self._chunks[key] = chunk
+            self._size += len(chunk)
+
+            while self._size > self.max_bytes:
+                _, evicted = self._chunks.popitem(last=False)
+                self._size -= len(evicted)
+
+    def _key(
+        self, filename: str, index: int, chunk_size: int, mtime_ns: int | None = None
+    ) -> tuple:
+        if mtime_ns is None:
+            mtime_ns = os.stat(filename).st_mtime_ns
+
+        return (filename, mtime_ns, chunk_size, index)
+
+    def _read_from_disk(self, filename: str, index: int, chunk_size: int) -> bytes:
+        with open(filename, "rb") as audio_file:
+            audio_file.seek(index * chunk_size)
+            return audio_file.read(chunk_size)
+
+
+chunk_cache = ChunkCache()
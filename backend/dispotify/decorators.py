@@ -1,18 +1,120 @@
-from typing import Literal
+from typing import IO
 import requests
+import urllib3
 import json
+import time
+import logging
+
+from uuid import uuid4
 
 from functools import wraps
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
 from rest_framework import viewsets
-from django.http import HttpRequest, HttpResponse
-from asgiref.sync import async_to_sync
-
-from chord.chord import ChordNode, ChordNodeReference, hash_string
+from django.db import connection
+from django.http import (
+    Http404,
+    HttpRequest,
+    HttpResponse,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.urls import reverse
+from rest_framework.response import Response
+
+from chord.chord import ChordNode, ChordNodeReference
+
+from .balancer import read_balancer
+from . import hints, http_cache, replication, scatter
+from .peers import peer_client
+from .routing import RoutingKey, RowKey, routing_cache
+from .idempotency import IDEMPOTENCY_HEADER
+from .singleflight import RequestKey, request_flights
+from .catalog import CATALOG_BATCH_KEYS, CATALOG_VERSION_HEADER, apply_catalog_batch
+
+logger = logging.getLogger(__name__)
 
 TARGETING_HEADER = "Chord-Target-Signature"
+REPLICA_STATUS_HEADER = "X-Replica-Status"
+
+# Headers meaningful only for a single transport-level connection (RFC 7230,
+# section 6.1). They must not be relayed by a proxy, and WSGI servers refuse them.
+HOP_BY_HOP_HEADERS = frozenset(
+    [
+        "connection",
+        "keep-alive",
+        "proxy-authenticate",
+        "proxy-authorization",
+        "te",
+        "trailer",
+        "trailers",
+        "transfer-encoding",
+        "upgrade",
+    ]
+)
+
+FORWARDED_METHODS = ("GET", "POST", "PUT", "PATCH", "DELETE")
+
+STREAM_CHUNK_SIZE = 1 << 15  # 32kB
+
+# Threads forwarding writes to the other replicas; late replicas keep using
+# them after the client got its response.
+REPLICA_FANOUT_WORKERS = 32
+
+replica_executor = ThreadPoolExecutor(
+    max_workers=REPLICA_FANOUT_WORKERS, thread_name_prefix="replica-fanout"
+)
+
+
+def chord_distribute(
+    k: int,
+    routing_key: RoutingKey,
+    stream: bool = False,
+    read_replicas: int = 1,
+    write_quorum: int | None = None,
+    read_quorum: int = 1,
+    write_behind: bool = False,
+    etag=None,
+    coalesce: RequestKey | None = None,
+    resolve=None,
+):
+    """
+    Routes the request to the `k` nodes responsible for the key `routing_key`
+    derives from it. The body is forwarded untouched.
+
+    Catalog (RowKey) writes are stamped with a version, and catalog reads
+    with a `read_quorum` greater than one are answered with the newest rows
+    among that many replicas, see `read_with_quorum`.
+
+    Writes are sent to all of them at once and answered as soon as
+    `write_quorum` replicas acknowledged them, see `send_to_replicants`. With
+    `write_behind`, creates only wait for the first `write_quorum` replicas
+    and reach the rest in batches, see `replication.write_behind`.
+
+    When `stream` is set, GET requests forwarded to another node are relayed
+    to the client as the owner produces them instead of being buffered.
+
+    When `read_replicas` is greater than one, GET requests may be served by any
+    of the first `read_replicas` nodes holding the key, see `serve_from_replicas`.
+
+    GET answers carry an ETag, `etag(request)` on the node serving them (the
+    catalog revision for RowKey reads) or their hash when merged from several
+    nodes, and clients holding it get a 304, see `dispotify.http_cache`.
+
+    With `coalesce`, identical concurrent GET requests (same `coalesce` key)
+    share a single read, see `SingleFlight`.
+
+    `resolve(rows)` may complete the rows of a GET answer on the node that
+    received it from the client, as in `chord_scatter`.
+    """
+    if etag is None and isinstance(routing_key, RowKey):
+        etag = http_cache.catalog_etag
 
-
-def chord_distribute(k: int, _key: Literal[None, "metadata"] = None):
     def decorator(view_func):
         @wraps(view_func)
         def _wrapped_view(
@@ -23,112 +125,612 @@ def chord_distribute(k: int, _key: Literal[None, "metadata"] = None):
             assert node
 
             req_method = request.method
-            req_body = request.body.decode()
+            req_body = request.body
             req_headers = dict(request.headers)
             req_path = request.path
             req_params = request.GET
 
-            key = hash_string(req_body if not _key else _key)
+            def serve_locally(conditional: bool = False) -> HttpResponse:
+                if req_method != "GET" or etag is None:
+                    return view_func(self, request, *args, **kwargs)
 
-            try:
-                json_body = json.loads(req_body)
+                return http_cache.serve_with_etag(
+                    request,
+                    etag(request),
+                    lambda: view_func(self, request, *args, **kwargs),
+                    conditional=conditional,
+                )
 
-                if "id" not in json_body:
-                    json_body["id"] = key
-                else:
-                    key = json_body["id"]
-                req_body = json.dumps(json_body)
+            def coalesced(fetch, *extra) -> HttpResponse:
+                if coalesce is None or req_method != "GET":
+                    return fetch()
+                return request_flights.share(coalesce(request, *extra), fetch)
 
-            except json.JSONDecodeError:
-                pass
+            if req_headers.get(TARGETING_HEADER) == node.ring_signature:
+                return coalesced(
+                    lambda: serve_locally(conditional=True), TARGETING_HEADER
+                )
 
-            data_id = int(key, 16) % (1 << node.id_bitlen)
-
-            if "audio_id" in req_params:
-                data_id = int(req_params["audio_id"], 16) % (1 << node.id_bitlen)
+            key = routing_key(request, kwargs)
 
-            elif "id" in req_params:
-                data_id = int(req_params["id"], 16) % (1 << node.id_bitlen)
+            if key is None:
+                return HttpResponse("Missing routing key.", status=400)
 
-            succ = async_to_sync(node.find_successor)(data_id)
-            replicants = async_to_sync(node.get_replicants)(k, succ)  # Usar k aquí
+            data_id = int(key, 16) % (1 << node.id_bitlen)
 
-            target_signature = req_headers.get(TARGETING_HEADER, None)
+            def read() -> HttpResponse:
+                if read_quorum > 1:
+                    replicants = routing_cache.replicas(data_id, read_quorum)
 
-            # This is a hack to make the request body available in the view function.
-            # It's not a good idea to modify the request object like this, but it's the only way to make it work.
-            # TODO: Find a better way to do this. Perhaps...
-            setattr(request, "body", req_body.encode())
+                    # Replicas must send their rows to be merged, not a 304
+                    return read_with_quorum(
+                        replicants,
+                        serve_locally,
+                        http_cache.unconditional(req_headers),
+                        req_path,
+                        req_params,
+                        model=self.queryset.model,  # type: ignore
+                    )
 
-            if target_signature == node.ring_signature:
-                return view_func(self, request, *args, **kwargs)
+                if read_replicas > 1:
+                    replicants = routing_cache.replicas(data_id, read_replicas)
 
-            for rep in replicants:
-                if rep.node_id == node.node_id:
-                    response = view_func(self, request, *args, **kwargs)
-                else:
-                    response = forward_request_to_successor(
-                        rep,
-                        req_method,
-                        req_body,
+                    return serve_from_replicas(
+                        replicants,
+                        lambda: serve_locally(conditional=True),
                         req_headers,
                         req_path,
                         req_params,
+                        stream=stream,
                     )
 
-            return response
+                return send_to_replicants(
+                    routing_cache.replicas(data_id, k),
+                    lambda: serve_locally(conditional=True),
+                    req_method,
+                    req_body,
+                    req_headers,
+                    req_path,
+                    req_params,
+                    stream=stream,
+                )
+
+            def read_resolved() -> HttpResponse:
+                response = read()
+                data = response_data(response)
+
+                if resolve is None or response.status_code != 200 or data is None:
+                    return response
+
+                resolve([data] if isinstance(data, dict) else data)
+
+                # Tagged by its hash, the names may come from other partitions
+                return JsonResponse(data, safe=False)
+
+            if req_method == "GET":
+                return http_cache.conditional_response(
+                    request, coalesced(read_resolved)
+                )
+
+            # Every replica, retry and hinted replay of this write shares it.
+            req_headers.setdefault(IDEMPOTENCY_HEADER, uuid4().hex)
+
+            if isinstance(routing_key, RowKey):
+                stamp_catalog_version(request, req_headers)
+
+            if write_behind and req_method == "POST":
+                return replication.write_behind(
+                    routing_cache.replicas(data_id, k),
+                    serve_locally,
+                    req_method,
+                    req_body,
+                    req_headers,
+                    req_path,
+                    req_params,
+                    batch_key=CATALOG_BATCH_KEYS[self.queryset.model],  # type: ignore
+                    write_quorum=write_quorum,
+                )
+
+            return send_to_replicants(
+                routing_cache.replicas(data_id, k),
+                serve_locally,
+                req_method,
+                req_body,
+                req_headers,
+                req_path,
+                req_params,
+                write_quorum=write_quorum,
+            )
 
         return _wrapped_view
 
     return decorator
 
 
-def forward_request_to_successor(
-    succ: ChordNodeReference,
+def chord_scatter(resolve=None, coalesce: RequestKey | None = None):
+    """
+    Runs a catalog list or search on every partition at once and merges the
+    answers, see `scatter.scatter_gather`. Every partition returns its own
+    first page after the cursor (see `KeysetPagination`), and the merged
+    page links to the next one like a single node's would.
+    `resolve(rows)` may complete the merged rows afterwards.
+
+    Each node keeps the pages it served in `http_cache.response_cache` until
+    its catalog changes. The merged page is tagged with its hash, see
+    `http_cache.conditional_response`. With `coalesce`, identical concurrent
+    lists share a single scatter (and a single page on each node), see
+    `SingleFlight`.
+    """
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
+            node = ChordNode.get_instance()
+
+            assert node
+
+            def serve_locally() -> HttpResponse:
+                return http_cache.response_cache.serve(
+                    request, lambda: view_func(self, request, *args, **kwargs)
+                )
+
+            def coalesced(fetch, *extra) -> HttpResponse:
+                if coalesce is None:
+                    return fetch()
+                return request_flights.share(coalesce(request, *extra), fetch)
+
+            if request.headers.get(TARGETING_HEADER) == node.ring_signature:
+                return coalesced(serve_locally, TARGETING_HEADER)
+
+            paginator = self.paginator
+            paginator.setup(request, self)
+
+            response = coalesced(
+                lambda: scatter.scatter_gather(
+                    routing_cache.nodes(),
+                    serve_locally,
+                    http_cache.unconditional(dict(request.headers)),
+                    request.path,
+                    request.GET,
+                    ordering=paginator.ordering,
+                    limit=paginator.limit,
+                    offset=paginator.offset,
+                    resolve=resolve,
+                    page_headers=paginator.get_headers,
+                )
+            )
+
+            return http_cache.conditional_response(request, response)
+
+        return _wrapped_view
+
+    return decorator
+
+
+def send_to_replicants(
+    replicants: list[ChordNodeReference],
+    serve_locally,
     method: str | None,
-    body: str | None,
-    headers: dict | None,
+    body,
+    headers: dict,
     path: str,
     params,
+    stream: bool = False,
+    write_quorum: int | None = None,
 ) -> HttpResponse:
-    url = f"http://{succ.ip_address}:8000{path}"
+    """
+    Applies the request on every replica, running `serve_locally` for this node
+    and forwarding it to the others concurrently.
+
+    Returns once `write_quorum` replicas (a majority by default) acknowledged
+    the request with a 2xx response; the rest keep completing in the
+    background. The returned response is this node's if it acknowledged,
+    otherwise the first acknowledgement, and carries the status of every
+    replica in the REPLICA_STATUS_HEADER ("pending" for the late ones).
+    """
+    node = ChordNode.get_instance()
+
+    assert node
+
+    if not replicants:
+        return HttpResponse("No replicas available.", status=503)
+
+    if method == "GET":
+        # Reads have a single answer, there is nothing to fan out.
+        response = HttpResponse("No replicas available.", status=503)
+        for rep in replicants:
+            if rep.node_id == node.node_id:
+                response = serve_locally()
+            else:
+                response = forward_request_to_successor(
+                    rep, method, body, headers, path, params, stream=stream
+                )
+        return response
+
+    quorum = min(write_quorum or len(replicants) // 2 + 1, len(replicants))
+
+    futures: dict[Future, ChordNodeReference] = {}
+    local_rep = None
+
+    for rep in replicants:
+        if rep.node_id == node.node_id:
+            local_rep = rep
+            continue
+
+        future = replica_executor.submit(
+            forward_request_to_successor, rep, method, body, headers, path, params
+        )
+        future.add_done_callback(log_replica_failure(rep, method, path))
+        futures[future] = rep
+
+    statuses: dict[int, int | str] = {rep.node_id: "pending" for rep in replicants}
+    acknowledged: list[HttpResponse] = []
+    rejected: list[HttpResponse] = []
+
+    def collect(rep: ChordNodeReference, response: HttpResponse):
+        statuses[rep.node_id] = response.status_code
+        if is_acknowledgement(response):
+            acknowledged.append(response)
+        else:
+            rejected.append(response)
+
+    # The local write runs while the forwarded ones are in flight.
+    if local_rep is not None:
+        collect(local_rep, serve_locally())
+
+    pending = set(futures)
+
+    while len(acknowledged) < quorum and pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            collect(futures[future], future.result())
+
+    if len(acknowledged) >= quorum:
+        response = acknowledged[0]
+    else:
+        # Rejections such as validation errors are more useful than a 503.
+        response = next(
+            (r for r in rejected if r.status_code < 500),
+            HttpResponse("Write quorum not reached.", status=503),
+        )
+
+    response[REPLICA_STATUS_HEADER] = ", ".join(
+        f"{node_id}={status}" for node_id, status in statuses.items()
+    )
+
+    return response
 
-    headers[TARGETING_HEADER] = ChordNode.get_instance().ring_signature  # type: ignore
+
+def stamp_catalog_version(request: HttpRequest, headers: dict) -> int:
+    """
+    Picks the version every replica will store this catalog write with. The
+    node taking the write from a client always picks it: a version sent by
+    the client could make the write win over any later one.
+    """
+    version = time.time_ns()
+
+    for header in list(headers):
+        if header.lower() == CATALOG_VERSION_HEADER.lower():
+            del headers[header]
+
+    headers[CATALOG_VERSION_HEADER] = str(version)
+    request.META["HTTP_X_CATALOG_VERSION"] = str(version)
+
+    return version
+
+
+def read_with_quorum(
+    replicants: list[ChordNodeReference],
+    serve_locally,
+    headers: dict,
+    path: str,
+    params,
+    model,
+) -> HttpResponse:
+    """
+    Reads the catalog rows from every replica at once and answers with the
+    newest version of each row. Replicas that answered an older version are
+    repaired in the background with the newest rows.
+
+    Replicas lacking a row are left alone: deletes leave no version behind, so
+    the row may be missing because it was deleted there, and pushing it back
+    would undo the delete. Writes they missed come back through hinted handoff.
+    """
+    node = ChordNode.get_instance()
+
+    assert node
+
+    futures = {
+        replica_executor.submit(
+            forward_request_to_successor, rep, "GET", None, headers, path, params
+        ): rep
+        for rep in replicants
+        if rep.node_id != node.node_id
+    }
+
+    def read_locally():
+        try:
+            return serve_locally()
+        except Http404:
+            # A missing row is an answer too
+            return HttpResponse(status=404)
+
+    responses: list[tuple[ChordNodeReference, HttpResponse]] = [
+        (rep, read_locally()) for rep in replicants if rep.node_id == node.node_id
+    ]
+    responses += [(futures[future], future.result()) for future in as_completed(futures)]
+
+    replica_rows: dict[int, dict] = {}
+    newest: dict[str, dict] = {}
+    single = False
+
+    for rep, response in responses:
+        data = response_data(response)
+        if data is None:
+            continue
+
+        single = single or isinstance(data, dict)
+        rows = [data] if isinstance(data, dict) else data
+        replica_rows[rep.node_id] = {row["id"]: row for row in rows}
+
+        for row in rows:
+            current = newest.get(row["id"])
+            if current is None or row.get("version", 0) > current.get("version", 0):
+                newest[row["id"]] = row
+
+    if not replica_rows:
+        return responses[0][1] if responses else HttpResponse(status=503)
+
+    for rep, _ in responses:
+        stored = replica_rows.get(rep.node_id)
+        if stored is None:
+            continue
+
+        stale = [
+            row
+            for row_id, row in newest.items()
+            if row_id in stored
+            and stored[row_id].get("version", 0) < row.get("version", 0)
+        ]
+        if stale:
+            replica_executor.submit(repair_replica, rep, model, stale)
+
+    if not newest:
+        # Nobody holds the rows: the first answer already says so (404 or []).
+        return next(
+            response for rep, response in responses if rep.node_id in replica_rows
+        )
+
+    if single:
+        return JsonResponse(next(iter(newest.values())))
+
+    return JsonResponse(list(newest.values()), safe=False)
+
+
+def response_data(response: HttpResponse):
+    """The rows of a replica's answer: [] when it lacks them, None if it failed."""
+    if response.status_code == 404:
+        return []
+
+    if response.status_code >= 300:
+        return None
+
+    if isinstance(response, Response):
+        return response.data
 
     try:
-        if method == "POST":
-            response = requests.post(url, data=body, headers=headers)
+        return json.loads(response.content)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
 
-        elif method == "GET":
-            response = requests.get(url, headers=headers, params=params)
 
-        elif method == "PUT":
-            response = requests.put(url, data=body, headers=headers)
+def repair_replica(rep: ChordNodeReference, model, rows: list[dict]) -> None:
+    node = ChordNode.get_instance()
 
-        elif method == "DELETE":
-            response = requests.delete(url, headers=headers)
+    assert node
 
-        elif method == "PATCH":
-            response = requests.patch(url, data=body, headers=headers)
+    batch = {CATALOG_BATCH_KEYS[model]: rows}
 
-        else:
-            return HttpResponse("Unknown HTTP method.", status=500)
+    try:
+        if rep.node_id == node.node_id:
+            apply_catalog_batch(batch)
+            return
+
+        response = forward_request_to_successor(
+            rep,
+            "POST",
+            json.dumps(batch),
+            {"Content-Type": "application/json"},
+            reverse("catalog_batch"),
+            {},
+        )
+        if not is_acknowledgement(response):
+            logger.warning(
+                f"Read repair of node {rep.node_id} failed: {response.status_code}"
+            )
+    except Exception:
+        logger.exception(f"Read repair of node {rep.node_id} failed")
+    finally:
+        connection.close()
+
+
+def is_acknowledgement(response: HttpResponse) -> bool:
+    return 200 <= response.status_code < 300
+
+
+def log_replica_failure(rep: ChordNodeReference, method: str | None, path: str):
+    def callback(future: Future):
+        response = future.result()
+        if not is_acknowledgement(response):
+            logger.warning(
+                f"{method} {path} failed on node {rep.node_id}: {response.status_code}"
+            )
+
+    return callback
+
+
+def serve_from_replicas(
+    replicants: list[ChordNodeReference],
+    serve_locally,
+    headers: dict,
+    path: str,
+    params,
+    stream: bool = False,
+) -> HttpResponse:
+    """
+    Serves a read from the replica chosen by `read_balancer`, falling back to
+    the next one whenever a replica does not hold the data (404) or fails.
+    """
+    node = ChordNode.get_instance()
+
+    assert node
+
+    ordered = read_balancer.order(replicants)
+
+    for index, rep in enumerate(ordered):
+        with read_balancer.track(rep.node_id):
+            if rep.node_id == node.node_id:
+                response = serve_locally()
+            else:
+                response = forward_request_to_successor(
+                    rep, "GET", None, headers, path, params, stream=stream
+                )
+
+        if response.status_code >= 500:
+            read_balancer.record_failure(rep.node_id)
+
+        if response.status_code != 404 and response.status_code < 500:
+            return response
+
+        if index == len(ordered) - 1:
+            return response
+
+        response.close()
+
+    return HttpResponse("Internal Server Error", status=500)
+
+
+def forward_request_to_successor(
+    succ: ChordNodeReference,
+    method: str | None,
+    body: str | bytes | IO[bytes] | None,
+    headers: dict | None,
+    path: str,
+    params,
+    stream: bool = False,
+) -> HttpResponse:
+    """
+    Forwards the request to `succ`. Writes that cannot reach it are kept in
+    the hint queue and replayed once it is back (see `HintQueue`).
+    """
+    if method not in FORWARDED_METHODS:
+        return HttpResponse("Unknown HTTP method.", status=500)
+
+    if method != "GET" and IDEMPOTENCY_HEADER not in (headers or {}):
+        headers = {**(headers or {}), IDEMPOTENCY_HEADER: uuid4().hex}
+
+    try:
+        response = request_node(succ, method, body, headers, path, params, stream)
+
+        if stream:
+            return stream_response(response)
 
         return parse_response(response)
     except requests.RequestException:
+        routing_cache.forget_node(succ.node_id)
+
+        if method != "GET" and hints.hint_queue.add(
+            succ, method, body, headers or {}, path, params
+        ):
+            return HttpResponse(
+                "Node unreachable, the write will be replayed when it is back.",
+                status=503,
+            )
+
         return HttpResponse("Internal Server Error", status=500)
 
 
+def request_node(
+    succ: ChordNodeReference,
+    method: str,
+    body: str | bytes | IO[bytes] | None,
+    headers: dict | None,
+    path: str,
+    params,
+    stream: bool = False,
+) -> requests.Response:
+    url = f"http://{succ.ip_address}:8000{path}"
+
+    headers = strip_hop_by_hop_headers(headers or {})
+    headers[TARGETING_HEADER] = ChordNode.get_instance().ring_signature  # type: ignore
+
+    return peer_client.request(
+        method,
+        url,
+        data=body if method != "GET" else None,
+        headers=headers,
+        params=params,
+        stream=stream,
+    )
+
+
+def strip_hop_by_hop_headers(headers) -> dict:
+    connection_tokens = {
+        token.strip().lower()
+        for key, value in headers.items()
+        if key.lower() == "connection"
+        for token in value.split(",")
+    }
+
+    return {
+        key: value
+        for key, value in headers.items()
+        if key.lower() not in HOP_BY_HOP_HEADERS
+        and key.lower() not in connection_tokens
+    }
+
+
 def parse_response(
     requests_response: requests.Response,
 ) -> HttpResponse:
     content = requests_response.content
     status_code = requests_response.status_code
-    headers = requests_response.headers
+    headers = strip_hop_by_hop_headers(requests_response.headers)
 
     django_response = HttpResponse(content=content, status=status_code)
 
     for key, value in headers.items():
+        # `requests` already decoded the body, so the upstream framing no longer applies.
+        if key.lower() in ("content-length", "content-encoding"):
+            continue
+        django_response[key] = value
+
+    return django_response
+
+
+def stream_response(
+    requests_response: requests.Response,
+) -> StreamingHttpResponse:
+    """
+    Relays the upstream body chunk by chunk, byte-for-byte, so the first bytes
+    reach the client as soon as the owner sends them.
+    """
+
+    def relay():
+        try:
+            yield from requests_response.raw.stream(
+                STREAM_CHUNK_SIZE, decode_content=False
+            )
+        except (requests.RequestException, urllib3.exceptions.HTTPError):
+            return
+        finally:
+            requests_response.close()
+
+    django_response = StreamingHttpResponse(
+        relay(), status=requests_response.status_code
+    )
+
+    for key, value in strip_hop_by_hop_headers(requests_response.headers).items():
         django_response[key] = value
 
     return django_response
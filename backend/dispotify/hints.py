@@ -0,0 +1,288 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from chord.chord import ChordNode, ChordNodeReference
+
+from . import decorators
+
+logger = logging.getLogger(__name__)
+
+# Kept outside the catalog database, with a connection of its own.
+HINTS_PATH = "/app/data/hints.sqlite3"
+
+HINT_BATCH_SIZE = 50
+HINT_MAX_BODY_SIZE = 1 << 20  # 1MB, bigger bodies (audio) are left to `backup_files`
+DRAIN_RATE_SMOOTHING = 0.2
+
+# A node whose oldest hint is this old, or with this many hints, is taken as
+# gone for good: its hints are dropped and it is no longer pinged. If it ever
+# comes back, it gets its rows like any joining node (see `CatalogRebalancer`)
+# and its audio from `backup_files`.
+HINT_MAX_AGE = 24 * 60 * 60  # seconds
+HINT_MAX_PER_NODE = 10_000
+HINT_EXPIRY_INTERVAL = 60  # seconds
+
+
+class HintQueue:
+    """
+    Hinted handoff: writes forwarded to a node that could not be reached are
+    stored here and replayed, oldest first and in batches, once that node
+    answers a ping again (see `ChordNode.watched_nodes`), unless it stayed
+    away for too long.
+    """
+
+    def __init__(self, path: str = HINTS_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection: sqlite3.Connection | None = None
+        self.node: ChordNode | None = None
+        self.draining: set[int] = set()
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hints")
+        self.expirer: threading.Thread | None = None
+
+        self.hinted_total = 0
+        self.replayed_total = 0
+        self.dropped_total = 0
+        self.expired_total = 0
+        self.drain_rate = 0.0  # Hints replayed per second, smoothed over drains
+
+    def db(self) -> sqlite3.Connection:
+        if self.connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.connection = sqlite3.connect(
+                self.path, check_same_thread=False, isolation_level=None
+            )
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS hints (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    node_id INTEGER NOT NULL,
+                    ip_address TEXT NOT NULL,
+                    port INTEGER NOT NULL,
+                    method TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    headers TEXT NOT NULL,
+                    body BLOB NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS hints_node_id ON hints (node_id, id)"
+            )
+        return self.connection
+
+    def watch(self, node: ChordNode) -> None:
+        """Starts replaying on `node`'s pings, including hints left by a previous run."""
+        with self.lock:
+            self.node = node
+            rows = self.db().execute(
+                "SELECT DISTINCT node_id, ip_address, port FROM hints"
+            ).fetchall()
+
+        for node_id, ip_address, port in rows:
+            node.watched_nodes[node_id] = ChordNodeReference(ip_address, port, node_id)
+
+        node.ping_listeners.append(self.node_alive)
+
+        if self.expirer is None:
+            self.expirer = threading.Thread(
+                target=self.run_expiry, name="hints-expiry", daemon=True
+            )
+            self.expirer.start()
+
+    def add(
+        self,
+        target: ChordNodeReference,
+        method: str,
+        body,
+        headers: dict,
+        path: str,
+        params,
+    ) -> bool:
+        """Stores a write for `target`. Streamed and very large bodies are not hinted."""
+        if hasattr(body, "read"):
+            return False
+
+        body = (body.encode() if isinstance(body, str) else body) or b""
+
+        if len(body) > HINT_MAX_BODY_SIZE:
+            return False
+
+        headers = {
+            key: value
+            for key, value in headers.items()
+            if key.lower() != decorators.TARGETING_HEADER.lower()
+        }
+        if hasattr(params, "lists"):
+            params = list(params.lists())
+        else:
+            params = list((params or {}).items())
+
+        with self.lock:
+            self.db().execute(
+                "INSERT INTO hints (node_id, ip_address, port, method, path, "
+                "params, headers, body, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    target.node_id,
+                    target.ip_address,
+                    target.port,
+                    method,
+                    path,
+                    json.dumps(params),
+                    json.dumps(headers),
+                    body,
+                    time.time(),
+                ),
+            )
+            self.hinted_total += 1
+
+            if self.node is not None:
+                self.node.watched_nodes[target.node_id] = target
+
+        logger.info(f"Stored hint for node {target.node_id}: {method} {path}")
+        return True
+
+    def node_alive(self, target: ChordNodeReference) -> None:
+        # Runs on the chord event loop, the replay itself goes to a thread.
+        with self.lock:
+            if (
+                self.node is None
+                or target.node_id not in self.node.watched_nodes
+                or target.node_id in self.draining
+            ):
+                return
+            self.draining.add(target.node_id)
+
+        self.executor.submit(self.drain, target)
+
+    def drain(self, target: ChordNodeReference) -> None:
+        start = time.perf_counter()
+        replayed = 0
+
+        try:
+            while True:
+                with self.lock:
+                    rows = self.db().execute(
+                        "SELECT id, method, path, params, headers, body FROM hints "
+                        "WHERE node_id = ? ORDER BY id LIMIT ?",
+                        (target.node_id, HINT_BATCH_SIZE),
+                    ).fetchall()
+
+                    if not rows:
+                        if self.node is not None:
+                            self.node.watched_nodes.pop(target.node_id, None)
+                        break
+
+                delivered = []
+
+                for hint_id, method, path, params, headers, body in rows:
+                    try:
+                        response = decorators.request_node(
+                            target,
+                            method,
+                            body,
+                            json.loads(headers),
+                            path,
+                            json.loads(params),
+                        )
+                    except requests.RequestException:
+                        break  # Down again, the next ping retries
+
+                    response.close()
+                    delivered.append(hint_id)
+
+                    if response.status_code >= 300:
+                        self.dropped_total += 1
+                        logger.warning(
+                            f"Hinted {method} {path} rejected by node {target.node_id}: "
+                            f"{response.status_code}"
+                        )
+                    else:
+                        self.replayed_total += 1
+
+                with self.lock:
+                    self.db().executemany(
+                        "DELETE FROM hints WHERE id = ?", [(i,) for i in delivered]
+                    )
+
+                replayed += len(delivered)
+
+                if len(delivered) < len(rows):
+                    break
+        except Exception:
+            logger.exception(f"Replaying hints for node {target.node_id} failed")
+        finally:
+            elapsed = time.perf_counter() - start
+
+            with self.lock:
+                self.draining.discard(target.node_id)
+                if replayed and elapsed > 0:
+                    self.drain_rate += DRAIN_RATE_SMOOTHING * (
+                        replayed / elapsed - self.drain_rate
+                    )
+
+            if replayed:
+                logger.info(
+                    f"Replayed {replayed} hints on node {target.node_id} in {elapsed:.2f}s"
+                )
+
+    def run_expiry(self) -> None:
+        while True:
+            time.sleep(HINT_EXPIRY_INTERVAL)
+            try:
+                self.expire()
+            except Exception:
+                logger.exception("Expiring hints failed")
+
+    def expire(self) -> None:
+        """Drops the hints of the nodes that stayed away too long and unwatches them."""
+        with self.lock:
+            expired = self.db().execute(
+                "SELECT node_id, COUNT(*) FROM hints GROUP BY node_id "
+                "HAVING MIN(created_at) < ? OR COUNT(*) > ?",
+                (time.time() - HINT_MAX_AGE, HINT_MAX_PER_NODE),
+            ).fetchall()
+
+            for node_id, count in expired:
+                if node_id in self.draining:
+                    continue  # It is back
+
+                self.db().execute("DELETE FROM hints WHERE node_id = ?", (node_id,))
+                self.expired_total += count
+
+                if self.node is not None:
+                    self.node.watched_nodes.pop(node_id, None)
+
+                logger.warning(f"Dropped {count} hints for departed node {node_id}")
+
+    def metrics(self) -> dict:
+        with self.lock:
+            depth_by_node = dict(
+                self.db().execute(
+                    "SELECT node_id, COUNT(*) FROM hints GROUP BY node_id"
+                ).fetchall()
+            )
+
+            return {
+                "queue_depth": sum(depth_by_node.values()),
+                "queue_depth_by_node": depth_by_node,
+                "draining_nodes": sorted(self.draining),
+                "hinted_total": self.hinted_total,
+                "replayed_total": self.replayed_total,
+                "dropped_total": self.dropped_total,
+                "expired_total": self.expired_total,
+                "drain_rate": round(self.drain_rate, 2),
+            }
+
+
+hint_queue = HintQueue()
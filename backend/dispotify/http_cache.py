@@ -0,0 +1,237 @@
+import os
+import copy
+import stat
+import hashlib
+import threading
+
+from collections import OrderedDict
+
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.http import HttpRequest, HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from rest_framework.response import Response
+
+from .models import Album, Artist, Song
+from .catalog import catalog_revision
+from .serializers import AUDIOS_PATH, is_audio_id
+
+RESPONSE_CACHE_ENTRIES = 256  # List pages kept per node
+
+# Conditional headers are answered by the node talking to the client. Nodes
+# asked for rows to merge must send them whole.
+CONDITIONAL_HEADERS = frozenset(["if-none-match", "if-modified-since"])
+
+
+def catalog_etag(request: HttpRequest | None = None) -> str:
+    """ETag of a catalog read served by this node, see `CatalogRevision`."""
+    return revision_etag(catalog_revision.current())
+
+
+def revision_etag(revision: str) -> str:
+    return f'"c-{revision}"'
+
+
+def audio_etag(request: HttpRequest) -> str | None:
+    """ETag of a stream read: the hash of the audio, None if it is not here."""
+    audio_id = request.GET.get("audio_id", "")
+
+    if not is_audio_id(audio_id):
+        return None
+
+    digest = file_digests.get(f"{AUDIOS_PATH}/{audio_id}")
+
+    if digest is None:
+        return None
+
+    # The metadata comes from the catalog
+    if request.GET.get("include_metadata", "false").lower() == "true":
+        return f'"a-{digest}-{catalog_revision.current()}"'
+
+    return f'"a-{digest}"'
+
+
+def content_etag(content: bytes) -> str:
+    return f'"h-{hashlib.sha256(content).hexdigest()[:32]}"'
+
+
+def etag_matches(request: HttpRequest, etag: str) -> bool:
+    # Weak comparison, as GET allows (RFC 7232, section 3.2)
+    if_none_match = request.headers.get("If-None-Match")
+
+    if not if_none_match:
+        return False
+
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+def not_modified(etag: str) -> HttpResponse:
+    response = HttpResponseNotModified()
+    response["ETag"] = etag
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def serve_with_etag(
+    request: HttpRequest, etag: str | None, serve, conditional: bool = False
+) -> HttpResponse:
+    """
+    Runs `serve` and tags its answer with `etag`, computed before reading so
+    the answer is at least as new as it. When `conditional`, a client already
+    holding `etag` gets a 304 without running `serve`.
+    """
+    if etag is None:
+        return serve()
+
+    if conditional and etag_matches(request, etag):
+        return not_modified(etag)
+
+    response = serve()
+
+    if response.status_code == 200:
+        response["ETag"] = etag
+
+    return response
+
+
+def conditional_response(
+    request: HttpRequest, response: HttpResponse
+) -> HttpResponse:
+    """
+    Final step of a read: answers are tagged (by content when the answer was
+    merged from several nodes) and turn into a 304 if the client has them.
+    """
+    if response.status_code != 200 or response.streaming:
+        return response
+
+    etag = response.get("ETag")
+
+    if etag is None:
+        if isinstance(response, Response):
+            return response  # Not rendered yet, nothing to hash
+        etag = content_etag(response.content)
+
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    response["ETag"] = etag
+    patch_cache_control(response, no_cache=True)
+
+    return response
+
+
+def unconditional(headers: dict) -> dict:
+    return {
+        key: value
+        for key, value in headers.items()
+        if key.lower() not in CONDITIONAL_HEADERS
+    }
+
+
+class ResponseCache:
+    """
+    LRU cache of the list pages this node serves, keyed by their URL. A page
+    is only served from here while the catalog revision it was read at is
+    the current one.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_ENTRIES) -> None:
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._pages: OrderedDict[str, tuple] = OrderedDict()
+
+    def serve(self, request: HttpRequest, serve) -> HttpResponse:
+        key = request.get_full_path()
+        revision = catalog_revision.current()
+
+        with self._lock:
+            page = self._pages.get(key)
+            if page is not None and page[0] == revision:
+                self._pages.move_to_end(key)
+            else:
+                page = None
+
+        if page is not None:
+            _, data, headers = page
+            # Callers may complete the rows they get, see `resolve_song_names`
+            response = Response(copy.deepcopy(data), headers=headers)
+        else:
+            response = serve()
+
+            if response.status_code == 200 and isinstance(response, Response):
+                # The content type is chosen by the renderer of each request
+                headers = {
+                    header: value
+                    for header, value in response.items()
+                    if header.lower() != "content-type"
+                }
+                self._store(key, (revision, copy.deepcopy(response.data), headers))
+
+        if response.status_code == 200:
+            response["ETag"] = revision_etag(revision)
+
+        return response
+
+    def _store(self, key: str, page: tuple) -> None:
+        with self._lock:
+            self._pages[key] = page
+            self._pages.move_to_end(key)
+
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+
+
+class FileDigests:
+    """SHA-256 of the audio files, hashed again only when a file changes."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._digests: dict[str, tuple[tuple, str]] = {}
+
+    def get(self, filename: str) -> str | None:
+        try:
+            file_stat = os.stat(filename)
+        except OSError:
+            return None
+
+        # Devices and pipes could be read forever
+        if not stat.S_ISREG(file_stat.st_mode):
+            return None
+
+        version = (file_stat.st_mtime_ns, file_stat.st_size)
+
+        with self._lock:
+            known = self._digests.get(filename)
+            if known is not None and known[0] == version:
+                return known[1]
+
+        digest = hashlib.sha256()
+
+        try:
+            with open(filename, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+        except OSError:
+            return None
+
+        with self._lock:
+            self._digests[filename] = (version, digest.hexdigest()[:32])
+            return self._digests[filename][1]
+
+
+response_cache = ResponseCache()
+file_digests = FileDigests()
+
+
+def catalog_written(sender, **kwargs):
+    catalog_revision.bump()
+
+
+def connect_signals() -> None:
+    # Bulk writes send none, `apply_catalog_batch` bumps the revision itself
+    for model in (Artist, Album, Song):
+        post_save.connect(catalog_written, sender=model)
+        post_delete.connect(catalog_written, sender=model)
+    m2m_changed.connect(catalog_written, sender=Song.artist.through)
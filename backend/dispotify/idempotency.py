@@ -0,0 +1,136 @@
+import time
+import threading
+
+from collections import OrderedDict
+
+from django.http import HttpResponse, StreamingHttpResponse
+
+# Generated by the node a write enters the ring through and carried on every
+# forward of it, so each node applies a given write at most once.
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENT_REPLAY_HEADER = "Idempotent-Replayed"
+
+IDEMPOTENCY_CACHE_SIZE = 10_000
+IDEMPOTENCY_TTL = 300  # seconds
+
+# How long a duplicate waits for the original request to finish
+IN_FLIGHT_WAIT = 30  # seconds
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class IdempotencyCache:
+    """Bounded LRU of applied writes and their responses, entries expire after a TTL."""
+
+    def __init__(
+        self, max_entries: int = IDEMPOTENCY_CACHE_SIZE, ttl: float = IDEMPOTENCY_TTL
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries: OrderedDict[tuple, tuple] = OrderedDict()
+        self.in_flight: dict[tuple, threading.Event] = {}
+
+        self.hits = 0
+
+    def get(self, key: tuple) -> tuple[int, list, bytes] | None:
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None:
+                return None
+
+            if entry[0] < time.monotonic():
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1:]
+
+    def begin(self, key: tuple) -> threading.Event | None:
+        """Marks `key` as being applied; returns the running request's event if any."""
+        with self.lock:
+            event = self.in_flight.get(key)
+            if event is None:
+                self.in_flight[key] = threading.Event()
+            return event
+
+    def finish(self, key: tuple, response: HttpResponse | None) -> None:
+        with self.lock:
+            if response is not None:
+                self.entries[key] = (
+                    time.monotonic() + self.ttl,
+                    response.status_code,
+                    list(response.items()),
+                    response.content,
+                )
+                self.entries.move_to_end(key)
+
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+
+            event = self.in_flight.pop(key, None)
+
+        if event is not None:
+            event.set()
+
+
+idempotency_cache = IdempotencyCache()
+
+
+class IdempotencyMiddleware:
+    """
+    Answers writes whose idempotency key was already applied on this node with
+    the response they got then, without running the view again.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+
+        if not idempotency_key or request.method in SAFE_METHODS:
+            return self.get_response(request)
+
+        key = (idempotency_key, request.method, request.path)
+
+        cached = idempotency_cache.get(key)
+        if cached is not None:
+            return self.replay(cached)
+
+        running = idempotency_cache.begin(key)
+
+        if running is not None:
+            # Same write arriving twice at once: wait for the first one.
+            running.wait(IN_FLIGHT_WAIT)
+            cached = idempotency_cache.get(key)
+            if cached is not None:
+                return self.replay(cached)
+            return self.get_response(request)
+
+        response = None
+
+        try:
+            response = self.get_response(request)
+        finally:
+            # Server errors may be transient, let retries run again.
+            cacheable = (
+                response is not None
+                and response.status_code < 500
+                and not isinstance(response, StreamingHttpResponse)
+            )
+            idempotency_cache.finish(key, response if cacheable else None)
+
+        return response
+
+    def replay(self, cached: tuple[int, list, bytes]) -> HttpResponse:
+        status_code, headers, content = cached
+
+        response = HttpResponse(content, status=status_code)
+        for header, value in headers:
+            response[header] = value
+        response[IDEMPOTENT_REPLAY_HEADER] = "true"
+
+        return response
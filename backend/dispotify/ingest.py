@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import base64
+import binascii
+import logging
+import threading
+
+from uuid import uuid4
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from chord.chord import ChordNode
+
+from .placement import create_song_metadata, place_audio
+from .serializers import SongSerializer
+
+INGEST_WORKERS = 4
+INGEST_MAX_ATTEMPTS = 3  # For the stages talking to other nodes
+INGEST_RETRY_DELAY = 0.5  # seconds, doubled after every failed attempt
+INGEST_JOB_HISTORY = 1000  # Jobs kept around for status queries
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+logger = logging.getLogger(__name__)
+
+
+class RetryableIngestError(Exception):
+    pass
+
+
+@dataclass
+class IngestJob:
+    id: str
+    status: str = QUEUED
+    song_id: str | None = None
+    attempts: dict[str, int] = field(default_factory=dict)
+    timings: dict[str, float] = field(default_factory=dict)  # seconds per stage
+    result: dict | None = None
+    error: str | list | dict | None = None
+    created_at: float = field(default_factory=time.time)
+    # Shared by every retry of the job's writes, see `IDEMPOTENCY_HEADER`
+    idempotency_key: str = field(default_factory=lambda: uuid4().hex)
+    catalog_version: int = field(default_factory=time.time_ns)
+
+    def run_stage(self, name: str, func, retryable: bool = False):
+        """Runs one pipeline stage, timing it and retrying it if `retryable`."""
+        max_attempts = INGEST_MAX_ATTEMPTS if retryable else 1
+        delay = INGEST_RETRY_DELAY
+
+        for attempt in range(1, max_attempts + 1):
+            self.attempts[name] = attempt
+            start = time.perf_counter()
+
+            try:
+                return func()
+            except ValidationError:
+                raise
+            except Exception as e:
+                if attempt == max_attempts:
+                    raise
+
+                logger.warning(f"Ingest {self.id}: {name} failed ({e}), retrying...")
+                time.sleep(delay)
+                delay *= 2
+            finally:
+                self.timings[name] = self.timings.get(name, 0) + (
+                    time.perf_counter() - start
+                )
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def new_job_id() -> str:
+    node = ChordNode.get_instance()
+
+    assert node
+
+    # The prefix tells any node which one holds the job, see `get_job_node_id`.
+    return f"{node.node_id:08x}{uuid4().hex}"
+
+
+def get_job_node_id(job_id: str) -> int:
+    return int(job_id[:8], 16)
+
+
+def ingest_song(
+    song_data: dict,
+    audio_path: str | None = None,
+    audio_base64: str | None = None,
+    job: IngestJob | None = None,
+) -> Response:
+    """
+    Runs the song ingest pipeline: decode, parse, validate, place the audio on
+    its blob replicas and create the row on the catalog replicas.
+
+    The audio comes either base64 encoded or in the temporary file at
+    `audio_path`, which is always gone once the pipeline ends.
+    """
+    job = job or IngestJob(new_job_id())
+    job.song_id = song_data["id"]
+
+    try:
+        if audio_path is not None:
+            source = audio_path
+        else:
+            source = job.run_stage("decode", lambda: decode_audio(audio_base64))  # type: ignore
+
+        metadata = job.run_stage(
+            "parse", lambda: SongSerializer().get_audio_info(source)
+        )
+
+        song_data["duration_seconds"] = round(metadata.duration_seconds)
+        song_data["bitrate"] = metadata.bitrate
+        song_data["extension"] = metadata.extension
+
+        job.run_stage(
+            "validate",
+            lambda: SongSerializer(data=song_data).is_valid(raise_exception=True),
+        )
+
+        def place_audio_replicas():
+            failed = place_audio(song_data["id"], source, job.idempotency_key)
+            if failed:
+                raise RetryableIngestError(f"Audio replicas {failed} did not store it")
+
+        job.run_stage("place", place_audio_replicas, retryable=True)
+
+        def create_catalog_row():
+            response = create_song_metadata(
+                song_data, job.catalog_version, job.idempotency_key
+            )
+            if response.status_code >= 500:
+                raise RetryableIngestError(
+                    f"Catalog replicas answered {response.status_code}"
+                )
+            return response
+
+        return job.run_stage("catalog", create_catalog_row, retryable=True)
+    finally:
+        if audio_path is not None and os.path.isfile(audio_path):
+            os.remove(audio_path)
+
+
+def decode_audio(audio_base64: str) -> bytes:
+    try:
+        return base64.b64decode(audio_base64, validate=True)
+    except (binascii.Error, TypeError, ValueError):
+        raise ValidationError({"file_base64": ["The audio is not valid base64."]})
+
+
+def response_data(response):
+    if hasattr(response, "data"):
+        return response.data
+
+    try:
+        return json.loads(response.content)
+    except ValueError:
+        return response.content.decode(errors="replace")
+
+
+class IngestQueue:
+    """Runs ingest pipelines on a worker pool and keeps their status."""
+
+    def __init__(self, workers: int = INGEST_WORKERS) -> None:
+        self._lock = threading.Lock()
+        self._jobs: OrderedDict[str, IngestJob] = OrderedDict()
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="ingest"
+        )
+
+    def submit(
+        self,
+        song_data: dict,
+        audio_path: str | None = None,
+        audio_base64: str | None = None,
+    ) -> IngestJob:
+        job = IngestJob(new_job_id(), song_id=song_data["id"])
+
+        with self._lock:
+            self._jobs[job.id] = job
+
+            while len(self._jobs) > INGEST_JOB_HISTORY:
+                self._jobs.popitem(last=False)
+
+        self._executor.submit(self._run, job, song_data, audio_path, audio_base64)
+
+        return job
+
+    def get(self, job_id: str) -> IngestJob | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(
+        self,
+        job: IngestJob,
+        song_data: dict,
+        audio_path: str | None,
+        audio_base64: str | None,
+    ) -> None:
+        job.status = RUNNING
+
+        try:
+            response = ingest_song(song_data, audio_path, audio_base64, job)
+
+            if response.status_code >= 400:
+                job.status = FAILED
+                job.error = response_data(response)
+            else:
+                job.status = DONE
+                job.result = response_data(response)
+        except ValidationError as e:
+            job.status = FAILED
+            job.error = e.get_full_details()
+        except Exception as e:
+            logger.error(f"Ingest {job.id} failed: {e}")
+            job.status = FAILED
+            job.error = str(e)
+        finally:
+            close_old_connections()
+
+
+ingest_queue = IngestQueue()
+
+
+def accepted_response(job: IngestJob) -> Response:
+    return Response(
+        job.to_dict(),
+        status=status.HTTP_202_ACCEPTED,
+        headers={"Location": reverse("song_job", args=[job.id])},
+    )
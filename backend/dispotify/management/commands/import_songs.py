@@ -0,0 +1,210 @@
+import os
+import time
+
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import requests
+
+from mutagen.mp3 import MP3
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from chord.chord import hash_string
+
+UNKNOWN_ARTIST = "Unknown Artist"
+DEFAULT_ALBUM_DATE = "1970-01-01"
+
+
+def read_song_file(path: str) -> dict | None:
+    """Reads the tags and stream info of an MP3 file, runs in a worker process."""
+    try:
+        audio = MP3(path)
+    except Exception:
+        return None
+
+    tags = audio.tags or {}
+
+    def tag_values(name: str) -> list[str]:
+        frame = tags.get(name)
+        if not frame:
+            return []
+        return [str(value).strip() for value in frame.text if str(value).strip()]
+
+    title = next(iter(tag_values("TIT2")), Path(path).stem)
+    artists = tag_values("TPE1") or [UNKNOWN_ARTIST]
+    album = next(iter(tag_values("TALB")), None)
+    date = next(iter(tag_values("TDRC")), None)
+
+    return {
+        "path": path,
+        "title": title[:100],
+        "artists": [artist[:100] for artist in artists],
+        "album": album[:100] if album else None,
+        "date": normalize_date(date),
+        "duration_seconds": round(audio.info.length),
+        "bitrate": audio.info.bitrate,  # type: ignore
+        "extension": "mp3",
+    }
+
+
+def normalize_date(date: str | None) -> str:
+    # ID3 timestamps may be just "2001" or "2001-05"
+    if not date:
+        return DEFAULT_ALBUM_DATE
+
+    parts = date[:10].split("-")
+    if not parts[0].isdigit() or len(parts[0]) != 4:
+        return DEFAULT_ALBUM_DATE
+
+    year, month, day = (parts + ["01", "01"])[:3]
+    return f"{year}-{month}-{day}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports every MP3 under a directory: parses the files in a process pool, "
+        "creates the catalog rows in batches and sends the audio to its owners."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory")
+        parser.add_argument(
+            "--node",
+            default="http://127.0.0.1:8000",
+            help="Base URL of the node that routes the batches and files.",
+        )
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=4,
+            help="Audio files being uploaded at the same time.",
+        )
+        parser.add_argument("--skip-audio", action="store_true")
+
+    def handle(self, *args, **options):
+        directory = Path(options["directory"])
+        if not directory.is_dir():
+            raise CommandError(f"{directory} is not a directory.")
+
+        node_url = options["node"].rstrip("/")
+        batch_size = max(1, options["batch_size"])
+
+        paths = sorted(str(path) for path in directory.rglob("*.mp3"))
+        self.stdout.write(f"Found {len(paths)} MP3 files.")
+
+        start = time.perf_counter()
+        imported = skipped = failed_uploads = 0
+
+        known_artists: set[str] = set()
+        known_albums: set[str] = set()
+
+        with ProcessPoolExecutor(max_workers=options["workers"]) as parsers, \
+                ThreadPoolExecutor(max_workers=options["concurrency"]) as uploaders:
+            songs = parsers.map(read_song_file, paths, chunksize=16)
+
+            batch = {"artists": [], "albums": [], "songs": []}
+            uploads = []
+
+            for song in songs:
+                if song is None:
+                    skipped += 1
+                    continue
+
+                song_row = self.add_song(batch, song, known_artists, known_albums)
+
+                if not options["skip_audio"]:
+                    uploads.append(
+                        uploaders.submit(
+                            self.upload_audio, node_url, song_row["id"], song["path"]
+                        )
+                    )
+
+                if len(batch["songs"]) >= batch_size:
+                    imported += self.send_batch(node_url, batch)
+                    batch = {"artists": [], "albums": [], "songs": []}
+
+            if batch["songs"]:
+                imported += self.send_batch(node_url, batch)
+
+            failed_uploads = sum(not upload.result() for upload in uploads)
+
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {imported} songs in {elapsed:.1f}s "
+                f"({imported / elapsed if elapsed else 0:.1f} songs/s). "
+                f"Skipped {skipped} unreadable files, {failed_uploads} audio uploads failed."
+            )
+        )
+
+    def add_song(
+        self, batch: dict, song: dict, known_artists: set, known_albums: set
+    ) -> dict:
+        artist_ids = []
+
+        for name in song["artists"]:
+            artist_id = hash_string(name)
+            artist_ids.append(artist_id)
+
+            if artist_id not in known_artists:
+                known_artists.add(artist_id)
+                batch["artists"].append({"id": artist_id, "name": name})
+
+        album_id = None
+
+        if song["album"]:
+            album_id = hash_string(f"{song['album']}:{song['date']}:{artist_ids[0]}")
+
+            if album_id not in known_albums:
+                known_albums.add(album_id)
+                batch["albums"].append(
+                    {
+                        "id": album_id,
+                        "name": song["album"],
+                        "date": song["date"],
+                        "author": artist_ids[0],
+                    }
+                )
+
+        # Same id the streaming upload endpoint derives from title and album.
+        song_row = {
+            "id": hash_string(f"{song['title']}:{album_id}"),
+            "title": song["title"],
+            "album": album_id,
+            "artist": artist_ids,
+            "duration_seconds": song["duration_seconds"],
+            "bitrate": song["bitrate"],
+            "extension": song["extension"],
+        }
+        batch["songs"].append(song_row)
+
+        return song_row
+
+    def send_batch(self, node_url: str, batch: dict) -> int:
+        response = requests.post(f"{node_url}{reverse('catalog_batch')}", json=batch)
+
+        if response.status_code >= 300:
+            raise CommandError(
+                f"Catalog batch rejected ({response.status_code}): {response.text[:200]}"
+            )
+
+        self.stdout.write(f"  Batch of {len(batch['songs'])} songs created.")
+        return len(batch["songs"])
+
+    def upload_audio(self, node_url: str, song_id: str, path: str) -> bool:
+        try:
+            with open(path, "rb") as audio_file:
+                response = requests.put(
+                    f"{node_url}{reverse('audio_blob')}",
+                    params={"audio_id": song_id},
+                    data=audio_file,
+                    headers={"Content-Type": "application/octet-stream"},
+                )
+            return response.status_code < 300
+        except (OSError, requests.RequestException) as e:
+            self.stderr.write(f"  Could not upload {path}: {e}")
+            return False
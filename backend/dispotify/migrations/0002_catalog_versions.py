@@ -0,0 +1,28 @@
+# Generated by Django 5.1.3 on 2026-10-19 01:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispotify', '0001_Fix_song_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='version',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='artist',
+            name='version',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='version',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.3 on 2026-10-19 01:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispotify', '0002_catalog_versions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='album',
+            name='author',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='dispotify.artist'),
+        ),
+        migrations.AlterField(
+            model_name='song',
+            name='album',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='dispotify.album'),
+        ),
+        migrations.AlterField(
+            model_name='song',
+            name='artist',
+            field=models.ManyToManyField(db_constraint=False, to='dispotify.artist'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+from django.db import migrations
+
+# (table, FTS5 index, indexed column), see `dispotify.search`. The indexes
+# point at the rowids of the tables, so a migration remaking one of these
+# tables (which drops its triggers and renumbers its rows) must run this
+# again.
+SEARCH_INDEXES = [
+    ("dispotify_artist", "dispotify_artist_fts", "name"),
+    ("dispotify_album", "dispotify_album_fts", "name"),
+    ("dispotify_song", "dispotify_song_fts", "title"),
+]
+
+
+def create_search_index(table: str, index: str, column: str) -> list[str]:
+    return [
+        f"""
+        CREATE VIRTUAL TABLE {index} USING fts5(
+            {column},
+            content='{table}',
+            content_rowid='rowid',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+        """,
+        f"""
+        CREATE TRIGGER {index}_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {index}(rowid, {column}) VALUES (new.rowid, new.{column});
+        END
+        """,
+        f"""
+        CREATE TRIGGER {index}_delete AFTER DELETE ON {table} BEGIN
+            INSERT INTO {index}({index}, rowid, {column})
+            VALUES ('delete', old.rowid, old.{column});
+        END
+        """,
+        f"""
+        CREATE TRIGGER {index}_update AFTER UPDATE OF {column} ON {table} BEGIN
+            INSERT INTO {index}({index}, rowid, {column})
+            VALUES ('delete', old.rowid, old.{column});
+            INSERT INTO {index}(rowid, {column}) VALUES (new.rowid, new.{column});
+        END
+        """,
+        # Indexes the rows already stored
+        f"INSERT INTO {index}({index}) VALUES ('rebuild')",
+    ]
+
+
+def drop_search_index(table: str, index: str, column: str) -> list[str]:
+    return [
+        f"DROP TRIGGER IF EXISTS {index}_insert",
+        f"DROP TRIGGER IF EXISTS {index}_delete",
+        f"DROP TRIGGER IF EXISTS {index}_update",
+        f"DROP TABLE IF EXISTS {index}",
+    ]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispotify', '0003_partitioned_catalog'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            create_search_index(*search_index),
+            reverse_sql=drop_search_index(*search_index),
+        )
+        for search_index in SEARCH_INDEXES
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 5.1.3 on 2026-10-19 01:35
+
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Listing rows as `dispotify.projection` built them when this migration was
+# written, with the historical models only.
+SONG_FIELDS = ["id", "title", "duration_seconds", "bitrate", "extension", "version"]
+
+
+def song_rows(apps, song_ids):
+    Song = apps.get_model("dispotify", "Song")
+    Album = apps.get_model("dispotify", "Album")
+    Artist = apps.get_model("dispotify", "Artist")
+
+    songs = list(
+        Song.objects.filter(id__in=song_ids).values(*SONG_FIELDS, "album_id")
+    )
+
+    song_artists = defaultdict(list)
+    for song_id, artist_id in (
+        Song.artist.through.objects.filter(song_id__in=song_ids)
+        .order_by("id")
+        .values_list("song_id", "artist_id")
+    ):
+        song_artists[song_id].append(artist_id)
+
+    album_names = dict(
+        Album.objects.filter(
+            id__in={song["album_id"] for song in songs if song["album_id"]}
+        ).values_list("id", "name")
+    )
+    artist_names = dict(
+        Artist.objects.filter(
+            id__in={artist_id for ids in song_artists.values() for artist_id in ids}
+        ).values_list("id", "name")
+    )
+
+    return {
+        song["id"]: {
+            "id": song["id"],
+            "title": song["title"],
+            "album": song["album_id"],
+            "artist": song_artists[song["id"]],
+            "album_name": album_names.get(song["album_id"]),
+            "artist_names": sorted(
+                (
+                    artist_names[artist_id]
+                    for artist_id in song_artists[song["id"]]
+                    if artist_id in artist_names
+                ),
+                reverse=True,
+            ),
+            **{field: song[field] for field in SONG_FIELDS[2:]},
+        }
+        for song in songs
+    }
+
+
+def fill_song_listings(apps, schema_editor):
+    Song = apps.get_model("dispotify", "Song")
+    SongListing = apps.get_model("dispotify", "SongListing")
+    song_ids = list(Song.objects.values_list("id", flat=True))
+
+    for start in range(0, len(song_ids), 500):
+        rows = song_rows(apps, song_ids[start : start + 500])
+        SongListing.objects.bulk_create(
+            [SongListing(song_id=song_id, row=row) for song_id, row in rows.items()]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispotify', '0004_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SongListing',
+            fields=[
+                ('song', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='listing', serialize=False, to='dispotify.song')),
+                ('row', models.JSONField()),
+            ],
+        ),
+        migrations.RunPython(fill_song_listings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.3 on 2026-10-19 01:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispotify', '0005_song_listing'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['author', 'date', '-id'], name='album_author_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['date', 'id'], name='album_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['name', 'id'], name='album_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='artist',
+            index=models.Index(fields=['name', '-id'], name='artist_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(fields=['title', '-id'], name='song_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(fields=['album', 'title', '-id'], name='song_album_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(fields=['duration_seconds', 'id'], name='song_duration_idx'),
+        ),
+    ]
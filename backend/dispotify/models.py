@@ -3,36 +3,69 @@ from django.db import models
 class Artist(models.Model):
     id = models.CharField(max_length=100, primary_key=True)
     name = models.CharField(max_length=100)
+    version = models.BigIntegerField(default=0)
 
     def __str__(self) -> str:
         return f'<artist_id={self.id} | {self.name}>'
     
     class Meta:
         ordering = ['-name']
+        # Lists sort by the ordering and then by ascending id (see
+        # `KeysetPagination`), which SQLite reads backwards on these indexes.
+        indexes = [models.Index(fields=['name', '-id'], name='artist_name_idx')]
 
+# Rows are partitioned by id across the ring (see `RowKey`), so the rows a
+# foreign key points to may be stored in another partition: no constraints.
 class Album(models.Model):
     id = models.CharField(max_length=100, primary_key=True)
     name = models.CharField(max_length=100)
     date = models.DateField()
-    author = models.ForeignKey(to=Artist, on_delete=models.CASCADE)
+    author = models.ForeignKey(to=Artist, on_delete=models.CASCADE, db_constraint=False)
+    version = models.BigIntegerField(default=0)
 
     def __str__(self) -> str:
         return f'<album_id={self.id} | {self.name} | {self.date}>'
 
     class Meta:
         ordering = ['-author', '-date']
+        indexes = [
+            models.Index(fields=['author', 'date', '-id'], name='album_author_date_idx'),
+            models.Index(fields=['date', 'id'], name='album_date_idx'),
+            models.Index(fields=['name', 'id'], name='album_name_idx'),
+        ]
 
 class Song(models.Model):
     id = models.CharField(max_length=100, primary_key=True)
     title = models.CharField(max_length=100, null=True)
-    album = models.ForeignKey(to=Album, null=True, on_delete=models.CASCADE)
-    artist = models.ManyToManyField(to=Artist)
+    album = models.ForeignKey(
+        to=Album, null=True, on_delete=models.CASCADE, db_constraint=False
+    )
+    artist = models.ManyToManyField(to=Artist, db_constraint=False)
     duration_seconds = models.IntegerField(null=False)
     bitrate = models.IntegerField(null=False)
     extension = models.CharField(max_length=10)
+    version = models.BigIntegerField(default=0)
 
     def __str__(self) -> str:
         return f'<song_id={self.id} | {self.title}>'
     
     class Meta:
         ordering = ['-title']
+        indexes = [
+            models.Index(fields=['title', '-id'], name='song_title_idx'),
+            models.Index(fields=['album', 'title', '-id'], name='song_album_title_idx'),
+            models.Index(fields=['duration_seconds', 'id'], name='song_duration_idx'),
+        ]
+
+
+class SongListing(models.Model):
+    """
+    Read model of a song: its serialized row, with the names of its album and
+    artists, kept up to date on writes (see `dispotify.projection`) so lists
+    are served without a query per song.
+    """
+
+    song = models.OneToOneField(
+        to=Song, primary_key=True, related_name="listing", on_delete=models.CASCADE
+    )
+    row = models.JSONField()
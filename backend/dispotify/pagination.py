@@ -0,0 +1,171 @@
+import json
+import base64
+import binascii
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .search import SEARCH_RANK
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+MAX_RANKED_ROWS = 10 * MAX_PAGE_SIZE  # Deepest a ranked search may be paged
+
+# Sort values a cursor may hold, anything else is not a row's
+CURSOR_VALUE_TYPES = (str, int, float, type(None))
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over `view.get_ordering()` and then the id, the order
+    `chord_scatter` merges the partitions in. A cursor holds the sort values
+    of the last row of a page and the next page starts right after them, so
+    rows inserted meanwhile never shift or repeat the pages.
+
+    Ranked searches are paged by offset instead: a bm25 rank changes with the
+    rest of the corpus and differs between replicas, so it cannot mark where a
+    page ended. Every partition sends its rows up to the end of the page and
+    `chord_scatter` cuts the page out of the merged rows.
+
+    The body stays a plain list of rows, the next page is linked in the
+    `Link` header (RFC 8288) when there may be one.
+    """
+
+    cursor_query_param = "cursor"
+    limit_query_param = "limit"
+
+    def setup(self, request, view) -> None:
+        self.request = request
+        self.ordering: list[str] = view.get_ordering()
+        self.limit = self.get_limit(request)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        self.values = self.decode_cursor(cursor) if cursor else None
+        self.offset = self.values[0] if self.ranked and self.values else 0
+
+    @property
+    def ranked(self) -> bool:
+        return any(field.lstrip("-") == SEARCH_RANK for field in self.ordering)
+
+    def get_limit(self, request) -> int:
+        try:
+            limit = int(request.query_params[self.limit_query_param])
+        except (KeyError, ValueError):
+            return DEFAULT_PAGE_SIZE
+
+        return min(max(limit, 1), MAX_PAGE_SIZE)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.setup(request, view)
+
+        model = queryset.model
+        queryset = queryset.order_by(*order_by(model, self.ordering))
+
+        if self.ranked:
+            return list(queryset[: self.offset + self.limit])
+
+        if self.values:
+            queryset = queryset.filter(after_values(model, self.ordering, self.values))
+
+        return list(queryset[: self.limit])
+
+    def get_paginated_response(self, data):
+        return Response(data, headers=self.get_headers(data))
+
+    def get_headers(self, rows: list[dict]) -> dict:
+        if len(rows) < self.limit:
+            return {}
+
+        if self.ranked:
+            values = [self.offset + self.limit]
+
+            if values[0] >= MAX_RANKED_ROWS:
+                return {}
+        else:
+            last = rows[-1]
+            values = [last.get(field.lstrip("-")) for field in [*self.ordering, "id"]]
+
+        url = replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(values),
+        )
+        return {"Link": f'<{url}>; rel="next"'}
+
+    def encode_cursor(self, values: list) -> str:
+        cursor = json.dumps([self.ordering, values], separators=(",", ":"))
+        return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+    def decode_cursor(self, cursor: str) -> list:
+        try:
+            ordering, values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+            raise NotFound("Invalid cursor.")
+
+        # A cursor only makes sense for the ordering it was made with.
+        if (
+            ordering != self.ordering
+            or not isinstance(values, list)
+            or not all(isinstance(value, CURSOR_VALUE_TYPES) for value in values)
+        ):
+            raise NotFound("Invalid cursor.")
+
+        if self.ranked:
+            # The offset of the page
+            valid = (
+                len(values) == 1
+                and type(values[0]) is int
+                and 0 <= values[0] < MAX_RANKED_ROWS
+            )
+        else:
+            valid = len(values) == len(ordering) + 1
+
+        if not valid:
+            raise NotFound("Invalid cursor.")
+
+        return values
+
+
+def order_by(model, ordering: list[str]) -> list[str]:
+    return [
+        ("-" if field.startswith("-") else "") + column(model, field.lstrip("-"))
+        for field in [*ordering, "id"]
+    ]
+
+
+def column(model, name: str) -> str:
+    # Rows hold foreign keys as ids, so sort by the ids too. Names that are
+    # not fields are annotations, like the rank of a search.
+    try:
+        return model._meta.get_field(name).attname
+    except FieldDoesNotExist:
+        return name
+
+
+def after_values(model, ordering: list[str], values: list) -> Q:
+    """Rows after `values` by `ordering` and then id, NULLs first as in SQLite."""
+    after = Q(pk__in=[])
+    equal = Q()
+
+    for field, value in zip([*ordering, "id"], values):
+        name = column(model, field.lstrip("-"))
+        descending = field.startswith("-")
+
+        if value is None:
+            greater = Q(pk__in=[]) if descending else Q(**{f"{name}__isnull": False})
+            same = Q(**{f"{name}__isnull": True})
+        elif descending:
+            greater = Q(**{f"{name}__lt": value}) | Q(**{f"{name}__isnull": True})
+            same = Q(**{name: value})
+        else:
+            greater = Q(**{f"{name}__gt": value})
+            same = Q(**{name: value})
+
+        after |= equal & greater
+        equal &= same
+
+    return after
@@ -0,0 +1,108 @@
+import time
+import threading
+
+from urllib.parse import urlsplit
+
+import requests
+
+from requests.adapters import HTTPAdapter
+
+# Every forward between nodes goes through `peer_client`: one keep-alive
+# session per peer instead of a new TCP connection per request.
+PEER_CONNECT_TIMEOUT = 2.0  # seconds
+PEER_READ_TIMEOUT = 60.0  # seconds without receiving a byte
+PEER_POOL_SIZE = 16  # Connections kept open to each peer
+
+
+class PeerMetrics:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.total_seconds = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "avg_ms": round(1000 * self.total_seconds / self.requests, 2)
+            if self.requests
+            else None,
+        }
+
+
+class PeerClient:
+    def __init__(
+        self,
+        pool_size: int = PEER_POOL_SIZE,
+        timeout: tuple[float, float] = (PEER_CONNECT_TIMEOUT, PEER_READ_TIMEOUT),
+    ):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.sessions: dict[str, requests.Session] = {}
+        self.peer_metrics: dict[str, PeerMetrics] = {}
+
+    def session(self, peer: str) -> requests.Session:
+        with self.lock:
+            session = self.sessions.get(peer)
+
+            if session is None:
+                # No automatic retries: failed writes are handled by hinted handoff.
+                adapter = HTTPAdapter(
+                    pool_connections=1, pool_maxsize=self.pool_size, max_retries=0
+                )
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+
+                self.sessions[peer] = session
+                self.peer_metrics[peer] = PeerMetrics()
+
+            return session
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        peer = urlsplit(url).netloc
+        session = self.session(peer)
+        metrics = self.peer_metrics[peer]
+
+        kwargs.setdefault("timeout", self.timeout)
+        start = time.perf_counter()
+
+        try:
+            return session.request(method, url, **kwargs)
+        except requests.Timeout:
+            with self.lock:
+                metrics.timeouts += 1
+            raise
+        except requests.RequestException:
+            with self.lock:
+                metrics.errors += 1
+            raise
+        finally:
+            with self.lock:
+                metrics.requests += 1
+                metrics.total_seconds += time.perf_counter() - start
+
+    def metrics(self) -> dict:
+        with self.lock:
+            sessions = list(self.sessions.items())
+
+        result = {}
+
+        for peer, session in sessions:
+            peer_result = self.peer_metrics[peer].to_dict()
+
+            pools = session.get_adapter(f"http://{peer}").poolmanager.pools
+            peer_result["pool_size"] = self.pool_size
+            peer_result["connections_opened"] = sum(
+                pools[pool_key].num_connections for pool_key in pools.keys()
+            )
+
+            result[peer] = peer_result
+
+        return result
+
+
+peer_client = PeerClient()
@@ -0,0 +1,204 @@
+import os
+import json
+import logging
+
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.response import Response
+
+from chord.chord import (
+    FILE_REPLICATION_FACTOR,
+    METADATA_REPLICATION_FACTOR,
+    METADATA_WRITE_QUORUM,
+    ChordNode,
+    ChordNodeReference,
+)
+
+from .catalog import CATALOG_VERSION_HEADER, apply_catalog_batch
+from .decorators import forward_request_to_successor, send_to_replicants
+from .idempotency import IDEMPOTENCY_HEADER
+from .models import Song
+from .replication import write_behind
+from .routing import as_key, routing_cache
+from .seek import write_seek_table
+from .serializers import AUDIOS_PATH, SongSerializer, is_audio_id
+
+logger = logging.getLogger(__name__)
+
+
+def get_key_replicants(key: str, k: int) -> list[ChordNodeReference]:
+    node = ChordNode.get_instance()
+
+    assert node
+
+    data_id = int(as_key(key), 16) % (1 << node.id_bitlen)  # type: ignore
+
+    return routing_cache.replicas(data_id, k)
+
+
+def place_audio(
+    audio_id: str, source: bytes | str, idempotency_key: str | None = None
+) -> list[int]:
+    """
+    Stores the audio only on the FILE_REPLICATION_FACTOR nodes responsible for
+    `audio_id`. `source` is either the audio bytes or the path of a temporary
+    file holding them, which is moved into place if this node is a replica.
+    Retries pass the same `idempotency_key`, so replicas store it only once.
+
+    Returns the ids of the replicas that did not take the audio. The file is
+    only moved once every other replica has it, so a retry can push it again.
+    """
+    node = ChordNode.get_instance()
+
+    assert node
+
+    if not is_audio_id(audio_id):
+        raise ValueError(f"{audio_id!r} is not an audio id")
+
+    store_locally = False
+    failed = []
+
+    for rep in get_key_replicants(audio_id, FILE_REPLICATION_FACTOR):
+        if rep.node_id == node.node_id:
+            store_locally = True
+            continue
+
+        if isinstance(source, bytes):
+            response = push_audio(rep, audio_id, source, idempotency_key)
+        else:
+            with open(source, "rb") as audio_file:
+                response = push_audio(rep, audio_id, audio_file, idempotency_key)
+
+        if response.status_code >= 300:
+            logger.warning(
+                f"Could not store audio {audio_id} on node {rep.node_id}: "
+                f"{response.status_code}"
+            )
+            failed.append(rep.node_id)
+
+    if store_locally and not failed:
+        write_audio(audio_id, source)
+
+    return failed
+
+
+def push_audio(
+    rep: ChordNodeReference, audio_id: str, body, idempotency_key: str | None = None
+):
+    headers = {"Content-Type": "application/octet-stream"}
+    if idempotency_key:
+        headers[IDEMPOTENCY_HEADER] = idempotency_key
+
+    return forward_request_to_successor(
+        rep,
+        "PUT",
+        body,
+        headers,
+        reverse("audio_blob"),
+        {"audio_id": audio_id},
+    )
+
+
+def write_audio(audio_id: str, source: bytes | str) -> None:
+    file_path = os.path.realpath(f"{AUDIOS_PATH}/{audio_id}")
+
+    # Callers validate ids, this only makes sure nothing is written elsewhere
+    if os.path.dirname(file_path) != os.path.realpath(AUDIOS_PATH):
+        raise ValueError(f"{audio_id!r} is not an audio id")
+
+    if isinstance(source, bytes):
+        with open(file_path, "wb") as f:
+            f.write(source)
+    else:
+        os.replace(source, file_path)
+
+    write_seek_table(file_path)
+
+
+def create_song_metadata(
+    song_data: dict, version: int, idempotency_key: str
+) -> Response:
+    """
+    Creates the song row, without any audio, on the replicas of its partition.
+    Retries pass the same `version` and `idempotency_key`, so replicas that
+    already created the row answer as they did the first time.
+    """
+
+    def create_locally():
+        applied = Song.objects.filter(id=song_data["id"], version=version).first()
+        if applied is not None:
+            return Response(
+                SongSerializer(applied).data, status=status.HTTP_201_CREATED
+            )
+
+        serializer = SongSerializer(data=song_data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save(version=version)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    return write_behind(
+        get_key_replicants(as_key(song_data["id"]), METADATA_REPLICATION_FACTOR),
+        create_locally,
+        "POST",
+        json.dumps(song_data),
+        {
+            "Content-Type": "application/json",
+            CATALOG_VERSION_HEADER: str(version),
+            IDEMPOTENCY_HEADER: idempotency_key,
+        },
+        reverse("song-list"),
+        {},
+        batch_key="songs",
+        write_quorum=METADATA_WRITE_QUORUM,
+    )
+
+
+def send_catalog_batch(batch: dict, version: int, headers: dict, path: str) -> Response:
+    """
+    Splits a catalog batch by partition and applies every part on the
+    replicas of its partition. Answers with the total of rows applied, or
+    with the first part that failed.
+    """
+    parts: dict[tuple[int, ...], tuple[list[ChordNodeReference], dict]] = {}
+
+    for batch_key in ("artists", "albums", "songs"):
+        for row in batch.get(batch_key, []):
+            replicants = get_key_replicants(
+                as_key(row["id"]), METADATA_REPLICATION_FACTOR
+            )
+            _, part = parts.setdefault(
+                tuple(rep.node_id for rep in replicants), (replicants, {})
+            )
+            part.setdefault(batch_key, []).append(row)
+
+    idempotency_key = headers.get(IDEMPOTENCY_HEADER)
+    applied = {"artists": 0, "albums": 0, "songs": 0}
+
+    for index, (replicants, part) in enumerate(parts.values()):
+        part_headers = {
+            "Content-Type": "application/json",
+            CATALOG_VERSION_HEADER: str(version),
+        }
+        if idempotency_key:
+            # Each part is a different write on the nodes holding several of them.
+            part_headers[IDEMPOTENCY_HEADER] = f"{idempotency_key}:{index}"
+
+        response = send_to_replicants(
+            replicants,
+            lambda part=part: Response(
+                apply_catalog_batch(part, version), status=status.HTTP_201_CREATED
+            ),
+            "POST",
+            json.dumps(part),
+            part_headers,
+            path,
+            {},
+        )
+
+        if response.status_code >= 300:
+            return response
+
+        for batch_key, rows in part.items():
+            applied[batch_key] += len(rows)
+
+    return Response(applied, status=status.HTTP_201_CREATED)
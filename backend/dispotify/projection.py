@@ -0,0 +1,133 @@
+from collections import defaultdict
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+
+from .models import Album, Artist, Song, SongListing
+
+# Fields of a song listing row, in the order SongSerializer gives them
+SONG_FIELDS = ["id", "title", "duration_seconds", "bitrate", "extension", "version"]
+
+
+def song_rows(song_ids) -> dict[str, dict]:
+    """The listing rows of the songs, built in four queries however many they are."""
+    songs = list(
+        Song.objects.filter(id__in=song_ids).values(*SONG_FIELDS, "album_id")
+    )
+
+    song_artists = defaultdict(list)
+    for song_id, artist_id in (
+        Song.artist.through.objects.filter(song_id__in=song_ids)
+        .order_by("id")
+        .values_list("song_id", "artist_id")
+    ):
+        song_artists[song_id].append(artist_id)
+
+    # Albums and artists stored in other partitions have no name here, see
+    # `resolve_song_names`.
+    album_names = dict(
+        Album.objects.filter(
+            id__in={song["album_id"] for song in songs if song["album_id"]}
+        ).values_list("id", "name")
+    )
+    artist_names = dict(
+        Artist.objects.filter(
+            id__in={artist_id for ids in song_artists.values() for artist_id in ids}
+        ).values_list("id", "name")
+    )
+
+    rows = {}
+
+    for song in songs:
+        artist_ids = song_artists[song["id"]]
+
+        rows[song["id"]] = {
+            "id": song["id"],
+            "title": song["title"],
+            "album": song["album_id"],
+            "artist": artist_ids,
+            "album_name": album_names.get(song["album_id"]),
+            # Ordered as `Artist.Meta.ordering`
+            "artist_names": sorted(
+                (artist_names[a] for a in artist_ids if a in artist_names),
+                reverse=True,
+            ),
+            **{field: song[field] for field in SONG_FIELDS[2:]},
+        }
+
+    return rows
+
+
+def refresh_song_listings(song_ids) -> None:
+    song_ids = set(song_ids)
+    if not song_ids:
+        return
+
+    rows = song_rows(song_ids)
+
+    SongListing.objects.bulk_create(
+        [SongListing(song_id=song_id, row=row) for song_id, row in rows.items()],
+        update_conflicts=True,
+        unique_fields=["song"],
+        update_fields=["row"],
+    )
+
+
+def songs_of_albums(album_ids) -> set[str]:
+    return set(
+        Song.objects.filter(album_id__in=album_ids).values_list("id", flat=True)
+    )
+
+
+def songs_of_artists(artist_ids) -> set[str]:
+    return set(
+        Song.artist.through.objects.filter(artist_id__in=artist_ids).values_list(
+            "song_id", flat=True
+        )
+    )
+
+
+# Writes through the ORM keep the listings up to date with these signals.
+# Bulk writes send none, `apply_catalog_batch` refreshes the listings itself.
+
+
+def song_saved(sender, instance, **kwargs):
+    refresh_song_listings([instance.pk])
+
+
+def song_artists_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if not reverse:
+        refresh_song_listings([instance.pk])
+    elif pk_set:
+        refresh_song_listings(pk_set)
+    else:
+        # Cleared from the artist's side: the songs are unknown by now.
+        refresh_song_listings(getattr(instance, "_listing_songs", ()))
+
+
+def album_saved(sender, instance, **kwargs):
+    refresh_song_listings(songs_of_albums([instance.pk]))
+
+
+def artist_saved(sender, instance, **kwargs):
+    refresh_song_listings(songs_of_artists([instance.pk]))
+
+
+def artist_deleting(sender, instance, **kwargs):
+    # Its songs lose it before `artist_deleted` runs
+    instance._listing_songs = songs_of_artists([instance.pk])
+
+
+def artist_deleted(sender, instance, **kwargs):
+    refresh_song_listings(getattr(instance, "_listing_songs", ()))
+
+
+def connect_signals() -> None:
+    post_save.connect(song_saved, sender=Song)
+    m2m_changed.connect(song_artists_changed, sender=Song.artist.through)
+    post_save.connect(album_saved, sender=Album)
+    post_save.connect(artist_saved, sender=Artist)
+    pre_delete.connect(artist_deleting, sender=Artist)
+    post_delete.connect(artist_deleted, sender=Artist)
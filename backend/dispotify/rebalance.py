@@ -0,0 +1,263 @@
+import json
+import bisect
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.urls import reverse
+
+from chord.chord import METADATA_REPLICATION_FACTOR, ChordNode, ChordNodeReference
+
+from . import decorators
+from .catalog import CATALOG_BATCH_KEYS, catalog_revision
+from .models import Album, Artist, Song
+from .projection import (
+    refresh_song_listings,
+    song_rows,
+    songs_of_albums,
+    songs_of_artists,
+)
+from .routing import as_key, routing_cache
+
+logger = logging.getLogger(__name__)
+
+REBALANCE_BATCH_SIZE = 200  # Rows read, sent and dropped at a time
+
+
+class CatalogRebalancer:
+    """
+    Moves catalog rows when the ring changes (see `ChordNode.ring_signature`):
+    every row goes to the nodes that became its replicas, and a node drops the
+    rows it no longer replicates once their new replicas acknowledged them.
+    Each row is sent by the first of its previous replicas still in the ring,
+    or by the node dropping it. Rows only replace older versions (see
+    `apply_catalog_batch`), so sending one twice is harmless.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.node: ChordNode | None = None
+        self.signature: str | None = None
+        self.ring: list[int] | None = None  # Sorted node ids of the last run
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="rebalance"
+        )
+
+        self.rows_sent = 0
+        self.rows_dropped = 0
+
+    def watch(self, node: ChordNode) -> None:
+        self.node = node
+        node.stabilize_listeners.append(self.check)
+
+    def check(self) -> None:
+        # Runs on the chord event loop, the rebalance itself goes to a thread.
+        with self.lock:
+            if self.node is None or self.node.ring_signature == self.signature:
+                return
+            self.signature = self.node.ring_signature
+
+        self.executor.submit(self.run)
+
+    def run(self) -> None:
+        try:
+            nodes = {ref.node_id: ref for ref in routing_cache.nodes()}
+            ring = sorted(nodes)
+
+            if ring == self.ring:
+                return
+
+            complete = [
+                self.rebalance(model, self.ring, ring, nodes)
+                for model in (Artist, Album, Song)
+            ]
+
+            if all(complete):
+                self.ring = ring
+                logger.info(
+                    f"Catalog rebalanced over {len(ring)} nodes: {self.rows_sent} "
+                    f"rows sent and {self.rows_dropped} dropped so far"
+                )
+                return
+        except Exception:
+            logger.exception("Rebalancing the catalog failed")
+        finally:
+            connection.close()
+
+        # Tried again from the same ring on the next stabilization round
+        with self.lock:
+            self.signature = None
+
+    def rebalance(
+        self,
+        model,
+        before: list[int] | None,
+        after: list[int],
+        nodes: dict[int, ChordNodeReference],
+    ) -> bool:
+        """
+        Sends `model`'s rows to the replicas they gained going from the ring
+        `before` to `after` and drops the ones this node stopped replicating.
+        Without `before` (the first run) rows are only handed off and dropped.
+        Returns whether every row reached its new replicas.
+        """
+        node = ChordNode.get_instance()
+
+        assert node
+
+        ring_size = 1 << node.id_bitlen
+        last_id = ""
+        complete = True
+
+        while True:
+            ids = list(
+                model.objects.filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", flat=True)[:REBALANCE_BATCH_SIZE]
+            )
+            if not ids:
+                return complete
+            last_id = ids[-1]
+
+            targets: dict[str, list[int]] = {}
+            dropped = []
+
+            for row_id in ids:
+                data_id = int(as_key(row_id), 16) % ring_size  # type: ignore
+                replicas = ring_replicas(after, data_id, METADATA_REPLICATION_FACTOR)
+
+                if node.node_id not in replicas:
+                    targets[row_id] = replicas
+                    dropped.append(row_id)
+                elif before is not None:
+                    previous = ring_replicas(
+                        before, data_id, METADATA_REPLICATION_FACTOR
+                    )
+                    sender = next((n for n in previous if n in nodes), node.node_id)
+
+                    if sender == node.node_id:
+                        targets[row_id] = [n for n in replicas if n not in previous]
+
+            failed = self.send(model, targets, nodes)
+            self.drop(model, [row_id for row_id in dropped if row_id not in failed])
+            complete = complete and not failed
+
+    def send(
+        self,
+        model,
+        targets: dict[str, list[int]],
+        nodes: dict[int, ChordNodeReference],
+    ) -> set[str]:
+        """Sends every row to its target nodes, returns the ids some did not take."""
+        rows = catalog_rows(model, [row_id for row_id, to in targets.items() if to])
+
+        by_node: dict[int, list[str]] = {}
+        for row_id, node_ids in targets.items():
+            for node_id in node_ids:
+                by_node.setdefault(node_id, []).append(row_id)
+
+        failed = set()
+
+        for node_id, row_ids in by_node.items():
+            # Rows deleted meanwhile are gone for their new replicas too
+            batch = {CATALOG_BATCH_KEYS[model]: [rows[i] for i in row_ids if i in rows]}
+
+            # Not hinted: failed rows are sent again on the next round
+            try:
+                response = decorators.request_node(
+                    nodes[node_id],
+                    "POST",
+                    json.dumps(batch, cls=DjangoJSONEncoder),
+                    {"Content-Type": "application/json"},
+                    reverse("catalog_batch"),
+                    {},
+                )
+                response.close()
+            except requests.RequestException as e:
+                logger.warning(f"Could not send {len(row_ids)} rows to {node_id}: {e}")
+                failed.update(row_ids)
+                continue
+
+            if decorators.is_acknowledgement(response):  # type: ignore
+                self.rows_sent += len(row_ids)
+            else:
+                logger.warning(
+                    f"Node {node_id} did not take {len(row_ids)} rows: "
+                    f"{response.status_code}"
+                )
+                failed.update(row_ids)
+
+        return failed
+
+    def drop(self, model, row_ids: list[str]) -> None:
+        if not row_ids:
+            return
+
+        with transaction.atomic():
+            if model is Song:
+                # Along with their listings and artists
+                Song.objects.filter(id__in=row_ids).delete()
+            else:
+                # Songs kept here may still refer to these rows, so nothing
+                # cascades: their names are looked up elsewhere from now on,
+                # see `resolve_song_names`.
+                songs = (
+                    songs_of_artists(row_ids)
+                    if model is Artist
+                    else songs_of_albums(row_ids)
+                )
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f"DELETE FROM {model._meta.db_table} WHERE id IN "
+                        f"({', '.join(['%s'] * len(row_ids))})",
+                        row_ids,
+                    )
+                refresh_song_listings(songs)
+
+            catalog_revision.bump()
+
+        self.rows_dropped += len(row_ids)
+
+
+catalog_rebalancer = CatalogRebalancer()
+
+
+def ring_replicas(ring: list[int], data_id: int, k: int) -> list[int]:
+    """The `k` nodes of the sorted `ring` holding `data_id`, its successor first."""
+    if not ring:
+        return []
+
+    start = bisect.bisect_left(ring, data_id)
+    return [ring[(start + i) % len(ring)] for i in range(min(k, len(ring)))]
+
+
+def catalog_rows(model, row_ids: list[str]) -> dict[str, dict]:
+    """The rows as `apply_catalog_batch` takes them."""
+    if model is Song:
+        return song_rows(row_ids)
+
+    if model is Album:
+        albums = {}
+
+        # Unordered: the default ordering joins the authors, which may be elsewhere
+        for album in (
+            Album.objects.filter(id__in=row_ids)
+            .order_by()
+            .values("id", "name", "date", "author_id", "version")
+        ):
+            album["author"] = album.pop("author_id")
+            albums[album["id"]] = album
+
+        return albums
+
+    return {
+        artist["id"]: artist
+        for artist in Artist.objects.filter(id__in=row_ids).values(
+            "id", "name", "version"
+        )
+    }
@@ -0,0 +1,250 @@
+import json
+import time
+import logging
+import threading
+
+from dataclasses import dataclass, field
+
+from django.db import connection
+from django.urls import reverse
+
+from chord.chord import ChordNode, ChordNodeReference
+
+from . import decorators, hints
+from .catalog import apply_catalog_batch
+
+logger = logging.getLogger(__name__)
+
+# A destination's pending mutations are sent once they reach the batch size
+# or the oldest of them waited for the flush interval.
+REPLICATION_BATCH_SIZE = 200
+REPLICATION_FLUSH_INTERVAL = 0.5  # seconds
+# Failed batches are sent again with the destination's next batch, and after
+# this many attempts left to hinted handoff.
+REPLICATION_MAX_ATTEMPTS = 3
+
+
+@dataclass
+class PendingBatch:
+    target: ChordNodeReference
+    rows: dict[str, dict[str, dict]] = field(default_factory=dict)
+    count: int = 0
+    since: float = field(default_factory=time.monotonic)
+    attempts: int = 0
+
+    def add(self, batch_key: str, row: dict) -> None:
+        rows = self.rows.setdefault(batch_key, {})
+        current = rows.get(row["id"])
+
+        if current is None:
+            self.count += 1
+        elif current.get("version", 0) > row.get("version", 0):
+            return
+
+        rows[row["id"]] = row
+
+    def to_batch(self) -> dict:
+        return {key: list(rows.values()) for key, rows in self.rows.items()}
+
+
+class ReplicationChannel:
+    """
+    Write-behind replication of catalog mutations: rows acknowledged by the
+    synchronous replicas are queued per destination node, coalesced (newest
+    version of each row wins) and sent as one catalog batch, which the
+    receiver applies in a single transaction.
+    """
+
+    def __init__(self):
+        self.lock = threading.Condition()
+        self.pending: dict[int, PendingBatch] = {}
+        self.sending: set[int] = set()
+        self.flusher: threading.Thread | None = None
+
+        self.batches_sent = 0
+        self.rows_sent = 0
+
+    def enqueue(
+        self, targets: list[ChordNodeReference], batch_key: str, row: dict
+    ) -> None:
+        with self.lock:
+            for target in targets:
+                pending = self.pending.get(target.node_id)
+                if pending is None:
+                    pending = self.pending[target.node_id] = PendingBatch(target)
+
+                pending.add(batch_key, row)
+
+                if pending.count >= REPLICATION_BATCH_SIZE:
+                    self.lock.notify()
+
+            if self.flusher is None:
+                self.flusher = threading.Thread(
+                    target=self.run, name="replication", daemon=True
+                )
+                self.flusher.start()
+
+    def run(self) -> None:
+        while True:
+            with self.lock:
+                self.lock.wait(REPLICATION_FLUSH_INTERVAL / 2)
+                due = self.take_due_batches()
+
+            for pending in due:
+                decorators.replica_executor.submit(self.send, pending)
+
+    def take_due_batches(self, force: bool = False) -> list[PendingBatch]:
+        now = time.monotonic()
+        due = []
+
+        for node_id, pending in list(self.pending.items()):
+            if node_id in self.sending:
+                continue  # Keeps each destination's batches in order
+
+            if (
+                force
+                or pending.count >= REPLICATION_BATCH_SIZE
+                or now - pending.since >= REPLICATION_FLUSH_INTERVAL
+            ):
+                due.append(self.pending.pop(node_id))
+                self.sending.add(node_id)
+
+        return due
+
+    def send(self, pending: PendingBatch) -> None:
+        node = ChordNode.get_instance()
+
+        assert node
+
+        batch = pending.to_batch()
+        sent = False
+
+        try:
+            if pending.target.node_id == node.node_id:
+                apply_catalog_batch(batch)
+                sent = True
+            else:
+                response = decorators.forward_request_to_successor(
+                    pending.target,
+                    "POST",
+                    json.dumps(batch),
+                    {"Content-Type": "application/json"},
+                    reverse("catalog_batch"),
+                    {},
+                )
+                # Unreachable replicas get the batch through hinted handoff
+                sent = decorators.is_acknowledgement(response) or (
+                    response.status_code == 503
+                )
+
+                if 400 <= response.status_code < 500:
+                    # Rejected, sending it again would not change that
+                    sent = True
+                    logger.error(
+                        f"Replication batch to node {pending.target.node_id} "
+                        f"rejected: {response.status_code}"
+                    )
+        except Exception:
+            logger.exception(
+                f"Replication batch to node {pending.target.node_id} failed"
+            )
+        finally:
+            connection.close()
+
+            with self.lock:
+                self.sending.discard(pending.target.node_id)
+
+                if sent:
+                    self.batches_sent += 1
+                    self.rows_sent += pending.count
+                else:
+                    self.retry(pending)
+
+    def retry(self, pending: PendingBatch) -> None:
+        attempts = pending.attempts + 1
+
+        if attempts < REPLICATION_MAX_ATTEMPTS:
+            # Merged with the rows queued meanwhile, the newest version wins
+            current = self.pending.get(pending.target.node_id)
+            if current is None:
+                current = self.pending[pending.target.node_id] = PendingBatch(
+                    pending.target
+                )
+
+            for batch_key, rows in pending.rows.items():
+                for row in rows.values():
+                    current.add(batch_key, row)
+
+            current.attempts = max(current.attempts, attempts)
+            return
+
+        node = ChordNode.get_instance()
+
+        if (
+            node is not None
+            and pending.target.node_id != node.node_id
+            and hints.hint_queue.add(
+                pending.target,
+                "POST",
+                json.dumps(pending.to_batch()),
+                {"Content-Type": "application/json"},
+                reverse("catalog_batch"),
+                {},
+            )
+        ):
+            return
+
+        logger.error(
+            f"Dropped replication batch of {pending.count} rows to node "
+            f"{pending.target.node_id} after {attempts} attempts"
+        )
+
+    def flush(self) -> None:
+        """Sends every pending batch now and waits for them."""
+        with self.lock:
+            due = self.take_due_batches(force=True)
+
+        for pending in due:
+            self.send(pending)
+
+
+replication_channel = ReplicationChannel()
+
+
+def write_behind(
+    replicants: list[ChordNodeReference],
+    serve_locally,
+    method: str | None,
+    body,
+    headers: dict,
+    path: str,
+    params,
+    batch_key: str,
+    write_quorum: int | None = None,
+):
+    """
+    Applies a catalog create on the first `write_quorum` replicas (only the
+    primary by default) before answering, and queues the created row for the
+    other replicas on the replication channel.
+    """
+    synchronous = replicants[: write_quorum or 1]
+
+    response = decorators.send_to_replicants(
+        synchronous,
+        serve_locally,
+        method,
+        body,
+        headers,
+        path,
+        params,
+        write_quorum=len(synchronous),
+    )
+
+    row = decorators.response_data(response)
+
+    if decorators.is_acknowledgement(response) and isinstance(row, dict):
+        replication_channel.enqueue(
+            replicants[len(synchronous) :], batch_key, dict(row)
+        )
+
+    return response
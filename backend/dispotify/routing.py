@@ -0,0 +1,204 @@
+import time
+import threading
+
+from dataclasses import dataclass, field
+
+from asgiref.sync import async_to_sync
+
+from chord.chord import ChordNode, ChordNodeReference, hash_string, is_between
+
+# Safety net for ring changes the signature and failed forwards miss
+ROUTE_TTL = 30  # seconds
+
+RING_WALK_LIMIT = 256  # Nodes visited at most when listing the ring
+
+
+@dataclass
+class Route:
+    start: int  # First id owned by `succ`
+    succ: ChordNodeReference
+    replicants: dict[int, list[ChordNodeReference]] = field(default_factory=dict)
+    expires: float = 0.0
+
+    def owns(self, data_id: int) -> bool:
+        return is_between(data_id, self.start, self.succ.node_id)
+
+
+class RoutingCache:
+    """
+    Remembers which node owns each id range, (predecessor, successor], and
+    the replica sets starting at it, so routing a key the ring already
+    resolved needs no lookups or pings. Everything is dropped when the ring
+    signature changes, and a node's routes are dropped when it fails.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes: dict[int, Route] = {}
+        self.ring: list[ChordNodeReference] = []
+        self.ring_expires = 0.0
+        self.signature: str | None = None
+
+    def check_signature(self, node: ChordNode) -> None:
+        # Must hold `self.lock`
+        if node.ring_signature != self.signature:
+            self.routes.clear()
+            self.ring = []
+            self.signature = node.ring_signature
+
+    def route(
+        self, data_id: int, k: int = 1
+    ) -> tuple[ChordNodeReference, list[ChordNodeReference]]:
+        """Returns the owner of `data_id` and the `k` replicas starting at it."""
+        node = ChordNode.get_instance()
+
+        assert node
+
+        now = time.monotonic()
+
+        with self.lock:
+            self.check_signature(node)
+
+            for route in self.routes.values():
+                fresh = route.expires > now and k in route.replicants
+                if fresh and route.owns(data_id):
+                    return route.succ, route.replicants[k]
+
+            signature = self.signature
+
+        succ = async_to_sync(node.find_successor)(data_id)
+        replicants = async_to_sync(node.get_replicants)(k, succ)
+
+        if succ.node_id == node.node_id:
+            pred = node.predecessor
+        else:
+            ping = async_to_sync(node.ping_node)(succ)
+            if ping is None:
+                # The owner is not answering, do not remember it.
+                return succ, replicants
+            pred, _ = ping
+
+        start = (pred.node_id + 1) % (1 << node.id_bitlen)
+
+        with self.lock:
+            if signature == self.signature:
+                route = self.routes.get(succ.node_id)
+
+                if route is None or route.start != start or route.expires <= now:
+                    route = Route(start, succ, expires=now + ROUTE_TTL)
+                    self.routes[succ.node_id] = route
+
+                route.replicants[k] = replicants
+
+        return succ, replicants
+
+    def successor(self, data_id: int) -> ChordNodeReference:
+        return self.route(data_id)[0]
+
+    def replicas(self, data_id: int, k: int) -> list[ChordNodeReference]:
+        return self.route(data_id, k)[1]
+
+    def nodes(self) -> list[ChordNodeReference]:
+        """Every node in the ring, found by walking the successors from this one."""
+        node = ChordNode.get_instance()
+
+        assert node
+
+        now = time.monotonic()
+
+        with self.lock:
+            self.check_signature(node)
+
+            if self.ring and self.ring_expires > now:
+                return self.ring
+
+            signature = self.signature
+
+        ring = [node.auto_ref]
+        current = node.succesor
+
+        while current.node_id != node.node_id and len(ring) < RING_WALK_LIMIT:
+            ring.append(current)
+
+            ping = async_to_sync(node.ping_node)(current)
+            if ping is None:
+                break  # The nodes past it are reached again once the ring heals
+            _, current = ping
+
+        with self.lock:
+            if signature == self.signature:
+                self.ring = ring
+                self.ring_expires = now + ROUTE_TTL
+
+        return ring
+
+    def forget_node(self, node_id: int) -> None:
+        """Drops every route through `node_id`, e.g. after a forward to it failed."""
+        with self.lock:
+            if any(rep.node_id == node_id for rep in self.ring):
+                self.ring = []
+
+            for succ_id, route in list(self.routes.items()):
+                if succ_id == node_id or any(
+                    rep.node_id == node_id
+                    for replicants in route.replicants.values()
+                    for rep in replicants
+                ):
+                    del self.routes[succ_id]
+
+
+routing_cache = RoutingCache()
+
+
+class RoutingKey:
+    """
+    How a view's requests map to a ring key (a hex string), declared per view
+    in `chord_distribute`. Keys come from small, already parsed parts of the
+    request, never from the whole body. Returns None if the key is missing.
+    """
+
+    def __call__(self, request, kwargs: dict) -> str | None:
+        raise NotImplementedError
+
+
+class QueryParamKey(RoutingKey):
+    def __init__(self, param: str):
+        self.param = param
+
+    def __call__(self, request, kwargs: dict) -> str | None:
+        return as_key(request.GET.get(self.param))
+
+
+class RowKey(RoutingKey):
+    """
+    Catalog rows are partitioned by id: the `id` in the path, else the one in
+    the body, else the one `default_id` derives from the body. Only creates
+    read the body, which DRF parses once and keeps for the view.
+    """
+
+    def __init__(self, default_id=None):
+        self.default_id = default_id
+
+    def __call__(self, request, kwargs: dict) -> str | None:
+        row_id = kwargs.get("id")
+
+        if row_id is None and hasattr(request.data, "get"):
+            row_id = request.data.get("id")
+
+            if not row_id and self.default_id is not None:
+                row_id = self.default_id(request.data)
+
+        return as_key(row_id)
+
+
+def as_key(value: str | None) -> str | None:
+    """Ids are already hex hashes, anything else is hashed."""
+    if not value:
+        return None
+
+    try:
+        int(value, 16)
+        return value
+    except ValueError:
+        return hash_string(value)
+
@@ -0,0 +1,191 @@
+from concurrent.futures import as_completed
+
+from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+
+from chord.chord import ChordNode, ChordNodeReference
+
+from . import decorators
+from .models import Album, Artist
+from .routing import routing_cache
+
+SCATTER_STATUS_HEADER = "X-Scatter-Status"
+LOOKUP_BATCH_SIZE = 200  # Ids per name lookup, within the page size limit
+
+
+def scatter_gather(
+    nodes: list[ChordNodeReference],
+    serve_locally,
+    headers: dict,
+    path: str,
+    params,
+    ordering: list[str],
+    limit: int | None = None,
+    offset: int = 0,
+    resolve=None,
+    page_headers=None,
+) -> HttpResponse:
+    """
+    Runs a catalog list or search on every node of the ring at once and merges
+    the answers: the newest version of each row (replicas answer the same rows),
+    sorted by `ordering`, skipping `offset` rows and cut at `limit`. Every node
+    already filtered, sorted and limited its own rows, so none sends more than
+    `offset + limit` of them.
+    Nodes that fail are skipped, their partitions are also held by replicas.
+    """
+    responses = gather(nodes, serve_locally, headers, path, params)
+
+    rows = newest_rows(responses)
+
+    if rows is None:
+        return HttpResponse("No partition answered.", status=503)
+
+    merged = sort_rows(list(rows.values()), ordering)[offset:][:limit]
+
+    if resolve is not None:
+        resolve(merged)
+
+    response = JsonResponse(merged, safe=False)
+
+    for header, value in (page_headers(merged) if page_headers else {}).items():
+        response[header] = value
+
+    response[SCATTER_STATUS_HEADER] = ", ".join(
+        f"{rep.node_id}={response.status_code}" for rep, response in responses
+    )
+
+    return response
+
+
+def gather(
+    nodes: list[ChordNodeReference], serve_locally, headers: dict, path: str, params
+) -> list[tuple[ChordNodeReference, HttpResponse]]:
+    node = ChordNode.get_instance()
+
+    assert node
+
+    futures = {
+        decorators.replica_executor.submit(
+            decorators.forward_request_to_successor,
+            rep,
+            "GET",
+            None,
+            headers,
+            path,
+            params,
+        ): rep
+        for rep in nodes
+        if rep.node_id != node.node_id
+    }
+
+    responses = [(rep, serve_locally()) for rep in nodes if rep.node_id == node.node_id]
+    responses += [(futures[future], future.result()) for future in as_completed(futures)]
+
+    return responses
+
+
+def newest_rows(
+    responses: list[tuple[ChordNodeReference, HttpResponse]],
+) -> dict[str, dict] | None:
+    """The newest version of every row answered, None if no node answered."""
+    rows: dict[str, dict] | None = None
+
+    for _, response in responses:
+        data = decorators.response_data(response)
+        if not isinstance(data, list):
+            continue
+
+        rows = rows if rows is not None else {}
+
+        for row in data:
+            current = rows.get(row["id"])
+            if current is None or row.get("version", 0) > current.get("version", 0):
+                rows[row["id"]] = row
+
+    return rows
+
+
+def sort_rows(rows: list[dict], ordering: list[str]) -> list[dict]:
+    # Same order SQLite gives: NULLs first, ties broken by id.
+    for field in reversed([*ordering, "id"]):
+        name = field.lstrip("-")
+        rows.sort(key=lambda row: null_first(row.get(name)), reverse=field[0] == "-")
+
+    return rows
+
+
+def null_first(value) -> tuple:
+    return (False, 0) if value is None else (True, value)
+
+
+def resolve_song_names(songs: list[dict]) -> None:
+    """
+    A partition knows the names of the albums and artists it holds, songs
+    whose album or artists live in other partitions get them looked up here.
+    """
+    incomplete_albums = [
+        song for song in songs if song.get("album") and song.get("album_name") is None
+    ]
+    incomplete_artists = [
+        song
+        for song in songs
+        if len(song.get("artist_names") or []) < len(song.get("artist") or [])
+    ]
+
+    if not incomplete_albums and not incomplete_artists:
+        return
+
+    album_names = lookup_names(
+        Album, "album-list", {song["album"] for song in incomplete_albums}
+    )
+    artist_names = lookup_names(
+        Artist,
+        "artist-list",
+        {artist_id for song in incomplete_artists for artist_id in song["artist"]},
+    )
+
+    for song in incomplete_albums:
+        song["album_name"] = album_names.get(song["album"])
+
+    for song in incomplete_artists:
+        # Ordered as `Artist.Meta.ordering`
+        song["artist_names"] = sorted(
+            (
+                artist_names[artist_id]
+                for artist_id in song["artist"]
+                if artist_id in artist_names
+            ),
+            reverse=True,
+        )
+
+
+def lookup_names(model, url_name: str, ids: set[str]) -> dict[str, str]:
+    names = {}
+    ids_list = sorted(ids)
+
+    # Every node answers at most `limit` rows, see `KeysetPagination`
+    for start in range(0, len(ids_list), LOOKUP_BATCH_SIZE):
+        batch = ids_list[start : start + LOOKUP_BATCH_SIZE]
+
+        def read_locally(batch=batch):
+            # Unordered: sorting albums by author would join away the albums
+            # whose author lives in another partition
+            rows = (
+                model.objects.filter(id__in=batch)
+                .order_by()
+                .values("id", "name", "version")
+            )
+            return JsonResponse(list(rows), safe=False)
+
+        responses = gather(
+            routing_cache.nodes(),
+            read_locally,
+            {},
+            reverse(url_name),
+            {"id": batch, "limit": len(batch)},
+        )
+
+        rows = newest_rows(responses) or {}
+        names.update({row_id: row["name"] for row_id, row in rows.items()})
+
+    return names
@@ -0,0 +1,46 @@
+import re
+
+from django.db.models.expressions import RawSQL
+
+from .models import Album, Artist, Song
+
+# FTS5 index of each model's searchable column, kept in sync by the triggers
+# of migration 0004 (they also catch the bulk writes of catalog batches).
+SEARCH_INDEXES = {
+    Artist: ("dispotify_artist_fts", "name"),
+    Album: ("dispotify_album_fts", "name"),
+    Song: ("dispotify_song_fts", "title"),
+}
+
+SEARCH_RANK = "search_rank"
+
+
+def match_query(text: str) -> str | None:
+    """Every word of `text` must start a word of the name, in any order."""
+    words = re.findall(r"\w+", text.lower())
+    return " ".join(f'"{word}"*' for word in words) or None
+
+
+def search(queryset, text: str):
+    """
+    Rows of `queryset` matching `text` (see `match_query`), annotated with
+    their SEARCH_RANK: the bm25 score of the match, lower is better.
+    """
+    query = match_query(text)
+
+    if query is None:
+        # Only an empty name lists everything, punctuation alone matches nothing
+        return queryset if not text else queryset.none()
+
+    table = queryset.model._meta.db_table
+    index, _ = SEARCH_INDEXES[queryset.model]
+
+    return queryset.extra(
+        tables=[index],
+        where=[f"{index} MATCH %s", f"{index}.rowid = {table}.rowid"],
+        params=[query],
+    ).annotate(**{SEARCH_RANK: RawSQL(f"{index}.rank", ())})
+
+
+def is_search(text: str | None) -> bool:
+    return bool(text) and match_query(text) is not None  # type: ignore
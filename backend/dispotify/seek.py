@@ -0,0 +1,168 @@
+import os
+import math
+import mmap
+import array
+import struct
+import tempfile
+
+# Every audio file gets a `<audio_id>.seek` table next to it with the byte
+# offset of the first MP3 frame starting at or after each SEEK_INTERVAL_MS.
+SEEK_TABLE_SUFFIX = ".seek"
+SEEK_INTERVAL_MS = 1000
+SEEK_TABLE_MAGIC = b"DSK1"
+SEEK_TABLE_HEADER = struct.Struct("<4sII")  # magic, interval in ms, entry count
+
+# Bitrates in kbps, indexed by the 4 bit field of the frame header
+MPEG1_BITRATES = {
+    1: (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    2: (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    3: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+}
+MPEG2_BITRATES = {
+    1: (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    3: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+SAMPLE_RATES = {
+    3: (44100, 48000, 32000),  # MPEG 1
+    2: (22050, 24000, 16000),  # MPEG 2
+    0: (11025, 12000, 8000),  # MPEG 2.5
+}
+
+
+def seek_table_path(filename: str) -> str:
+    return f"{filename}{SEEK_TABLE_SUFFIX}"
+
+
+def parse_frame_header(header: bytes) -> tuple[int, int, int] | None:
+    """Returns (frame length in bytes, samples, sample rate) or None if invalid."""
+    b1, b2 = header[1], header[2]
+
+    if header[0] != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+
+    version = (b1 >> 3) & 0b11
+    layer = 4 - ((b1 >> 1) & 0b11)  # 1, 2 or 3; 4 is reserved
+    bitrate_index = b2 >> 4
+    sample_rate_index = (b2 >> 2) & 0b11
+    padding = (b2 >> 1) & 0b1
+
+    if version == 1 or layer == 4 or sample_rate_index == 3:
+        return None
+    if bitrate_index in (0, 15):  # free format and bad bitrates
+        return None
+
+    bitrates = MPEG1_BITRATES if version == 3 else MPEG2_BITRATES
+    bitrate = bitrates[layer][bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version][sample_rate_index]
+
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4, 384, sample_rate
+
+    if layer == 3 and version != 3:
+        return 72 * bitrate // sample_rate + padding, 576, sample_rate
+
+    return 144 * bitrate // sample_rate + padding, 1152, sample_rate
+
+
+def skip_id3v2(data) -> int:
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+
+    size = 0
+    for byte in data[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def build_seek_table(filename: str, interval_ms: int = SEEK_INTERVAL_MS) -> array.array:
+    """Scans the MP3 frames of `filename`, resyncing on garbage between them."""
+    offsets = array.array("I")
+
+    with open(filename, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return offsets
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            size = len(data)
+            position = skip_id3v2(data)
+            elapsed_ms = 0.0
+
+            while position + 4 <= size:
+                frame = parse_frame_header(data[position : position + 4])
+
+                if frame is None:
+                    position += 1
+                    continue
+
+                length, samples, sample_rate = frame
+
+                while elapsed_ms >= len(offsets) * interval_ms:
+                    offsets.append(position)
+
+                elapsed_ms += samples * 1000 / sample_rate
+                position += length
+
+    return offsets
+
+
+def write_seek_table(filename: str) -> array.array:
+    offsets = build_seek_table(filename)
+
+    directory = os.path.dirname(filename) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".seek-")
+
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(SEEK_TABLE_HEADER.pack(SEEK_TABLE_MAGIC, SEEK_INTERVAL_MS, len(offsets)))
+            offsets.tofile(f)
+        os.replace(tmp_path, seek_table_path(filename))
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    return offsets
+
+
+def read_seek_table(filename: str) -> tuple[int, array.array] | None:
+    try:
+        with open(seek_table_path(filename), "rb") as f:
+            magic, interval_ms, count = SEEK_TABLE_HEADER.unpack(
+                f.read(SEEK_TABLE_HEADER.size)
+            )
+            if magic != SEEK_TABLE_MAGIC:
+                return None
+
+            offsets = array.array("I")
+            offsets.fromfile(f, count)
+            return interval_ms, offsets
+    except (FileNotFoundError, struct.error, EOFError):
+        return None
+
+
+def seek_offset(filename: str, seconds: float) -> tuple[int, float]:
+    """
+    Returns the byte offset of the frame to start streaming from so playback
+    begins at or just before `seconds`, and the time that frame starts at.
+    Files stored before seek tables existed get theirs built on first use.
+    """
+    if not math.isfinite(seconds) or seconds < 0:
+        raise ValueError(f"Cannot seek to {seconds} seconds")
+
+    table = read_seek_table(filename)
+    stale = table is not None and os.path.getmtime(
+        seek_table_path(filename)
+    ) < os.path.getmtime(filename)
+
+    if table is None or stale:
+        table = SEEK_INTERVAL_MS, write_seek_table(filename)
+
+    interval_ms, offsets = table
+
+    if not offsets or seconds == 0:
+        return 0, 0.0
+
+    index = min(int(seconds * 1000) // interval_ms, len(offsets) - 1)
+    return offsets[index], index * interval_ms / 1000
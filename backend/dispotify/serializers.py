@@ -1,16 +1,36 @@
 import io
+import os
+import math
 import base64
 
+from mutagen import MutagenError
 from mutagen.mp3 import MP3
 from dataclasses import dataclass
 from rest_framework import serializers
-from asgiref.sync import async_to_sync
 
-from .models import Album, Artist, Song
+from .models import Album, Artist, Song, SongListing
+from .catalog import default_album_id, default_song_id
+from .projection import song_rows
+from .search import SEARCH_RANK
+from .chunk_cache import PREFETCH_CHUNKS, READAHEAD_CHUNKS, chunk_cache
+from .seek import seek_offset, write_seek_table
+from .routing import as_key, routing_cache
 from chord.chord import ChordNode, hash_string
 
 
-CHUNK_SIZE = 1 << 15  # 32kB
+AUDIOS_PATH = "/app/data/audios"
+
+CHUNK_SIZE = 1 << 15  # 32kB, used when the client does not ask for a size
+
+# Limits enforced on the chunk and batch sizes requested by clients
+MIN_CHUNK_SIZE = 1 << 12  # 4kB
+MAX_CHUNK_SIZE = 1 << 20  # 1MB
+MAX_CHUNK_COUNT = 64
+MAX_BATCH_SIZE = 1 << 23  # 8MB of audio per response
+
+# Playback time covered by a suggested chunk and by a suggested batch
+TARGET_CHUNK_SECONDS = 4
+TARGET_BATCH_SECONDS = 60
 
 
 @dataclass
@@ -24,78 +44,198 @@ class AudioMetadata:
 
 
 class AudioStreamerSerializer(serializers.Serializer):
-    chunk_index = serializers.IntegerField()
-    chunk_count = serializers.IntegerField()
+    chunk_index = serializers.IntegerField(default=0, min_value=0)
+    chunk_count = serializers.IntegerField(default=1, min_value=0)
+    chunk_size = serializers.IntegerField(
+        required=False, min_value=MIN_CHUNK_SIZE, max_value=MAX_CHUNK_SIZE
+    )
+    start_seconds = serializers.FloatField(required=False, allow_null=True, min_value=0)
     audio_id = serializers.CharField(max_length=50)
-    client_id = serializers.CharField(max_length=50)
+    client_id = serializers.CharField(max_length=50, required=False, allow_blank=True)
     include_header = serializers.BooleanField(default=False)
     include_metadata = serializers.BooleanField(default=False)
 
+    def validate_start_seconds(self, value):
+        if value is not None and not math.isfinite(value):
+            raise serializers.ValidationError("A finite number is required.")
+        return value
+
     def handle_request(self, data):
         chunk_index: int = data["chunk_index"]
-        chunk_count: int = data["chunk_count"]
+        chunk_size: int = clamp_chunk_size(data.get("chunk_size") or CHUNK_SIZE)
+        chunk_count: int = clamp_chunk_count(data["chunk_count"], chunk_size)
         audio_id: str = data["audio_id"]
         include_metadata: bool = data["include_metadata"]
 
         filename = self.get_file_name(audio_id)
 
-        with open(filename, "rb") as wav_file:
-            wav_file.seek(0, 2)
-            file_size = wav_file.tell()
-            audio_data_size = file_size
-            total_chunks = (audio_data_size + CHUNK_SIZE - 1) // CHUNK_SIZE
+        file_size = os.path.getsize(filename)
+        audio_data_size = file_size
+        total_chunks = (audio_data_size + chunk_size - 1) // chunk_size
 
-            response = {
-                "chunk_index": chunk_index,
-                "chunk_count": min(chunk_count, total_chunks - chunk_index),
+        # Seeking by time: start at the chunk holding the closest frame boundary
+        # and drop the bytes before it, so only audio from there on is sent.
+        start_seconds = data.get("start_seconds")
+        byte_offset = 0
+
+        if start_seconds is not None:
+            byte_offset, start_seconds = seek_offset(filename, start_seconds)
+            chunk_index = byte_offset // chunk_size
+
+        response = {
+            "chunk_index": chunk_index,
+            "chunk_count": max(min(chunk_count, total_chunks - chunk_index), 0),
+            "chunk_size": chunk_size,
+        }
+
+        if start_seconds is not None:
+            response["start_seconds"] = start_seconds
+            response["byte_offset"] = byte_offset
+
+        if include_metadata:
+            song = Song.objects.get(id=audio_id)
+
+            channels = 2  # TODO
+            bitrate = song.bitrate
+            duration = song.duration_seconds
+
+            suggested_chunk_size, suggested_chunk_count = suggest_chunking(bitrate)
+
+            response["metadata"] = {
+                "channels": channels,
+                "duration": duration,
+                "total_chunks": total_chunks,
+                "chunk_size": chunk_size,
+                "bitrate": bitrate,
+                "file_size": file_size,
+                "suggested_chunk_size": suggested_chunk_size,
+                "suggested_chunk_count": suggested_chunk_count,
+                "max_chunk_size": MAX_CHUNK_SIZE,
+                "max_chunk_count": clamp_chunk_count(MAX_CHUNK_COUNT, chunk_size),
             }
 
-            if include_metadata:
-                song = Song.objects.get(id=audio_id)
+        chunks = []
+        for i in range(chunk_count):
+            current_chunk_index = chunk_index + i
+            if current_chunk_index >= total_chunks:
+                break
+
+            chunk_data = chunk_cache.read(filename, current_chunk_index, chunk_size)
+            if i == 0 and byte_offset:
+                chunk_data = chunk_data[byte_offset - chunk_index * chunk_size :]
+            chunk_data = base64.b64encode(chunk_data)
 
-                channels = 2  # TODO
-                bitrate = song.bitrate
-                duration = song.duration_seconds
+            chunks.append(chunk_data)
 
-                response["metadata"] = {
-                    "channels": channels,
-                    "duration": duration,
-                    "total_chunks": total_chunks,
-                    "chunk_size": CHUNK_SIZE,
-                    "bitrate": bitrate,
-                    "file_size": file_size,
-                }
+        response["chunks"] = chunks
 
-            chunks = []
-            for i in range(chunk_count):
-                current_chunk_index = chunk_index + i
-                if current_chunk_index >= total_chunks:
-                    break
+        # Warm the chunks the client is most likely to ask for next.
+        chunk_cache.readahead(
+            filename,
+            chunk_index + len(chunks),
+            scale_chunk_count(READAHEAD_CHUNKS, chunk_size),
+            chunk_size,
+        )
 
-                offset = current_chunk_index * CHUNK_SIZE
-                wav_file.seek(offset)
+        return response
 
-                chunk_data = wav_file.read(min(CHUNK_SIZE, file_size - offset))
-                chunk_data = base64.b64encode(chunk_data)
+    def prefetch(self, audio_id: str) -> bool:
+        try:
+            filename = self.get_file_name(audio_id)
+        except FileNotFoundError:
+            return False
 
-                chunks.append(chunk_data)
+        if not os.path.isfile(filename):
+            return False
 
-            response["chunks"] = chunks
+        # Warm the chunks with the size the client will negotiate for this song.
+        song = Song.objects.filter(id=audio_id).first()
+        chunk_size = suggest_chunking(song.bitrate)[0] if song else CHUNK_SIZE
 
-            return response
+        chunk_cache.readahead(
+            filename, 0, scale_chunk_count(PREFETCH_CHUNKS, chunk_size), chunk_size
+        )
+        return True
 
     def get_file_name(self, audio_id: str):
-        return f"/app/data/audios/{audio_id}"
+        if not is_audio_id(audio_id):
+            raise FileNotFoundError(audio_id)
+        return f"{AUDIOS_PATH}/{audio_id}"
+
+
+def is_audio_id(audio_id: str) -> bool:
+    # Audio ids name files in AUDIOS_PATH, so they must never be a path
+    return audio_id.isascii() and audio_id.isalnum()
+
+
+def clamp_chunk_size(chunk_size: int) -> int:
+    return max(MIN_CHUNK_SIZE, min(chunk_size, MAX_CHUNK_SIZE))
+
+
+def clamp_chunk_count(chunk_count: int, chunk_size: int) -> int:
+    max_count = max(1, min(MAX_CHUNK_COUNT, MAX_BATCH_SIZE // chunk_size))
+    return max(0, min(chunk_count, max_count))
+
+
+def scale_chunk_count(default_count: int, chunk_size: int) -> int:
+    """Number of `chunk_size` chunks covering `default_count` default-sized chunks."""
+    return max(1, default_count * CHUNK_SIZE // chunk_size)
+
+
+def suggest_chunking(bitrate: int) -> tuple[int, int]:
+    """
+    Suggests a chunk size (a power of two) holding about TARGET_CHUNK_SECONDS
+    of audio at `bitrate` bits per second, and a batch size covering about
+    TARGET_BATCH_SECONDS, both within the server limits.
+    """
+    if not bitrate or bitrate <= 0:
+        return CHUNK_SIZE, clamp_chunk_count(MAX_CHUNK_COUNT, CHUNK_SIZE)
+
+    bytes_per_second = bitrate / 8
+
+    target_size = int(bytes_per_second * TARGET_CHUNK_SECONDS)
+    chunk_size = clamp_chunk_size(1 << max(target_size - 1, 1).bit_length())
+
+    chunk_seconds = chunk_size / bytes_per_second
+    chunk_count = clamp_chunk_count(
+        max(1, round(TARGET_BATCH_SECONDS / chunk_seconds)), chunk_size
+    )
+
+    return chunk_size, chunk_count
 
 
-class ArtistSerializer(serializers.ModelSerializer):
+class SearchRankMixin:
+    # Search results carry their rank, so partitions' results can be merged.
+    def to_representation(self, instance):
+        data = super().to_representation(instance)  # type: ignore
+        if hasattr(instance, SEARCH_RANK):
+            data[SEARCH_RANK] = getattr(instance, SEARCH_RANK)
+        return data
+
+
+class IdListField(serializers.ListField):
+    """Ids of a many-to-many relation, without checking the rows exist here."""
+
+    child = serializers.CharField(max_length=100)
+
+    def to_representation(self, data):
+        # Read from the relation table, the rows themselves may not be here.
+        return list(
+            data.through.objects.filter(
+                **{data.source_field_name: data.instance}
+            ).values_list(f"{data.target_field_name}_id", flat=True)
+        )
+
+
+class ArtistSerializer(SearchRankMixin, serializers.ModelSerializer):
     class Meta:
         model = Artist
-        fields = ["id", "name"]
+        fields = ["id", "name", "version"]
 
         extra_kwargs = {
             "name": {"required": True, "min_length": 1},
             "id": {"required": True},
+            "version": {"read_only": True},
         }
 
     def create(self, validated_data):
@@ -106,27 +246,35 @@ class ArtistSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class AlbumSerializer(serializers.ModelSerializer):
+class AlbumSerializer(SearchRankMixin, serializers.ModelSerializer):
+    # The author may be stored in another partition
+    author = serializers.CharField(source="author_id", max_length=100)
+
     class Meta:
         model = Album
-        fields = ["id", "name", "date", "author"]
+        fields = ["id", "name", "date", "author", "version"]
 
         extra_kwargs = {
             "name": {"required": True, "min_length": 1},
             "date": {"required": True},
             "author": {"required": True},
             "id": {"required": False},
+            "version": {"read_only": True},
         }
 
     def create(self, validated_data):
         if "id" not in validated_data:
-            key = f"{validated_data['name']}:{validated_data['date']}:{validated_data['author']}"
-            validated_data["id"] = hash_string(key)
+            validated_data["id"] = default_album_id(self.initial_data)
         return super().create(validated_data)
 
 
-class SongSerializer(serializers.ModelSerializer):
+class SongSerializer(SearchRankMixin, serializers.ModelSerializer):
     file_base64 = serializers.CharField(write_only=True, required=False)
+    # The album and artists may be stored in other partitions
+    album = serializers.CharField(
+        source="album_id", max_length=100, allow_null=True, required=False
+    )
+    artist = IdListField(allow_empty=False)
     album_name = serializers.SerializerMethodField()
     artist_names = serializers.SerializerMethodField()
 
@@ -143,6 +291,7 @@ class SongSerializer(serializers.ModelSerializer):
             "duration_seconds",
             "bitrate",
             "extension",
+            "version",
         ]
         extra_kwargs = {
             "title": {"required": True, "min_length": 1},
@@ -151,12 +300,27 @@ class SongSerializer(serializers.ModelSerializer):
             "duration_seconds": {"required": False},
             "bitrate": {"required": False},
             "extension": {"required": False},
+            "version": {"read_only": True},
         }
 
-    def get_audio_info(self, audio_bytes: bytes):
+    def validate(self, attrs):
+        if "file_base64" not in attrs and (
+            attrs.get("duration_seconds") is None or attrs.get("bitrate") is None
+        ):
+            raise serializers.ValidationError(
+                "Either file_base64 or duration_seconds and bitrate are required."
+            )
+        return attrs
+
+    def get_audio_info(self, audio: bytes | str):
         # TODO: test this
-        audio_file = io.BytesIO(audio_bytes)
-        audio = MP3(audio_file)
+        # Accepts the audio bytes or the path of a file holding them
+        audio_file = io.BytesIO(audio) if isinstance(audio, bytes) else audio
+
+        try:
+            audio = MP3(audio_file)
+        except MutagenError:
+            raise serializers.ValidationError({"file": "The audio is not an MP3."})
 
         duration_seconds = audio.info.length
 
@@ -182,18 +346,25 @@ class SongSerializer(serializers.ModelSerializer):
         return metadata
 
     def get_album_name(self, obj):
-        return obj.album.name if obj.album else None
+        try:
+            return obj.album.name if obj.album_id else None
+        except Album.DoesNotExist:
+            return None  # Filled in by `resolve_song_names`
 
     def get_artist_names(self, obj):
         return [artist.name for artist in obj.artist.all()]
 
     def create(self, validated_data):
         if "id" not in validated_data:
-            key = f"{validated_data['title']}:{validated_data['album']}"
-            validated_data["id"] = hash_string(key)
+            validated_data["id"] = default_song_id(self.initial_data)
 
         id = validated_data["id"]
         file_base64 = validated_data.pop("file_base64", None)
+
+        if file_base64 is None:
+            # Metadata only, the audio is stored by whoever received it (see SongUploadView)
+            return super().create(validated_data)
+
         data = base64.b64decode(file_base64)
         metadata = self.get_audio_info(data)
 
@@ -207,12 +378,63 @@ class SongSerializer(serializers.ModelSerializer):
 
         assert chord_instance
 
-        song_node_id = int(id, 16) % (1 << chord_instance.id_bitlen)
-        succ = async_to_sync(chord_instance.find_successor)(song_node_id)
+        song_key = int(as_key(id), 16)  # type: ignore
+        song_node_id = song_key % (1 << chord_instance.id_bitlen)
+        succ = routing_cache.successor(song_node_id)
 
         if chord_instance.node_id == succ.node_id:
-            file_path = f"/app/data/audios/{id}"
+            file_path = f"{AUDIOS_PATH}/{id}"
             with open(file_path, "wb") as f:
                 f.write(data)
+            write_seek_table(file_path)
 
         return song
+
+
+class SongListingSerializer(serializers.BaseSerializer):
+    """Read only SongSerializer output, taken from the song's `SongListing`."""
+
+    def to_representation(self, instance):
+        try:
+            data = dict(instance.listing.row)
+        except SongListing.DoesNotExist:
+            data = song_rows([instance.id])[instance.id]
+
+        if hasattr(instance, SEARCH_RANK):
+            data[SEARCH_RANK] = getattr(instance, SEARCH_RANK)
+        return data
+
+
+class BatchArtistSerializer(serializers.Serializer):
+    id = serializers.CharField(max_length=100)
+    name = serializers.CharField(max_length=100)
+    version = serializers.IntegerField(required=False)
+
+
+class BatchAlbumSerializer(serializers.Serializer):
+    id = serializers.CharField(max_length=100)
+    name = serializers.CharField(max_length=100)
+    date = serializers.DateField()
+    author = serializers.CharField(max_length=100)
+    version = serializers.IntegerField(required=False)
+
+
+class BatchSongSerializer(serializers.Serializer):
+    id = serializers.CharField(max_length=100)
+    title = serializers.CharField(max_length=100)
+    album = serializers.CharField(max_length=100, allow_null=True, required=False)
+    artist = serializers.ListField(
+        child=serializers.CharField(max_length=100), allow_empty=False
+    )
+    duration_seconds = serializers.IntegerField()
+    bitrate = serializers.IntegerField()
+    extension = serializers.CharField(max_length=10, required=False)
+    version = serializers.IntegerField(required=False)
+
+
+class CatalogBatchSerializer(serializers.Serializer):
+    """The rows of an `apply_catalog_batch` batch, checked before any is sent."""
+
+    artists = BatchArtistSerializer(many=True, required=False)
+    albums = BatchAlbumSerializer(many=True, required=False)
+    songs = BatchSongSerializer(many=True, required=False)
@@ -0,0 +1,213 @@
+import copy
+import time
+import threading
+
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+from rest_framework.response import Response
+
+# Longest a request waits for an identical one before fetching on its own,
+# and longest a stream is shared with the requests arriving while it lasts.
+FLIGHT_TIMEOUT = 30  # seconds
+
+
+class RequestKey:
+    """
+    Identifies the GET requests getting the same answer: same host and path
+    (links in the answer are built from them), same parameters but
+    `ignored_params`, same validator and representation.
+    """
+
+    def __init__(self, ignored_params: list[str] | None = None):
+        self.ignored_params = set(ignored_params or [])
+
+    def __call__(self, request: HttpRequest, *extra) -> tuple:
+        params = sorted(
+            (param, tuple(values))
+            for param, values in request.GET.lists()
+            if param not in self.ignored_params
+        )
+
+        return (
+            request.get_host(),
+            request.path,
+            tuple(params),
+            request.headers.get("If-None-Match"),
+            request.headers.get("Accept"),
+            *extra,
+        )
+
+
+class Answer:
+    """A response as it was produced, copied for every request sharing it."""
+
+    def __init__(self, response: HttpResponse, relay: "StreamRelay | None" = None):
+        self.status = response.status_code
+        self.relay = relay
+        # Not rendered yet: each copy is rendered for its own request
+        self.unrendered = isinstance(response, Response)
+
+        if relay is not None:
+            self.headers = list(response.items())
+        elif self.unrendered:
+            self.data = copy.deepcopy(response.data)  # type: ignore
+            self.headers = [
+                (header, value)
+                for header, value in response.items()
+                if header.lower() != "content-type"
+            ]
+        else:
+            self.content = response.content
+            self.headers = list(response.items())
+
+    def response(self) -> HttpResponse:
+        if self.relay is not None:
+            response = StreamingHttpResponse(self.relay.reader(), status=self.status)
+        elif self.unrendered:
+            response = Response(copy.deepcopy(self.data), status=self.status)
+        else:
+            response = HttpResponse(self.content, status=self.status)
+
+        for header, value in self.headers:
+            response[header] = value
+
+        return response
+
+
+class Flight:
+    def __init__(self) -> None:
+        self.landed = threading.Event()
+        self.answer: Answer | None = None
+        self.expires = time.monotonic() + FLIGHT_TIMEOUT
+
+
+class StreamRelay:
+    """
+    Reads a streamed answer from upstream on a thread of its own and keeps its
+    chunks, so every request sharing it gets them as they arrive, at its own
+    pace, whether or not the others' clients keep reading.
+    """
+
+    def __init__(self, response: StreamingHttpResponse, on_complete):
+        self.upstream = response
+        self.on_complete = on_complete
+        self.arrived = threading.Condition()
+        self.chunks: list[bytes] = []
+        self.complete = False
+        self.failed = False
+
+        threading.Thread(target=self.pump, name="stream-relay", daemon=True).start()
+
+    def pump(self) -> None:
+        failed = False
+
+        try:
+            for chunk in self.upstream.streaming_content:
+                with self.arrived:
+                    self.chunks.append(chunk)
+                    self.arrived.notify_all()
+        except Exception:
+            failed = True
+        finally:
+            self.upstream.close()
+
+            with self.arrived:
+                self.complete = True
+                self.failed = failed
+                self.arrived.notify_all()
+
+            self.on_complete()
+
+    def reader(self):
+        sent = 0
+
+        while True:
+            with self.arrived:
+                while sent == len(self.chunks) and not self.complete:
+                    self.arrived.wait()
+
+                chunks = self.chunks[sent:]
+                ended = self.complete and not chunks
+                failed = self.failed
+
+            if ended:
+                if failed:
+                    # Cut like the upstream stream, the client must not take
+                    # it as complete
+                    raise ConnectionError("The upstream stream was cut short.")
+                return
+
+            sent += len(chunks)
+            yield from chunks
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent requests: the first one with a key fetches
+    the answer and the ones arriving meanwhile wait for it and get a copy, so
+    a popular chunk or list is fetched, forwarded and read from disk once.
+    Nothing is kept once the answer is out, see `http_cache` for that.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._flights: dict = {}
+
+    def share(self, key, fetch) -> HttpResponse:
+        now = time.monotonic()
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leading = flight is None or flight.expires <= now
+            if leading:
+                flight = self._flights[key] = Flight()
+
+        assert flight
+
+        if not leading:
+            flight.landed.wait(max(flight.expires - now, 0))
+            if flight.answer is None:
+                return fetch()  # It failed or took too long
+            return flight.answer.response()
+
+        try:
+            response = fetch()
+        except BaseException:
+            self.land(key, flight, None)
+            raise
+
+        if response.status_code >= 500:
+            self.land(key, flight, None)  # Failures are not shared
+            return response
+
+        if not response.streaming:
+            self.land(key, flight, Answer(response))
+            return response
+
+        # Streams are shared as they arrive. Requests coming in until the
+        # upstream stream ends still join it, from its first chunk.
+        relay = StreamRelay(response, lambda: self.forget(key, flight))
+        answer = Answer(response, relay)
+        self.land(key, flight, answer, forget=False)
+
+        return answer.response()
+
+    def land(
+        self, key, flight: Flight, answer: Answer | None, forget: bool = True
+    ) -> None:
+        with self._lock:
+            if flight.landed.is_set():
+                return
+
+            flight.answer = answer
+            flight.landed.set()
+
+        if forget:
+            self.forget(key, flight)
+
+    def forget(self, key, flight: Flight) -> None:
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+
+request_flights = SingleFlight()
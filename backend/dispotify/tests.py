@@ -1,3 +1,834 @@
-from django.test import TestCase
+import os
+import json
+import time
+import tempfile
+import threading
 
-# Create your tests here.
+from unittest import mock
+
+import requests
+
+from django.db import connection
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+
+from chord.chord import METADATA_REPLICATION_FACTOR, ChordNode, ChordNodeReference
+
+from . import (
+    decorators,
+    hints,
+    http_cache,
+    idempotency,
+    placement,
+    rebalance,
+    serializers,
+    views,
+)
+from .catalog import CATALOG_VERSION_HEADER, apply_catalog_batch
+from .decorators import REPLICA_STATUS_HEADER, TARGETING_HEADER
+from .models import Album, Artist, Song, SongListing
+from .routing import as_key
+from .singleflight import RequestKey, SingleFlight
+
+
+def catalog_batch(songs: int) -> dict:
+    return {
+        "artists": [
+            {"id": "artist-a", "name": "Artist A"},
+            {"id": "artist-b", "name": "Artist B"},
+        ],
+        "albums": [
+            {"id": "album", "name": "Album", "date": "2024-01-01", "author": "artist-a"}
+        ],
+        "songs": [
+            {
+                "id": f"song-{i:04}",
+                "title": f"Song {i:04}",
+                "album": "album",
+                "artist": ["artist-a", "artist-b"],
+                "duration_seconds": 180,
+                "bitrate": 128_000,
+            }
+            for i in range(songs)
+        ],
+    }
+
+
+class SongListQueriesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        ChordNode()  # A ring of this node alone
+
+    def apply(self, batch: dict) -> None:
+        # Lists are cached until the catalog revision changes on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_catalog_batch(batch)
+
+    def list_queries(self) -> int:
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/songs/?limit=1000")
+
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_queries_do_not_grow_with_the_page(self):
+        self.apply(catalog_batch(10))
+        few = self.list_queries()
+
+        self.apply(catalog_batch(200))
+        many = self.list_queries()
+
+        self.assertEqual(few, many)
+
+    def test_listing_names(self):
+        self.apply(catalog_batch(3))
+
+        songs = self.client.get("/api/songs/").json()
+
+        self.assertEqual(len(songs), 3)
+        for song in songs:
+            self.assertEqual(song["album_name"], "Album")
+            self.assertEqual(song["artist_names"], ["Artist B", "Artist A"])
+
+    def test_listing_follows_writes(self):
+        self.apply(catalog_batch(1))
+
+        Artist.objects.filter(id="artist-b").get().delete()
+        album = Album.objects.get(id="album")
+        album.name = "Renamed"
+        album.save()
+        Song.objects.get(id="song-0000").artist.add(
+            Artist.objects.create(id="artist-c", name="Artist C")
+        )
+
+        song = self.client.get("/api/songs/song-0000/").json()
+
+        self.assertEqual(song["album_name"], "Renamed")
+        self.assertEqual(song["artist"], ["artist-a", "artist-c"])
+        self.assertEqual(song["artist_names"], ["Artist C", "Artist A"])
+
+
+class CountingEvent(threading.Event):
+    def __init__(self):
+        super().__init__()
+        self.waiting = 0
+
+    def wait(self, timeout=None):
+        self.waiting += 1
+        return super().wait(timeout)
+
+
+class SingleFlightTest(SimpleTestCase):
+    def setUp(self):
+        self.flights = SingleFlight()
+        self.fetches = 0
+
+    def wait_until(self, condition) -> None:
+        deadline = time.monotonic() + 5
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def fetch(self, response=None):
+        def fetch():
+            self.fetches += 1
+            return response or HttpResponse(b"own")
+
+        return fetch
+
+    def share_at_once(self, leader_fetch, followers: int) -> list:
+        # The followers ask while the leader is fetching, then it answers
+        release = threading.Event()
+        results = []
+
+        def fetch():
+            release.wait(5)
+            return leader_fetch()
+
+        def share(fetch):
+            try:
+                results.append(self.flights.share("key", fetch))
+            except Exception as e:
+                results.append(e)
+
+        threads = [threading.Thread(target=share, args=(fetch,))]
+        threads[0].start()
+        self.wait_until(lambda: "key" in self.flights._flights)
+
+        landed = self.flights._flights["key"].landed = CountingEvent()
+        threads += [
+            threading.Thread(target=share, args=(self.fetch(),))
+            for _ in range(followers)
+        ]
+        for thread in threads[1:]:
+            thread.start()
+        self.wait_until(lambda: landed.waiting == followers)
+
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        return results
+
+    def test_identical_requests_share_one_fetch(self):
+        results = self.share_at_once(self.fetch(HttpResponse(b"page")), 3)
+
+        self.assertEqual(self.fetches, 1)
+        self.assertEqual([response.content for response in results], [b"page"] * 4)
+
+    def test_failures_are_fetched_again(self):
+        results = self.share_at_once(self.fetch(HttpResponse(status=503)), 2)
+
+        self.assertEqual(self.fetches, 3)
+        self.assertEqual(sorted(r.status_code for r in results), [200, 200, 503])
+
+    def test_errors_are_fetched_again(self):
+        def fail():
+            raise ConnectionError
+
+        results = self.share_at_once(fail, 2)
+
+        self.assertEqual(self.fetches, 2)
+        self.assertEqual(sum(isinstance(r, ConnectionError) for r in results), 1)
+
+    def test_streams_reach_waiters_as_they_arrive(self):
+        more = threading.Event()
+
+        def chunks():
+            yield b"first "
+            more.wait(5)
+            yield b"second"
+
+        leader = self.flights.share("key", lambda: StreamingHttpResponse(chunks()))
+        follower = self.flights.share("key", self.fetch())
+
+        # Before the leader's client read anything
+        follower_chunks = iter(follower.streaming_content)
+        self.assertEqual(next(follower_chunks), b"first ")
+
+        more.set()
+        self.assertEqual(b"".join(follower_chunks), b"second")
+        self.assertEqual(b"".join(leader.streaming_content), b"first second")
+        self.assertEqual(self.fetches, 0)
+
+        # Once the stream ended, the next request fetches on its own
+        self.wait_until(lambda: "key" not in self.flights._flights)
+        self.assertEqual(self.flights.share("key", self.fetch()).content, b"own")
+
+    def test_cut_streams_are_cut_for_everyone(self):
+        cut = threading.Event()
+
+        def chunks():
+            yield b"first"
+            cut.wait(5)
+            raise ConnectionError
+
+        leader = self.flights.share("key", lambda: StreamingHttpResponse(chunks()))
+        follower = self.flights.share("key", self.fetch())
+        cut.set()
+
+        self.assertEqual(self.fetches, 0)
+        for response in (leader, follower):
+            with self.assertRaises(ConnectionError):
+                b"".join(response.streaming_content)
+
+    def test_request_keys(self):
+        key = RequestKey(ignored_params=["client_id"])
+        factory = RequestFactory()
+
+        def request(query: str, host: str = "localhost"):
+            return key(factory.get(f"/api/streamer/?{query}", HTTP_HOST=host))
+
+        self.assertEqual(request("a=1&client_id=1"), request("client_id=2&a=1"))
+        self.assertNotEqual(request("a=1"), request("a=2"))
+        # Links in the answer are built for the host
+        self.assertNotEqual(request("a=1"), request("a=1", host="127.0.0.1"))
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        ChordNode()  # A ring of this node alone
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_catalog_batch(
+                {
+                    "artists": [
+                        {"id": "beyonce", "name": "Beyoncé Knowles"},
+                        {"id": "marley", "name": "Bob Marley"},
+                        {"id": "dylan", "name": "Bob Dylan"},
+                    ]
+                }
+            )
+
+    def search(self, url: str) -> list[str]:
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        return [row["id"] for row in response.json()]
+
+    def test_prefixes_in_any_order(self):
+        self.assertEqual(self.search("/api/artists/?name=bey"), ["beyonce"])
+        self.assertEqual(self.search("/api/artists/?name=marl%20bo"), ["marley"])
+        self.assertCountEqual(
+            self.search("/api/artists/?name=bob"), ["marley", "dylan"]
+        )
+
+    def test_accents_and_case_are_ignored(self):
+        self.assertEqual(self.search("/api/artists/?name=BEYONCE"), ["beyonce"])
+        self.assertEqual(self.search("/api/artists/?name=knówles"), ["beyonce"])
+
+    def test_names_without_words(self):
+        self.assertEqual(self.search("/api/artists/?name=!!"), [])
+        self.assertEqual(len(self.search("/api/artists/?name=")), 3)
+
+    def test_index_follows_writes(self):
+        artist = Artist.objects.get(id="dylan")
+        artist.name = "Robert Zimmerman"
+        artist.save()
+        Artist.objects.get(id="marley").delete()
+        # Bulk writes, which send no signals
+        apply_catalog_batch(
+            {"artists": [{"id": "beyonce", "name": "Sasha Fierce", "version": 1}]}
+        )
+
+        self.assertEqual(self.search("/api/artists/?name=bob"), [])
+        self.assertEqual(self.search("/api/artists/?name=zimmer"), ["dylan"])
+        self.assertEqual(self.search("/api/artists/?name=beyonce"), [])
+        self.assertEqual(self.search("/api/artists/?name=sasha"), ["beyonce"])
+
+    def test_pages_of_ranked_results(self):
+        apply_catalog_batch(catalog_batch(25))
+
+        songs, ranks = [], []
+        url = "/api/songs/?name=song&limit=10"
+
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+            songs += [song["id"] for song in response.json()]
+            ranks += [song["search_rank"] for song in response.json()]
+
+            link = response.headers.get("Link")
+            url = link[1 : link.index(">")] if link else None
+
+        self.assertCountEqual(songs, [f"song-{i:04}" for i in range(25)])
+        self.assertEqual(ranks, sorted(ranks))
+
+    def test_ranked_pages_after_writes(self):
+        apply_catalog_batch(catalog_batch(25))
+
+        response = self.client.get("/api/songs/?name=song&limit=10")
+        link = response.headers["Link"]
+
+        # Ranks change with the rest of the corpus, the next page must not
+        others = catalog_batch(50)
+        for song in others["songs"]:
+            song["id"] = song["id"].replace("song", "track")
+            song["title"] = song["title"].replace("Song", "Track")
+        apply_catalog_batch(others)
+
+        response = self.client.get(link[1 : link.index(">")])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 10)
+
+
+class HttpCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        ChordNode()  # A ring of this node alone
+
+    def setUp(self):
+        self.apply(catalog_batch(3))
+
+    def apply(self, batch: dict) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_catalog_batch(batch)
+
+    def assertNotModified(self, url: str) -> None:
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        again = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again["ETag"], response["ETag"])
+
+    def test_list_not_modified(self):
+        self.assertNotModified("/api/songs/")
+
+    def test_retrieve_not_modified(self):
+        self.assertNotModified("/api/songs/song-0000/")
+
+    def audios(self) -> str:
+        # Inside a directory of its own, so paths can point out of it
+        audios = os.path.join(tempfile.mkdtemp(), "audios")
+        os.mkdir(audios)
+
+        for module in (serializers, http_cache):
+            patcher = mock.patch.object(module, "AUDIOS_PATH", audios)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        return audios
+
+    def test_stream_not_modified(self):
+        with open(f"{self.audios()}/abc123", "wb") as f:
+            f.write(os.urandom(1 << 16))
+
+        self.assertNotModified(
+            "/api/streamer/?audio_id=abc123&chunk_index=0&chunk_count=1"
+        )
+
+    def test_stream_of_a_path_is_not_served(self):
+        with open(f"{self.audios()}/../secret", "wb") as f:
+            f.write(os.urandom(1 << 16))
+
+        response = self.client.get(
+            "/api/streamer/?audio_id=../secret&chunk_index=0&chunk_count=1"
+        )
+
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn("ETag", response)
+
+    def test_writes_invalidate_the_list(self):
+        response = self.client.get("/api/songs/")
+
+        self.apply(catalog_batch(4))
+
+        again = self.client.get("/api/songs/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(again.status_code, 200)
+        self.assertNotEqual(again["ETag"], response["ETag"])
+        self.assertEqual(len(again.json()), 4)
+
+
+class AudioStreamerTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        ChordNode()  # A ring of this node alone
+
+    def setUp(self):
+        audios = tempfile.mkdtemp()
+        patcher = mock.patch.object(serializers, "AUDIOS_PATH", audios)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        with open(f"{audios}/abc123", "wb") as f:
+            f.write(os.urandom(1 << 16))
+
+    def stream(self, **params) -> HttpResponse:
+        query = "&".join(f"{name}={value}" for name, value in params.items())
+        return self.client.get(f"/api/streamer/?audio_id=abc123&{query}")
+
+    def test_chunk_size(self):
+        response = self.stream(chunk_size=1 << 13, chunk_count=2)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["chunk_size"], 1 << 13)
+        self.assertEqual(len(response.json()["chunks"]), 2)
+
+    def test_bad_chunk_params(self):
+        for params in (
+            {"chunk_size": "x"},
+            {"chunk_size": 1},
+            {"chunk_size": 1 << 30},
+            {"chunk_index": -1},
+            {"chunk_count": "many"},
+        ):
+            with self.subTest(**params):
+                self.assertEqual(self.stream(**params).status_code, 400)
+
+    def test_bad_start_seconds(self):
+        for start_seconds in ("abc", "nan", "inf", "-1"):
+            with self.subTest(start_seconds=start_seconds):
+                response = self.stream(start_seconds=start_seconds)
+                self.assertEqual(response.status_code, 400)
+
+
+class AudioIdTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        ChordNode()  # A ring of this node alone
+
+    def setUp(self):
+        # Inside a directory of its own, so ids can point out of it
+        self.root = tempfile.mkdtemp()
+        audios = os.path.join(self.root, "audios")
+        os.mkdir(audios)
+
+        for module in (serializers, placement, views):
+            patcher = mock.patch.object(module, "AUDIOS_PATH", audios)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def assertNothingEscaped(self) -> None:
+        self.assertEqual(os.listdir(self.root), ["audios"])
+
+    def test_upload_of_a_path_is_rejected(self):
+        with mock.patch.object(views, "ingest_song") as ingest_song:
+            response = self.client.post(
+                "/api/songs/upload/",
+                os.urandom(1 << 10),
+                content_type="audio/mpeg",
+                HTTP_X_SONG_ID="../escaped",
+                HTTP_X_SONG_TITLE="Song",
+                HTTP_X_SONG_ARTISTS="Artist",
+            )
+
+        self.assertEqual(response.status_code, 400)
+        ingest_song.assert_not_called()
+        self.assertNothingEscaped()
+
+    def test_create_of_a_path_is_rejected(self):
+        with mock.patch.object(views, "ingest_song") as ingest_song:
+            response = self.client.post(
+                "/api/songs/",
+                {"id": "../escaped", "title": "Song", "file_base64": "AAAA"},
+                content_type="application/json",
+            )
+
+        self.assertEqual(response.status_code, 400)
+        ingest_song.assert_not_called()
+        self.assertNothingEscaped()
+
+    def test_audio_is_only_written_in_place(self):
+        with self.assertRaises(ValueError):
+            placement.write_audio("../escaped", b"audio")
+
+        self.assertNothingEscaped()
+
+
+class IngestTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        ChordNode()  # A ring of this node alone
+
+    def create(self, song: dict, headers: dict | None = None) -> HttpResponse:
+        return self.client.post(
+            "/api/songs/", song, content_type="application/json", headers=headers
+        )
+
+    def test_bad_base64_is_rejected(self):
+        song = {"title": "Song", "file_base64": "not base64!"}
+
+        with mock.patch.object(views.ingest_queue, "submit") as submit:
+            for headers in ({}, {"Prefer": "respond-async"}):
+                with self.subTest(headers=headers):
+                    response = self.create(song, headers)
+
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn("file_base64", response.json())
+
+        submit.assert_not_called()
+
+    def song(self) -> dict:
+        return {
+            "id": "abc123",
+            "title": "Song",
+            "artist": ["artist-a"],
+            "duration_seconds": 180,
+            "bitrate": 128_000,
+        }
+
+    def test_retried_catalog_create_is_applied_once(self):
+        apply_catalog_batch(catalog_batch(0))
+
+        for attempt in range(2):
+            with self.subTest(attempt=attempt):
+                response = placement.create_song_metadata(self.song(), 42, "key")
+
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(Song.objects.get(id="abc123").version, 42)
+
+    def test_replayed_create_is_applied_once(self):
+        apply_catalog_batch(catalog_batch(0))
+        headers = {
+            TARGETING_HEADER: ChordNode.get_instance().ring_signature,
+            CATALOG_VERSION_HEADER: "42",
+        }
+
+        for attempt in range(2):
+            with self.subTest(attempt=attempt):
+                response = self.create(self.song(), headers)
+
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(Song.objects.get(id="abc123").version, 42)
+
+        # A newer create of the same row is still refused
+        headers[CATALOG_VERSION_HEADER] = "43"
+        self.assertEqual(self.create(self.song(), headers).status_code, 400)
+
+
+class RebalanceTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        ChordNode()  # Node 0, alone until the test adds nodes
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_catalog_batch(catalog_batch(20))
+
+        # Node 0 and three more joining
+        self.ring = [0, 1 << 30, 2 << 30, 3 << 30]
+        self.nodes = {
+            node_id: ChordNodeReference(f"10.0.0.{i}", 4321, node_id)
+            for i, node_id in enumerate(self.ring)
+        }
+        self.sent: dict[int, set[str]] = {node_id: set() for node_id in self.ring}
+
+    def request_node(self, target, method, body, headers, path, params):
+        for rows in json.loads(body).values():
+            self.sent[target.node_id].update(row["id"] for row in rows)
+        return HttpResponse(status=201)
+
+    def replicas(self, row_id: str) -> list[int]:
+        data_id = int(as_key(row_id), 16) % (1 << 32)
+        return rebalance.ring_replicas(self.ring, data_id, METADATA_REPLICATION_FACTOR)
+
+    def test_ring_replicas(self):
+        self.assertEqual(rebalance.ring_replicas([10, 20, 30], 15, 2), [20, 30])
+        self.assertEqual(rebalance.ring_replicas([10, 20, 30], 20, 2), [20, 30])
+        self.assertEqual(rebalance.ring_replicas([10, 20, 30], 35, 2), [10, 20])
+        self.assertEqual(rebalance.ring_replicas([10], 35, 3), [10])
+
+    def test_rows_move_to_their_new_replicas(self):
+        row_ids = {model: stored_ids(model) for model in (Artist, Album, Song)}
+
+        with mock.patch.object(
+            decorators, "request_node", side_effect=self.request_node
+        ):
+            for model in (Artist, Album, Song):
+                self.assertTrue(
+                    rebalancer().rebalance(model, [0], self.ring, self.nodes)
+                )
+
+        for model, ids in row_ids.items():
+            kept = stored_ids(model)
+
+            for row_id in ids:
+                replicas = self.replicas(row_id)
+
+                with self.subTest(row=row_id):
+                    self.assertEqual(row_id in kept, 0 in replicas)
+
+                    for node_id in self.ring[1:]:
+                        self.assertEqual(
+                            row_id in self.sent[node_id], node_id in replicas
+                        )
+
+        # Songs kept here lose the names of the rows that left
+        for listing in SongListing.objects.all():
+            self.assertEqual(
+                listing.row["album_name"] is None,
+                not Album.objects.filter(id=listing.row["album"]).exists(),
+            )
+
+    def test_rows_are_kept_until_taken(self):
+        with mock.patch.object(
+            decorators, "request_node", side_effect=requests.ConnectionError
+        ):
+            for model in (Artist, Album, Song):
+                ids = stored_ids(model)
+
+                self.assertFalse(
+                    rebalancer().rebalance(model, [0], self.ring, self.nodes)
+                )
+                self.assertEqual(stored_ids(model), ids)
+
+
+class ReplicationTest(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        ChordNode()  # Node 0, the peers are mocked
+
+    def setUp(self):
+        self.replicas = [
+            ChordNodeReference(f"10.0.0.{node_id}", 4321, node_id)
+            for node_id in range(3)
+        ]
+
+    def peers(self, responses: dict[int, HttpResponse]):
+        def forward(rep, method, body, headers, path, params, stream=False):
+            return responses[rep.node_id]
+
+        return mock.patch.object(
+            decorators, "forward_request_to_successor", side_effect=forward
+        )
+
+    def write(self, local: HttpResponse) -> HttpResponse:
+        return decorators.send_to_replicants(
+            self.replicas, lambda: local, "POST", "{}", {}, "/api/songs/", {}
+        )
+
+    def test_write_quorum_met(self):
+        with self.peers({1: HttpResponse(status=201), 2: HttpResponse(status=503)}):
+            response = self.write(HttpResponse(b"local", status=201))
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.content, b"local")
+        self.assertIn("0=201", response[REPLICA_STATUS_HEADER])
+
+    def test_write_quorum_not_met(self):
+        with self.peers({1: HttpResponse(status=503), 2: HttpResponse(status=500)}):
+            response = self.write(HttpResponse(status=201))
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response[REPLICA_STATUS_HEADER], "0=201, 1=503, 2=500")
+
+    def test_rejections_are_returned_over_a_503(self):
+        with self.peers({1: HttpResponse(status=400), 2: HttpResponse(status=503)}):
+            response = self.write(HttpResponse(status=503))
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_read_repairs_stale_replicas_with_the_newest_version(self):
+        repaired = threading.Event()
+        responses = {
+            1: JsonResponse({"id": "song", "title": "New", "version": 3}),
+            2: HttpResponse(status=404),  # Maybe deleted there
+        }
+
+        with self.peers(responses), mock.patch.object(
+            decorators, "repair_replica", side_effect=lambda *args: repaired.set()
+        ) as repair:
+            response = decorators.read_with_quorum(
+                self.replicas,
+                lambda: JsonResponse({"id": "song", "title": "Old", "version": 1}),
+                {},
+                "/api/songs/song/",
+                {},
+                Song,
+            )
+            self.assertTrue(repaired.wait(5))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)["title"], "New")
+
+        # Only this node held an older version, the one lacking it is left alone
+        repair.assert_called_once()
+        rep, model, rows = repair.call_args.args
+        self.assertEqual((rep.node_id, model), (0, Song))
+        self.assertEqual(rows, [{"id": "song", "title": "New", "version": 3}])
+
+
+class HintQueueTest(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        ChordNode()  # Node 0, the peers are mocked
+
+    def setUp(self):
+        self.queue = hints.HintQueue(os.path.join(tempfile.mkdtemp(), "hints.sqlite3"))
+        self.addCleanup(lambda: self.queue.db().close())
+        self.target = ChordNodeReference("10.0.0.1", 4321, 1)
+
+    def forward_while_down(self) -> HttpResponse:
+        with mock.patch.object(hints, "hint_queue", self.queue), mock.patch.object(
+            decorators, "request_node", side_effect=requests.ConnectionError
+        ):
+            return decorators.forward_request_to_successor(
+                self.target,
+                "POST",
+                '{"songs": []}',
+                {"Content-Type": "application/json", TARGETING_HEADER: "old"},
+                "/api/catalog/batch/",
+                {},
+            )
+
+    def test_writes_to_a_node_down_are_hinted(self):
+        response = self.forward_while_down()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.queue.metrics()["queue_depth_by_node"], {1: 1})
+
+    def test_hints_are_replayed_once_the_node_is_back(self):
+        self.forward_while_down()
+
+        with mock.patch.object(
+            decorators, "request_node", return_value=HttpResponse(status=201)
+        ) as request_node:
+            self.queue.drain(self.target)
+
+        target, method, body, headers, path, params = request_node.call_args.args
+        self.assertEqual((target, method), (self.target, "POST"))
+        self.assertEqual(path, "/api/catalog/batch/")
+        self.assertEqual(body, b'{"songs": []}')
+
+        # Sent with the ring signature of the replay, and the same write key
+        self.assertNotIn(TARGETING_HEADER, headers)
+        self.assertIn(idempotency.IDEMPOTENCY_HEADER, headers)
+
+        metrics = self.queue.metrics()
+        self.assertEqual(metrics["queue_depth"], 0)
+        self.assertEqual(metrics["replayed_total"], 1)
+
+    def test_hints_are_kept_while_the_node_is_down(self):
+        self.forward_while_down()
+
+        with mock.patch.object(
+            decorators, "request_node", side_effect=requests.ConnectionError
+        ):
+            self.queue.drain(self.target)
+
+        self.assertEqual(self.queue.metrics()["queue_depth"], 1)
+
+
+class IdempotencyTest(SimpleTestCase):
+    def setUp(self):
+        self.calls = 0
+        self.status = 201
+
+        patcher = mock.patch.object(
+            idempotency, "idempotency_cache", idempotency.IdempotencyCache()
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.middleware = idempotency.IdempotencyMiddleware(self.view)
+
+    def view(self, request) -> HttpResponse:
+        self.calls += 1
+        return HttpResponse(f"call {self.calls}", status=self.status)
+
+    def post(self, key: str) -> HttpResponse:
+        request = RequestFactory().post(
+            "/api/songs/", headers={idempotency.IDEMPOTENCY_HEADER: key}
+        )
+        return self.middleware(request)
+
+    def test_duplicate_key_returns_the_cached_response(self):
+        first = self.post("key")
+        second = self.post("key")
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual((second.status_code, second.content), (201, b"call 1"))
+        self.assertNotIn(idempotency.IDEMPOTENT_REPLAY_HEADER, first)
+        self.assertEqual(second[idempotency.IDEMPOTENT_REPLAY_HEADER], "true")
+
+        self.assertEqual(self.post("other").content, b"call 2")
+
+    def test_server_errors_run_again(self):
+        self.status = 503
+        self.post("key")
+        self.post("key")
+
+        self.assertEqual(self.calls, 2)
+
+
+def rebalancer() -> rebalance.CatalogRebalancer:
+    return rebalance.CatalogRebalancer()
+
+
+def stored_ids(model) -> set[str]:
+    # Unordered, albums would be joined to their authors
+    return set(model.objects.order_by().values_list("id", flat=True))
@@ -0,0 +1,73 @@
+import os
+import hashlib
+import tempfile
+
+from dataclasses import dataclass
+
+UPLOAD_READ_SIZE = 1 << 16  # 64kB read from the request at a time
+
+
+@dataclass
+class SpooledUpload:
+    path: str
+    size: int
+    sha256: str
+
+
+def spool_upload(stream, content_length: int, directory: str) -> SpooledUpload:
+    """
+    Copies `content_length` bytes from `stream` into a temporary file inside
+    `directory` and hashes them on the way, holding one block in memory at most.
+
+    The temporary name is not alphanumeric, so `ChordNode.backup_files` ignores
+    it until it is renamed to its song id.
+    """
+    digest = hashlib.sha256()
+    size = 0
+
+    fd, path = tempfile.mkstemp(dir=directory, prefix=".upload-")
+
+    try:
+        with os.fdopen(fd, "wb") as file:
+            while size < content_length:
+                block = stream.read(min(UPLOAD_READ_SIZE, content_length - size))
+
+                if not block:
+                    break
+
+                digest.update(block)
+                file.write(block)
+                size += len(block)
+    except BaseException:
+        os.remove(path)
+        raise
+
+    return SpooledUpload(path, size, digest.hexdigest())
+
+
+class BoundedStream:
+    """
+    File-like view over the first `length` bytes of `stream`. Having a length
+    lets `requests` relay it with a Content-Length instead of chunked encoding,
+    which the Django server does not accept.
+    """
+
+    def __init__(self, stream, length: int) -> None:
+        self.stream = stream
+        self.remaining = length
+        self.length = length
+
+    def __len__(self) -> int:
+        return self.length
+
+    def read(self, size: int = -1) -> bytes:
+        if self.remaining <= 0:
+            return b""
+
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+
+        block = self.stream.read(size)
+        self.remaining -= len(block)
+
+        return block
@@ -16,7 +16,14 @@ songs_router.register('', SongViewSet)
 
 urlpatterns = [
     path('streamer/', AudioStreamerView.as_view(), name='streaming_endpoint'),
+    path('streamer/prefetch/', AudioPrefetchView.as_view(), name='streaming_prefetch'),
+    path('streamer/blob/', AudioBlobView.as_view(), name='audio_blob'),
+    path('catalog/batch/', CatalogBatchView.as_view(), name='catalog_batch'),
+    path('hints/', HintMetricsView.as_view(), name='hint_metrics'),
+    path('peers/', PeerMetricsView.as_view(), name='peer_metrics'),
     path('artists/', include(artists_router.urls)),
     path('albums/', include(albums_router.urls)),
+    path('songs/upload/', SongUploadView.as_view(), name='song_upload'),
+    path('songs/jobs/<str:job_id>/', IngestJobView.as_view(), name='song_job'),
     path('songs/', include(songs_router.urls)),
 ]
\ No newline at end of file
@@ -1,3 +1,7 @@
+import os
+
+from urllib.parse import unquote
+
 from rest_framework import status
 from rest_framework import viewsets
 
@@ -5,153 +9,556 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 
+from chord.chord import (
+    FILE_REPLICATION_FACTOR,
+    METADATA_READ_QUORUM,
+    METADATA_REPLICATION_FACTOR,
+    METADATA_WRITE_QUORUM,
+    ChordNode,
+)
+
 from .models import Album, Artist, Song
-from .decorators import chord_distribute
+from .uploads import BoundedStream, spool_upload
+from .catalog import (
+    apply_catalog_batch,
+    default_album_id,
+    default_song_id,
+    request_catalog_version,
+)
+from .hints import hint_queue
+from .http_cache import audio_etag
+from .peers import peer_client
+from .scatter import resolve_song_names
+from .pagination import KeysetPagination
+from .search import SEARCH_RANK, is_search, search
+from .routing import QueryParamKey, RowKey, as_key, routing_cache
+from .singleflight import RequestKey
+from .placement import place_audio, send_catalog_batch, write_audio
+from .ingest import (
+    accepted_response,
+    decode_audio,
+    get_job_node_id,
+    ingest_queue,
+    ingest_song,
+)
+from .decorators import (
+    TARGETING_HEADER,
+    chord_distribute,
+    chord_scatter,
+    forward_request_to_successor,
+    stamp_catalog_version,
+)
 
 from .serializers import (
+    AUDIOS_PATH,
     AlbumSerializer,
     ArtistSerializer,
     AudioStreamerSerializer,
+    CatalogBatchSerializer,
+    SongListingSerializer,
     SongSerializer,
+    is_audio_id,
 )
 
 
 class AudioStreamerView(APIView):
-    @chord_distribute(1)
+    @chord_distribute(
+        1,
+        QueryParamKey("audio_id"),
+        stream=True,
+        read_replicas=FILE_REPLICATION_FACTOR,
+        etag=audio_etag,
+        # Listeners of a popular track ask for the same chunks at once
+        coalesce=RequestKey(ignored_params=["client_id"]),
+    )
     def get(self, request):
-        query_params = {  # type: ignore
-            "chunk_index": int(request.GET.get("chunk_index", 0)),
-            "chunk_count": int(request.GET.get("chunk_count", 1)),
-            "audio_id": request.GET.get("audio_id", ""),
-            "client_id": request.GET.get("client_id", ""),
-            "include_header": request.GET.get("include_header", "false").lower()
-            == "true",
-            "include_metadata": request.GET.get("include_metadata", "false").lower()
-            == "true",
-        }
-
-        serializer = AudioStreamerSerializer(data=query_params)  # type: ignore
-
-        response = serializer.handle_request(query_params)  # type: ignore
+        serializer = AudioStreamerSerializer(data=request.GET)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            response = serializer.handle_request(serializer.validated_data)
+        except FileNotFoundError:
+            # Lets the routing layer fall back to another replica.
+            return Response(
+                {"detail": "Audio not found on this node."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
         return Response(response, status=status.HTTP_200_OK)
 
 
-class ArtistViewSet(viewsets.ModelViewSet):
+class AudioPrefetchView(APIView):
+    # Hints go to every replica, since any of them may serve the next read.
+    @chord_distribute(FILE_REPLICATION_FACTOR, QueryParamKey("audio_id"))
+    def post(self, request):
+        audio_id = request.GET.get("audio_id", "")
+
+        serializer = AudioStreamerSerializer()
+        prefetching = serializer.prefetch(audio_id) if audio_id else False
+
+        return Response(
+            {"audio_id": audio_id, "prefetching": prefetching},
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+
+class SongUploadView(APIView):
+    """
+    Streaming alternative to creating a song with `file_base64`: the body is
+    the raw MP3 and the song fields travel in `X-Song-*` headers (percent-encoded).
+
+    The entry node relays the body to the song's owner without buffering it.
+    The owner spools it to disk, stores it and sends the metadata row to the
+    metadata replicas.
+    """
+
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        node = ChordNode.get_instance()
+
+        assert node
+
+        title = unquote(request.headers.get("X-Song-Title", "")).strip()
+        album = unquote(request.headers.get("X-Song-Album", "")).strip() or None
+        artists = [
+            unquote(artist).strip()
+            for artist in request.headers.get("X-Song-Artists", "").split(",")
+            if artist.strip()
+        ]
+        try:
+            content_length = int(request.headers.get("Content-Length") or 0)
+        except ValueError:
+            content_length = 0
+
+        if not title or not artists or content_length <= 0:
+            return Response(
+                {"detail": "X-Song-Title, X-Song-Artists and a body are required."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        song_id = request.headers.get("X-Song-Id") or default_song_id(
+            {"title": title, "album": album}
+        )
+
+        if not is_audio_id(song_id):
+            return Response(
+                {"detail": "X-Song-Id must be alphanumeric."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # Routed like the song's row, see `RowKey`
+        data_id = int(as_key(song_id), 16) % (1 << node.id_bitlen)  # type: ignore
+
+        succ = routing_cache.successor(data_id)
+
+        if (
+            succ.node_id != node.node_id
+            and request.headers.get(TARGETING_HEADER) != node.ring_signature
+        ):
+            headers = dict(request.headers)
+            headers["X-Song-Id"] = song_id
+
+            return forward_request_to_successor(
+                succ,
+                "POST",
+                BoundedStream(request.stream, content_length),
+                headers,
+                request.path,
+                request.GET,
+            )
+
+        upload = spool_upload(request.stream, content_length, AUDIOS_PATH)
+
+        error = None
+        expected_sha256 = request.headers.get("X-Content-SHA256")
+
+        if upload.size < content_length:
+            error = "The upload is incomplete."
+        elif expected_sha256 and expected_sha256.lower() != upload.sha256:
+            error = "The upload does not match X-Content-SHA256."
+
+        if error:
+            os.remove(upload.path)
+            return Response({"detail": error}, status=status.HTTP_400_BAD_REQUEST)
+
+        song_data = {"id": song_id, "title": title, "album": album, "artist": artists}
+
+        if wants_async(request):
+            return accepted_response(
+                ingest_queue.submit(song_data, audio_path=upload.path)
+            )
+
+        return ingest_song(song_data, audio_path=upload.path)
+
+
+class IngestJobView(APIView):
+    def get(self, request, job_id: str):
+        node = ChordNode.get_instance()
+
+        assert node
+
+        try:
+            job_node_id = get_job_node_id(job_id)
+        except ValueError:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        if job_node_id != node.node_id:
+            # Jobs live in memory on the node that accepted the upload.
+            job_node = routing_cache.successor(job_node_id)
+
+            if job_node.node_id != job_node_id:
+                return Response(status=status.HTTP_404_NOT_FOUND)
+
+            return forward_request_to_successor(
+                job_node, "GET", None, dict(request.headers), request.path, request.GET
+            )
+
+        job = ingest_queue.get(job_id)
+
+        if not job:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        return Response(job.to_dict(), status=status.HTTP_200_OK)
+
+
+def wants_async(request) -> bool:
+    # RFC 7240 preference, lets clients opt into background ingest.
+    return "respond-async" in request.headers.get("Prefer", "").lower()
+
+
+class AudioBlobView(APIView):
+    """
+    Stores a raw audio file on the replicas of `audio_id`. Nodes push here the
+    copies placed by `place_audio`, and tools like `import_songs` send files
+    here to have them routed to their owners.
+    """
+
+    def put(self, request):
+        node = ChordNode.get_instance()
+
+        assert node
+
+        is_targeted = request.headers.get(TARGETING_HEADER) == node.ring_signature
+
+        audio_id = request.GET.get("audio_id", "")
+        try:
+            content_length = int(request.headers.get("Content-Length") or 0)
+        except ValueError:
+            content_length = 0
+
+        if not is_audio_id(audio_id) or content_length <= 0:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+
+        upload = spool_upload(request.stream, content_length, AUDIOS_PATH)
+
+        try:
+            if upload.size < content_length:
+                return Response(
+                    {"detail": "The upload is incomplete."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            if is_targeted:
+                write_audio(audio_id, upload.path)
+            elif failed := place_audio(audio_id, upload.path):
+                return Response(
+                    {"detail": f"Audio replicas {failed} did not store it."},
+                    status=status.HTTP_502_BAD_GATEWAY,
+                )
+        finally:
+            if os.path.exists(upload.path):
+                os.remove(upload.path)
+
+        return Response(
+            {"audio_id": audio_id, "size": upload.size},
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class CatalogBatchView(APIView):
+    """
+    Creates many artists, albums and songs at once (see `apply_catalog_batch`)
+    on the replicas of their partitions. Rows only replace stored ones with an
+    older version, which also makes this the target of read repair.
+    """
+
+    def post(self, request):
+        node = ChordNode.get_instance()
+
+        assert node
+
+        serializer = CatalogBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        # Back to plain JSON values, as the parts sent to other nodes
+        batch = serializer.data
+
+        if request.headers.get(TARGETING_HEADER) == node.ring_signature:
+            return Response(
+                apply_catalog_batch(batch, request_catalog_version(request)),
+                status=status.HTTP_201_CREATED,
+            )
+
+        headers = dict(request.headers)
+        version = stamp_catalog_version(request, headers)
+
+        return send_catalog_batch(batch, version, headers, request.path)
+
+
+class HintMetricsView(APIView):
+    def get(self, request):
+        return Response(hint_queue.metrics(), status=status.HTTP_200_OK)
+
+
+class PeerMetricsView(APIView):
+    def get(self, request):
+        return Response(peer_client.metrics(), status=status.HTTP_200_OK)
+
+
+class CatalogVersionMixin:
+    # Every replica stores a write with the version stamped by the node that
+    # received it from the client, so replicas can tell which copy is newer.
+    def create(self, request, *args, **kwargs):
+        # A retry or hinted replay of a create this replica already applied,
+        # after its idempotency key expired.
+        applied = self.queryset.filter(  # type: ignore
+            id=request.data.get("id"), version=request_catalog_version(request)
+        ).first()
+
+        if applied is not None:
+            serializer = self.get_serializer(applied)  # type: ignore
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+        return super().create(request, *args, **kwargs)  # type: ignore
+
+    def perform_create(self, serializer):
+        serializer.save(version=request_catalog_version(self.request))  # type: ignore
+
+    def perform_update(self, serializer):
+        serializer.save(version=request_catalog_version(self.request))  # type: ignore
+
+
+class PartitionedListMixin:
+    """
+    Lists of a partitioned model: each partition sorts and pages its own rows
+    (see `KeysetPagination`) the same way `chord_scatter` merges them.
+    """
+
+    pagination_class = KeysetPagination
+
+    # Fields clients may order by with `?ordering=[-]field`
+    ordering_fields: list[str] = []
+
+    def get_ordering(self) -> list[str]:
+        ordering = self.request.query_params.get("ordering")  # type: ignore
+
+        if ordering and ordering.lstrip("-") in self.ordering_fields:
+            return [ordering]
+
+        # Searches list the best matches first
+        if is_search(self.request.query_params.get("name")):  # type: ignore
+            return [SEARCH_RANK]
+
+        return list(self.queryset.model._meta.ordering)  # type: ignore
+
+
+class ArtistViewSet(
+    CatalogVersionMixin, PartitionedListMixin, viewsets.ModelViewSet
+):
     queryset = Artist.objects.all()
     serializer_class = ArtistSerializer
     lookup_field = "id"
+    ordering_fields = ["name"]
 
     permission_classes = [AllowAny]
 
-    @chord_distribute(100, "metadata")
+    @chord_distribute(
+        METADATA_REPLICATION_FACTOR,
+        RowKey(),
+        write_quorum=METADATA_WRITE_QUORUM,
+        write_behind=True,
+    )
     def create(self, request, *args, **kwargs):
         return super().create(request, *args, **kwargs)
 
-    @chord_distribute(1, "metadata")
+    @chord_distribute(1, RowKey(), read_quorum=METADATA_READ_QUORUM)
     def retrieve(self, request, *args, **kwargs):
         return super().retrieve(request, *args, **kwargs)
 
-    @chord_distribute(1, "metadata")
+    @chord_distribute(METADATA_REPLICATION_FACTOR, RowKey())
     def update(self, request, *args, **kwargs):
         return super().update(request, *args, **kwargs)
 
-    @chord_distribute(1, "metadata")
+    @chord_distribute(METADATA_REPLICATION_FACTOR, RowKey())
     def partial_update(self, request, *args, **kwargs):
         return super().partial_update(request, *args, **kwargs)
 
-    @chord_distribute(1, "metadata")
+    @chord_distribute(METADATA_REPLICATION_FACTOR, RowKey())
     def destroy(self, request, *args, **kwargs):
         return super().destroy(request, *args, **kwargs)
 
-    @chord_distribute(1, "metadata")
+    @chord_scatter()
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
     def get_queryset(self):
         queryset = Artist.objects.all()
 
+        ids = self.request.query_params.getlist("id")  # type: ignore
+        if ids:
+            queryset = queryset.filter(id__in=ids)
+
         name = self.request.query_params.get("name", None)  # type: ignore
         if name is not None:
-            queryset = queryset.filter(name__icontains=name)
+            queryset = search(queryset, name)
         return queryset
 
 
-class AlbumViewSet(viewsets.ModelViewSet):
+class AlbumViewSet(
+    CatalogVersionMixin, PartitionedListMixin, viewsets.ModelViewSet
+):
     queryset = Album.objects.all()
     serializer_class = AlbumSerializer
     lookup_field = "id"
+    ordering_fields = ["name", "date"]
 
     permission_classes = [AllowAny]
 
-    @chord_distribute(100, "metadata")
+    @chord_distribute(
+        METADATA_REPLICATION_FACTOR,
+        RowKey(default_album_id),
+        write_quorum=METADATA_WRITE_QUORUM,
+        write_behind=True,
+    )
     def create(self, request, *args, **kwargs):
         return super().create(request, *args, **kwargs)
 
-    @chord_distribute(1, "metadata")
+    @chord_distribute(1, RowKey(), read_quorum=METADATA_READ_QUORUM)
     def retrieve(self, request, *args, **kwargs):
         return super().retrieve(request, *args, **kwargs)
 
-    @chord_distribute(1, "metadata")
+    @chord_distribute(METADATA_REPLICATION_FACTOR, RowKey())
     def update(self, request, *args, **kwargs):
         return super().update(request, *args, **kwargs)
 
-    @chord_distribute(1, "metadata")
+    @chord_distribute(METADATA_REPLICATION_FACTOR, RowKey())
     def partial_update(self, request, *args, **kwargs):
         return super().partial_update(request, *args, **kwargs)
 
-    @chord_distribute(1, "metadata")
+    @chord_distribute(METADATA_REPLICATION_FACTOR, RowKey())
     def destroy(self, request, *args, **kwargs):
         return super().destroy(request, *args, **kwargs)
 
-    @chord_distribute(1, "metadata")
+    @chord_scatter()
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
     def get_queryset(self):
         queryset = Album.objects.all()
 
+        ids = self.request.query_params.getlist("id")  # type: ignore
+        if ids:
+            queryset = queryset.filter(id__in=ids)
+
         name = self.request.query_params.get("name", None)  # type: ignore
         if name is not None:
-            queryset = queryset.filter(name__icontains=name)
+            queryset = search(queryset, name)
         return queryset
 
 
-class SongViewSet(viewsets.ModelViewSet):
+class SongViewSet(
+    CatalogVersionMixin, PartitionedListMixin, viewsets.ModelViewSet
+):
     queryset = Song.objects.all()
     serializer_class = SongSerializer
     lookup_field = "id"
+    ordering_fields = ["title", "duration_seconds"]
     permission_classes = [AllowAny]
 
-    @chord_distribute(100, "metadata")
     def create(self, request, *args, **kwargs):
+        node = ChordNode.get_instance()
+
+        assert node
+
+        # Load the raw body before DRF parses it, Django refuses to give it
+        # afterwards and `create_metadata` forwards it as is.
+        request.body
+
+        if (
+            request.headers.get(TARGETING_HEADER) == node.ring_signature
+            or "file_base64" not in request.data
+        ):
+            return self.create_metadata(request, *args, **kwargs)
+
+        # The audio only goes to its blob replicas, the catalog replicas get the
+        # row without it.
+        song_data = request.data.copy()
+        audio_base64 = song_data.pop("file_base64")
+
+        # Same id the streaming upload and `create_metadata` derive.
+        if "id" not in song_data:
+            song_data["id"] = default_song_id(song_data)
+
+        # The id names the audio file, see `SongUploadView`
+        if not is_audio_id(str(song_data["id"])):
+            return Response(
+                {"id": ["Songs with audio need an alphanumeric id."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if wants_async(request):
+            # Bad input gets its 400 now rather than a failed job
+            decode_audio(audio_base64)
+
+            return accepted_response(
+                ingest_queue.submit(song_data, audio_base64=audio_base64)
+            )
+
+        return ingest_song(song_data, audio_base64=audio_base64)
+
+    @chord_distribute(
+        METADATA_REPLICATION_FACTOR,
+        RowKey(default_song_id),
+        write_quorum=METADATA_WRITE_QUORUM,
+        write_behind=True,
+    )
+    def create_metadata(self, request, *args, **kwargs):
         return super().create(request, *args, **kwargs)
 
-    @chord_distribute(1, "metadata")
+    @chord_distribute(
+        1, RowKey(), read_quorum=METADATA_READ_QUORUM, resolve=resolve_song_names
+    )
     def retrieve(self, request, *args, **kwargs):
         return super().retrieve(request, *args, **kwargs)
 
-    @chord_distribute(1, "metadata")
+    @chord_distribute(METADATA_REPLICATION_FACTOR, RowKey())
     def update(self, request, *args, **kwargs):
         return super().update(request, *args, **kwargs)
 
-    @chord_distribute(1, "metadata")
+    @chord_distribute(METADATA_REPLICATION_FACTOR, RowKey())
     def partial_update(self, request, *args, **kwargs):
         return super().partial_update(request, *args, **kwargs)
 
-    @chord_distribute(1, "metadata")
+    @chord_distribute(METADATA_REPLICATION_FACTOR, RowKey())
     def destroy(self, request, *args, **kwargs):
         return super().destroy(request, *args, **kwargs)
 
-    @chord_distribute(1, "metadata")
+    @chord_scatter(resolve=resolve_song_names, coalesce=RequestKey())
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
+    def get_serializer_class(self):
+        # Reads come from the songs' listings, a single query per page
+        if self.action in ("list", "retrieve"):
+            return SongListingSerializer
+        return SongSerializer
+
     def get_queryset(self):
-        queryset = Song.objects.all()
+        queryset = Song.objects.select_related("listing")
 
         name = self.request.query_params.get("name", None)  # type: ignore
         if name is not None:
-            queryset = queryset.filter(title__icontains=name)
+            queryset = search(queryset, name)
 
         artist_ids = self.request.query_params.getlist("artist[]", None)  # type: ignore
         if artist_ids:
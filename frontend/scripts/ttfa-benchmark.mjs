@@ -0,0 +1,71 @@
+// Mide el tiempo hasta el primer sonido con descarga completa (modo clásico)
+// y con reproducción progresiva, sobre un enlace lento simulado.
+//
+// Uso: node scripts/ttfa-benchmark.mjs
+
+import ChunkFetcher from '../src/services/ChunkFetcher.js';
+
+// Canción de 4 minutos a 320kbps, con el tamaño de chunk y lote que sugiere el servidor
+const FILE_SIZE = 320000 / 8 * 240;
+const CHUNK_SIZE = 256 * 1024;
+const CHUNKS_PER_REQUEST = 9;
+const TOTAL_CHUNKS = Math.ceil(FILE_SIZE / CHUNK_SIZE);
+const BASE64_OVERHEAD = 4 / 3;
+
+// Los tiempos simulados se ejecutan 20 veces más rápido
+const TIME_SCALE = 0.05;
+
+const LINKS = [
+    { name: '3G (1.5 Mbps, 300 ms)', bitsPerSecond: 1.5e6, rttMs: 300 },
+    { name: 'DSL (4 Mbps, 80 ms)', bitsPerSecond: 4e6, rttMs: 80 },
+    { name: 'Wi-Fi (20 Mbps, 20 ms)', bitsPerSecond: 20e6, rttMs: 20 },
+];
+
+const sleep = ms => new Promise(resolve => setTimeout(resolve, ms * TIME_SCALE));
+
+// Enlace compartido: las respuestas se serializan sobre el mismo ancho de banda
+function makeLink({ bitsPerSecond, rttMs }) {
+    let linkFreeAt = 0;
+
+    return async (index, count) => {
+        const bytes = Math.min(count * CHUNK_SIZE, FILE_SIZE - index * CHUNK_SIZE) * BASE64_OVERHEAD;
+
+        await sleep(rttMs / 2);
+
+        const now = performance.now() / TIME_SCALE;
+        const start = Math.max(now, linkFreeAt);
+        linkFreeAt = start + bytes * 8 / bitsPerSecond * 1000;
+
+        await sleep(linkFreeAt - now + rttMs / 2);
+
+        return { chunk_index: index, chunk_count: count };
+    };
+}
+
+async function timeToFirstAudio(link, options, waitForAll) {
+    const fetcher = new ChunkFetcher(makeLink(link), {
+        totalChunks: TOTAL_CHUNKS,
+        chunksPerRequest: CHUNKS_PER_REQUEST,
+        ...options,
+    });
+
+    const begin = performance.now();
+    let firstBatchAt = null;
+
+    await fetcher.run(() => {
+        firstBatchAt = firstBatchAt ?? performance.now();
+    });
+
+    const end = waitForAll ? performance.now() : firstBatchAt;
+    return (end - begin) / TIME_SCALE / 1000;
+}
+
+for (const link of LINKS) {
+    const full = await timeToFirstAudio(link, { maxInFlight: 1 }, true);
+    const progressive = await timeToFirstAudio(link, { firstRequestChunks: 1, maxInFlight: 3 }, false);
+
+    console.log(
+        `${link.name.padEnd(24)} completa: ${full.toFixed(2).padStart(6)} s` +
+        `   progresiva: ${progressive.toFixed(2).padStart(5)} s`
+    );
+}
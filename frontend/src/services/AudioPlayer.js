@@ -1,37 +1,212 @@
 import { Howl } from "howler";
+import ChunkFetcher from "./ChunkFetcher";
+
+const MSE_MIME_TYPE = 'audio/mpeg';
 
 export default class AudioPlayer {
     constructor(host) {
         this.host = host;
         this.audioId = null;
         this.CHUNKS_TO_LOAD = 10;
+        // Modo progresivo: reproduce en cuanto llega el primer lote
+        this.progressive = typeof MediaSource !== 'undefined' && MediaSource.isTypeSupported(MSE_MIME_TYPE);
+        this.FIRST_REQUEST_CHUNKS = 1;
+        this.MAX_IN_FLIGHT = 3;
+        this.fetcher = null;
         this.onPlaybackEnd = () => { };
     }
 
     async start(audioId, volume = null) {
         if (audioId != this.audioId) {
             this.audioId = audioId;
+
+            if (this.fetcher) {
+                this.fetcher.cancel();
+                this.fetcher = null;
+            }
     
+            // Solo metadatos: el servidor sugiere el tamaño de los chunks y lotes
             const initData = await this.getFromApi(this.host, {
                 chunk_index: 0,
-                chunk_count: this.CHUNKS_TO_LOAD,
+                chunk_count: 0,
                 audio_id: this.audioId,
                 include_metadata: true
             });
     
             this.initAudio(initData.metadata);
-    
-            for (let index = 0; index <= this.totalChunks; index += this.CHUNKS_TO_LOAD) {
-                await this.loadChunks(index, Math.min(this.CHUNKS_TO_LOAD, this.totalChunks - index));
+
+            if (this.progressive) {
+                await this.playProgressive();
+            }
+            else {
+                for (let index = 0; index < this.totalChunks; index += this.chunksToLoad) {
+                    await this.loadChunks(index, Math.min(this.chunksToLoad, this.totalChunks - index));
+                }
+                this.playAudioBuffer();
             }
         }
+        else if (this.progressive) {
+            // El elemento de audio conserva lo ya descargado
+            this.sound.seek(0);
+            this.sound.play();
+        }
+        else {
+            this.playAudioBuffer();
+        }
 
         this.isPlaying = true;
-        this.playAudioBuffer();
 
         this.setVolume(volume ?? 50);
     }
 
+    // Reproduce mientras descarga: los lotes se añaden a un MediaSource en orden
+    // y el sonido empieza en cuanto el navegador tiene datos suficientes.
+    async playProgressive() {
+        const mediaSource = new MediaSource();
+        const sourceOpen = new Promise(resolve => mediaSource.addEventListener('sourceopen', resolve, { once: true }));
+
+        this.createSound(URL.createObjectURL(mediaSource));
+        await sourceOpen;
+
+        mediaSource.duration = this.duration;
+        this.mediaSource = mediaSource;
+        this.sourceBuffer = mediaSource.addSourceBuffer(MSE_MIME_TYPE);
+
+        const playbackStarted = new Promise(resolve => {
+            this.sound.once('play', resolve);
+            this.sound.once('loaderror', resolve);
+            this.sound.once('playerror', resolve);
+        });
+
+        this.streamChunks(0, this.FIRST_REQUEST_CHUNKS);
+
+        this.sound.play();
+        await playbackStarted;
+    }
+
+    // Descarga en segundo plano desde startChunk hasta el final de la canción
+    streamChunks(startChunk, firstRequestChunks = null) {
+        this.runFetcher(this.createFetcher(startChunk, firstRequestChunks));
+    }
+
+    // El fetcher pasa a ser el actual, pero no añade nada hasta runFetcher
+    createFetcher(startChunk, firstRequestChunks = null) {
+        if (this.fetcher) {
+            this.fetcher.cancel();
+        }
+
+        this.fetcher = new ChunkFetcher(
+            (index, count) => this.fetchChunks(index, count),
+            {
+                totalChunks: this.totalChunks,
+                chunksPerRequest: this.chunksToLoad,
+                firstRequestChunks,
+                maxInFlight: this.MAX_IN_FLIGHT,
+                startChunk
+            }
+        );
+
+        return this.fetcher;
+    }
+
+    runFetcher(fetcher) {
+        const mediaSource = this.mediaSource;
+
+        fetcher.run(data => this.appendChunks(this.sourceBuffer, data.chunks, fetcher))
+            .then(completed => {
+                if (completed && mediaSource.readyState === 'open') {
+                    mediaSource.endOfStream();
+                }
+            })
+            .catch(error => console.error('Error al descargar el audio:', error));
+    }
+
+    // Salta a una posición aún no descargada: el servidor busca el frame más
+    // cercano y solo se descargan los bytes desde ese punto.
+    async seekProgressive(positionInSeconds) {
+        const fetcher = this.fetcher;
+        if (fetcher) {
+            fetcher.cancel();
+        }
+
+        const data = await this.getFromApi(this.host, {
+            chunk_index: 0,
+            chunk_count: this.FIRST_REQUEST_CHUNKS,
+            chunk_size: this.chunkSize,
+            audio_id: this.audioId,
+            start_seconds: positionInSeconds
+        });
+
+        // Otra canción u otro salto empezaron mientras tanto
+        if (this.fetcher !== fetcher) return;
+
+        // El SourceBuffer admite un solo append a la vez: primero los chunks
+        // del salto y después el resto de la canción.
+        const seekFetcher = this.createFetcher(data.chunk_index + data.chunk_count);
+
+        if (this.mediaSource.readyState === 'open') {
+            this.sourceBuffer.abort();
+        }
+        await this.sourceBufferIdle(this.sourceBuffer);
+        if (seekFetcher.cancelled) return;
+
+        this.sourceBuffer.timestampOffset = data.start_seconds;
+
+        await this.appendChunks(this.sourceBuffer, data.chunks, seekFetcher);
+        if (seekFetcher.cancelled) return;
+
+        this.runFetcher(seekFetcher);
+    }
+
+    async sourceBufferIdle(sourceBuffer) {
+        while (sourceBuffer.updating) {
+            await new Promise(resolve => sourceBuffer.addEventListener('updateend', resolve, { once: true }));
+        }
+    }
+
+    isBuffered(positionInSeconds) {
+        const buffered = this.sourceBuffer.buffered;
+        for (let i = 0; i < buffered.length; i++) {
+            if (buffered.start(i) <= positionInSeconds && positionInSeconds < buffered.end(i)) {
+                return true;
+            }
+        }
+        return false;
+    }
+
+    async fetchChunks(chunkIndex, chunkCount) {
+        return await this.getFromApi(this.host, {
+            chunk_index: chunkIndex,
+            chunk_count: chunkCount,
+            chunk_size: this.chunkSize,
+            audio_id: this.audioId,
+            include_header: false,
+            include_metadata: false
+        });
+    }
+
+    async appendChunks(sourceBuffer, chunks, fetcher = null) {
+        for (const chunk of chunks) {
+            if (fetcher && fetcher.cancelled) return;
+
+            sourceBuffer.appendBuffer(this.base64ToByteArray(chunk));
+            await new Promise(resolve => sourceBuffer.addEventListener('updateend', resolve, { once: true }));
+        }
+    }
+
+    // Avisa al servidor de la próxima canción para que la precargue
+    async prefetch(audioId) {
+        if (!audioId || audioId === this.audioId) return;
+
+        try {
+            await fetch(`${this.host}/prefetch/?audio_id=${encodeURIComponent(audioId)}`, {
+                method: 'POST'
+            });
+        } catch (error) {
+            console.warn('Error en la precarga:', error);
+        }
+    }
+
     // Función para realizar la petición a la API
     async getFromApi(url, params) {
         try {
@@ -64,15 +239,19 @@ export default class AudioPlayer {
     initAudio(metadata) {
         this.isPlaying = false;
 
-        this.totalChunks = metadata.total_chunks;
-        this.chunkSize = metadata.chunk_size;
         this.duration = metadata.duration;
 
         this.fileSize = metadata.file_size ?? 0;
 
-        this.audioByteArray = new Uint8Array(this.fileSize).fill(0);
+        this.chunkSize = metadata.suggested_chunk_size ?? metadata.chunk_size;
+        this.chunksToLoad = metadata.suggested_chunk_count ?? this.CHUNKS_TO_LOAD;
+        this.totalChunks = Math.ceil(this.fileSize / this.chunkSize);
+
+        // En modo progresivo el audio vive en el MediaSource, no en memoria
+        this.audioByteArray = this.progressive ? null : new Uint8Array(this.fileSize).fill(0);
 
         this.source = null;
+        this.sourceBuffer = null;
     }
 
     playAndPause() {
@@ -86,11 +265,15 @@ export default class AudioPlayer {
         this.isPlaying = this.sound.playing();
     }
 
-    moveToPosition(positionInSeconds = null, positionInPercent = null) {
+    async moveToPosition(positionInSeconds = null, positionInPercent = null) {
         if (positionInSeconds === null) {
             positionInSeconds = positionInPercent * this.duration;
         }
 
+        if (this.progressive && this.sourceBuffer && !this.isBuffered(positionInSeconds)) {
+            await this.seekProgressive(positionInSeconds);
+        }
+
         this.sound.seek(positionInSeconds);
     }
 
@@ -125,12 +308,19 @@ export default class AudioPlayer {
         const blob = new Blob([this.audioByteArray], { type: 'audio/mp3' });
         const blobURL = URL.createObjectURL(blob);
 
+        this.createSound(blobURL);
+
+        this.sound.play();
+        this.isPlaying = true;
+    }
+
+    createSound(src) {
         if (this.sound) {
             this.sound.unload()
         }
 
         this.sound = new Howl({
-            src: [blobURL],
+            src: [src],
             format: ['mp3', 'wav', 'aac'],
             html5: true,
             onloaderror: function (id, error) {
@@ -140,19 +330,10 @@ export default class AudioPlayer {
                 this.onPlaybackEnd();
             }
         });
-
-        this.sound.play();
-        this.isPlaying = true;
     }
 
     async loadChunks(chunkIndex, chunkCount = null) {
-        const data = await this.getFromApi(this.host, {
-            chunk_index: chunkIndex,
-            chunk_count: chunkCount ?? this.CHUNKS_TO_LOAD,
-            audio_id: this.audioId,
-            include_header: false,
-            include_metadata: false
-        });
+        const data = await this.fetchChunks(chunkIndex, chunkCount ?? this.chunksToLoad);
 
         this.addChunks(data.chunks, data.chunk_index, data.chunk_count);
     }
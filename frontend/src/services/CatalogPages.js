@@ -0,0 +1,34 @@
+import axios from 'axios';
+
+// Los listados del catálogo llegan por páginas; la siguiente viene en la
+// cabecera Link (rel="next") mientras queden filas.
+export function nextPageUrl(response) {
+    const link = response.headers.link;
+    if (!link) return null;
+
+    const match = link.match(/<([^>]+)>;\s*rel="next"/);
+    return match ? match[1] : null;
+}
+
+// Una sola página: sus filas y la URL de la siguiente (null si no hay más).
+export async function fetchPage(url, params = {}) {
+    const response = await axios.get(url, { params });
+    return { rows: response.data, next: nextPageUrl(response) };
+}
+
+// Recorre todas las páginas en orden y devuelve sus filas. Solo para listas
+// pequeñas, como los artistas y álbumes de los selectores.
+export async function fetchAllPages(url, params = {}) {
+    const rows = [];
+    let response = await axios.get(url, { params });
+
+    for (;;) {
+        rows.push(...response.data);
+
+        const next = nextPageUrl(response);
+        if (!next) return rows;
+
+        // La URL siguiente ya incluye los filtros y el cursor
+        response = await axios.get(next);
+    }
+}
@@ -0,0 +1,66 @@
+// Descarga los chunks de una canción por lotes, con varias peticiones en
+// paralelo pero entregando los lotes en orden.
+export default class ChunkFetcher {
+    constructor(fetchBatch, { totalChunks, chunksPerRequest, firstRequestChunks = null, maxInFlight = 3, startChunk = 0 }) {
+        this.fetchBatch = fetchBatch;
+        this.totalChunks = totalChunks;
+        this.startChunk = startChunk;
+        this.chunksPerRequest = chunksPerRequest;
+        this.firstRequestChunks = firstRequestChunks ?? chunksPerRequest;
+        this.maxInFlight = maxInFlight;
+        this.cancelled = false;
+    }
+
+    // Índice y cantidad de chunks de cada petición
+    batches() {
+        const batches = [];
+        let index = this.startChunk;
+        let count = Math.max(1, this.firstRequestChunks);
+
+        while (index < this.totalChunks) {
+            batches.push({ index, count: Math.min(count, this.totalChunks - index) });
+            index += count;
+            count = Math.max(1, this.chunksPerRequest);
+        }
+
+        return batches;
+    }
+
+    // Llama a onBatch con cada lote en orden. Nunca hay más de maxInFlight
+    // peticiones en curso, así que la memoria pendiente está acotada.
+    async run(onBatch) {
+        const batches = this.batches();
+        const pending = [];
+        let next = 0;
+
+        const request = () => {
+            const { index, count } = batches[next++];
+            const promise = this.fetchBatch(index, count);
+            // Evita avisos de rechazos no atendidos si se cancela antes de esperarla
+            promise.catch(() => { });
+            pending.push(promise);
+        };
+
+        while (next < batches.length && pending.length < this.maxInFlight) {
+            request();
+        }
+
+        while (pending.length > 0) {
+            const data = await pending.shift();
+
+            if (this.cancelled) return false;
+
+            if (next < batches.length) {
+                request();
+            }
+
+            await onBatch(data);
+        }
+
+        return true;
+    }
+
+    cancel() {
+        this.cancelled = true;
+    }
+}
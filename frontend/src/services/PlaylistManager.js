@@ -1,9 +1,12 @@
 import axios from 'axios';
+import { fetchPage } from './CatalogPages';
 
 class PlaylistManager {
     constructor() {
         this.apiUrl = "http://localhost:8000/api/songs/";
         this.songs = [];
+        // Las canciones se cargan por páginas, a medida que se piden
+        this.nextPageUrl = null;
         this.currentIndex = 0;
         this.filters = {
             artist: null,
@@ -15,8 +18,9 @@ class PlaylistManager {
 
     async loadSongs() {
         try {
-            const response = await axios.get(this.apiUrl);
-            this.songs = response.data;
+            const page = await fetchPage(this.apiUrl);
+            this.songs = page.rows;
+            this.nextPageUrl = page.next;
         } catch (error) {
             console.error("Error loading songs:", error);
         }
@@ -26,10 +30,9 @@ class PlaylistManager {
 
     async refresh() {
         try {
-            const response = await axios.get(this.apiUrl, {
-                params: this.filters,
-            });
-            this.songs = response.data;
+            const page = await fetchPage(this.apiUrl, this.filters);
+            this.songs = page.rows;
+            this.nextPageUrl = page.next;
         } catch (error) {
             console.error("Error refreshing songs:", error);
         }
@@ -37,6 +40,30 @@ class PlaylistManager {
         return this.songs;
     }
 
+    hasMoreSongs() {
+        return this.nextPageUrl !== null;
+    }
+
+    // Añade la siguiente página; su URL ya incluye los filtros y el cursor
+    async loadMore() {
+        if (!this.nextPageUrl) return this.songs;
+
+        const url = this.nextPageUrl;
+        try {
+            const page = await fetchPage(url);
+
+            // Un refresh durante la descarga ya cambió la lista
+            if (this.nextPageUrl === url) {
+                this.songs = [...this.songs, ...page.rows];
+                this.nextPageUrl = page.next;
+            }
+        } catch (error) {
+            console.error("Error loading more songs:", error);
+        }
+
+        return this.songs;
+    }
+
     async filter({ artist = null, album = null, name = null }) {
         if (artist !== null) this.filters.artist = artist;
         if (album !== null) this.filters.album = album;
@@ -56,6 +83,11 @@ class PlaylistManager {
         return this.songs[this.currentIndex];
     }
 
+    peekNext() {
+        if (this.songs.length === 0) return null;
+        return this.songs[(this.currentIndex + 1) % this.songs.length];
+    }
+
     next() {
         if (this.songs.length === 0) return;
         this.currentIndex = (this.currentIndex + 1) % this.songs.length;
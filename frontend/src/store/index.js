@@ -17,6 +17,7 @@ export default createStore({
 		progressBarProgress: 0,
 		volume: 50,
 		songs: [],
+		hasMoreSongs: false,
 		repeat: false,
 		filters: {
 			artist: null,
@@ -47,6 +48,7 @@ export default createStore({
 		},
 		SET_SONGS(state, songs) {
 			state.songs = songs
+			state.hasMoreSongs = state.playlistManager.hasMoreSongs()
 		},
 		SET_REPEAT(state, repeat) {
 			state.repeat = repeat
@@ -66,6 +68,7 @@ export default createStore({
 			commit('SET_PLAYING', true)
 			commit('SET_CURRENT_SONG', state.playlistManager.getCurrentSong())
 			setTimeUpdater(state, commit)
+			prefetchNextSong(state)
 
 			state.audioPlayer.onPlaybackEnd = async () => {
 				if (!state.repeat) {
@@ -78,6 +81,7 @@ export default createStore({
 				commit('SET_PLAYING', true)
 				commit('SET_CURRENT_SONG', state.playlistManager.getCurrentSong())
 				setTimeUpdater(state, commit)
+				prefetchNextSong(state)
 			}
 		},
 		//#region controls
@@ -112,6 +116,7 @@ export default createStore({
 				commit('SET_PLAYING', true)
 				commit('SET_CURRENT_SONG', state.playlistManager.getCurrentSong())
 				setTimeUpdater(state, commit)
+				prefetchNextSong(state)
 			}
 		}
 		,
@@ -124,6 +129,7 @@ export default createStore({
 				commit('SET_PLAYING', true)
 				commit('SET_CURRENT_SONG', state.playlistManager.getCurrentSong())
 				setTimeUpdater(state, commit)
+				prefetchNextSong(state)
 			}
 		},
 		shuffleList({ state, commit }) {
@@ -142,6 +148,10 @@ export default createStore({
 			const songs = await state.playlistManager.loadSongs()
 			commit('SET_SONGS', songs)
 		},
+		async fetchMoreSongs({ state, commit }) {
+			const songs = await state.playlistManager.loadMore()
+			commit('SET_SONGS', songs)
+		},
 		async refreshSongs({ state, commit }) {
 			const songs = await state.playlistManager.refresh()
 			commit('SET_SONGS', songs)
@@ -155,6 +165,15 @@ export default createStore({
 	}
 })
 
+function prefetchNextSong(state) {
+	if (state.repeat) return
+
+	const nextSong = state.playlistManager.peekNext()
+	if (nextSong) {
+		state.audioPlayer.prefetch(nextSong.id)
+	}
+}
+
 function setTimeUpdater(state, commit) {
 	const interval = setInterval(() => {
 		if (state.audioPlayer.sound.playing()) {